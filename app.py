@@ -1,16 +1,44 @@
-import pathlib
-import pandas as pd
-import dash_daq as daq
-import math
+import time
 
-import dash
-from dash import dcc, html, dash_table, Input, Output, State
-import dash_bootstrap_components as dbc
-from dash_bootstrap_templates import ThemeChangerAIO
-import dash_cytoscape as cyto
+# startup timings are measured from here, before the heavy imports
+STARTED = time.perf_counter()
 
-from utilities.ont import get_cytoscape_elements
-from utilities.ont import get_sparql_query_results
+import functools  # noqa: E402
+import os  # noqa: E402
+import pathlib  # noqa: E402
+import flask  # noqa: E402
+import pandas as pd  # noqa: E402
+import dash_daq as daq  # noqa: E402
+
+import dash  # noqa: E402
+from dash import dcc, html, dash_table, Input, Output, State  # noqa: E402
+
+try:
+    # partial property updates, dash >= 2.9
+    from dash import Patch
+except ImportError:
+    Patch = None
+import dash_bootstrap_components as dbc  # noqa: E402
+from dash_bootstrap_templates import ThemeChangerAIO  # noqa: E402
+import dash_cytoscape as cyto  # noqa: E402
+
+from utilities.ont import get_class_hierarchy, get_cytoscape_elements, search_ontology  # noqa: E402
+from utilities.ont import get_graph_view  # noqa: E402
+from utilities.ont import (cache_template_results, get_ready_template_results,  # noqa: E402
+                           run_profile_job, run_query_job)
+from utilities.ont import (SNAPSHOT_DIR, get_ontology_statistics, get_view_layout,  # noqa: E402
+                           graph_registry, warm_up_ontology)
+from utilities.charts import build_figure, relayout_range  # noqa: E402
+from utilities.layout import LAYOUTS  # noqa: E402
+from utilities.metrics import (current_trace_id, finish_trace, get_trace, mark_response_encoded, metrics,  # noqa: E402
+                               record_spans, share_traces, start_trace, traced_callback)
+from utilities.payload import compact_figure, compress_response  # noqa: E402
+from utilities.jobs import DONE, QUEUED, RUNNING, JobRunner  # noqa: E402
+from utilities.sessions import ResultSession, ResultSessionStore, page_dataframe  # noqa: E402
+from utilities.templates import get_query_template  # noqa: E402
+from utilities.view import local_name  # noqa: E402
+from utilities.warmup import WarmUp  # noqa: E402
+from utilities.watcher import OntologyWatcher  # noqa: E402
 
 # --------------------------------------------------
 # ontology configuration details
@@ -30,6 +58,35 @@ df_query_results = ontologies_df.copy()
 # ontology specific cytoscape data elements
 ontology_view_elements = []
 
+# cytoscape styles of the summarized view: classes, groups of resources, resources and literals
+ontology_view_stylesheet = [
+    {'selector': 'node', 'style': {'label': 'data(label)', 'font-size': '8px'}},
+    {'selector': '.class', 'style': {'background-color': '#1f77b4', 'shape': 'round-rectangle'}},
+    {'selector': '.group', 'style': {'background-color': '#ff7f0e', 'shape': 'hexagon'}},
+    {'selector': '.resource', 'style': {'background-color': '#2ca02c'}},
+    {'selector': '.literal', 'style': {'background-color': '#bbbbbb', 'shape': 'tag'}},
+    {'selector': 'edge', 'style': {'curve-style': 'bezier', 'target-arrow-shape': 'triangle', 'width': 1}},
+]
+
+# query jobs, result sessions and the traces shown in the timing panel are shared by the gunicorn
+# workers through files, as the requests of one browser may reach any worker
+SHARED_DIR = os.path.join(SNAPSHOT_DIR, 'shared')
+share_traces(os.path.join(SHARED_DIR, 'traces'))
+
+# query results kept server-side; the query-results-table only receives the visible page
+result_sessions = ResultSessionStore(directory=os.path.join(SHARED_DIR, 'sessions'))
+ontologies_session = ResultSession(ontologies_df)
+
+# ontologies are loaded and indexed in the background once the server runs, see /ready
+warm_up = WarmUp(STARTED)
+
+# edits to the ontology files are applied to the loaded graphs as triple deltas
+ontology_watcher = OntologyWatcher(graph_registry, ontologies_df['Endpoint'])
+
+# sparql queries run in worker processes, killed when cancelled or after the timeout
+query_jobs = JobRunner(max_workers=2, timeout=60, preload=['utilities.ont'],
+                       directory=os.path.join(SHARED_DIR, 'jobs'))
+
 # ticker names
 tickers_as_list = ['BTC', 'ETH', 'BNB', 'XRP']
 
@@ -154,6 +211,16 @@ sidebar_container = html.Div(
                                     disabled=True,
                                     style={'width': '100%'},
                                 ),
+                                dbc.Button(
+                                    id="cancel-button",
+                                    children="Cancel Query",
+                                    n_clicks=0,
+                                    disabled=True,
+                                    color="secondary",
+                                    style={'width': '100%', 'margin-top': '4px'},
+                                ),
+                                dcc.Store(id='query-job'),
+                                dcc.Interval(id='query-job-interval', interval=500, disabled=True),
                             ],
                         ),
                     ],
@@ -162,7 +229,14 @@ sidebar_container = html.Div(
                 ),
                 dbc.AccordionItem(
                     [
-                        ThemeChangerAIO(aio_id="theme"),
+                        html.Div(id="ontology-statistics"),
+                    ],
+                    title="Statistics",
+                    className=accordian_item_format
+                ),
+                dbc.AccordionItem(
+                    [
+                        html.Div(id="theme-changer"),
                     ],
                     title="Theme",
                     className=accordian_item_format
@@ -174,6 +248,20 @@ sidebar_container = html.Div(
     ],
 )
 
+
+@functools.lru_cache(maxsize=1)
+def build_theme_changer():
+    # registers every plotly figure template, which takes seconds, so it is built once and off the import path
+    return ThemeChangerAIO(aio_id="theme")
+
+
+@app.callback(
+    Output("theme-changer", "children"),
+    Input("theme-changer", "id"))
+def theme_changer_shown(_):
+    return build_theme_changer()
+
+
 ####################################################################################################################
 # body container
 # view tab
@@ -193,9 +281,28 @@ body_container_view = \
                                 clearable=False,
                                 options=[
                                     {'label': name.capitalize(), 'value': name}
-                                    for name in ['random', 'grid', 'circle', 'concentric', 'breadthfirst']
+                                    for name in LAYOUTS
+                                ],
+                            ),
+                            html.Br(),
+                            html.P("Detail", className=accordian_item_format),
+                            dcc.RadioItems(
+                                id='ontology-view-detail',
+                                value='summary',
+                                options=[
+                                    {'label': 'Summary', 'value': 'summary'},
+                                    {'label': 'Full', 'value': 'full'},
                                 ],
                             ),
+                            html.Br(),
+                            html.P("Search", className=accordian_item_format),
+                            dcc.Dropdown(
+                                id='ontology-view-search',
+                                placeholder='Label or IRI',
+                                options=[],
+                            ),
+                            dcc.Store(id='ontology-view-endpoint'),
+                            dcc.Store(id='ontology-view-expanded', data=[]),
                         ],
                     ),
                 ],
@@ -207,8 +314,18 @@ body_container_view = \
                     cyto.Cytoscape(
                         id='ontology-view',
                         elements=ontology_view_elements,
+                        stylesheet=ontology_view_stylesheet,
                         style={'width': '100%', 'height': '1000px'},
-                    )
+                    ),
+                    dbc.Accordion(
+                        [
+                            dbc.AccordionItem(
+                                html.Div(id='ontology-hierarchy'),
+                                title="Class hierarchy",
+                            ),
+                        ],
+                        start_collapsed=True,
+                    ),
                 ],
                 width=10,
             ),
@@ -218,9 +335,152 @@ body_container_view = \
 
 @app.callback(
     Output('ontology-view', 'layout'),
-    Input('ontology-view-update-layout', 'value'))
-def update_layout(layout):
-    return {'name': layout}
+    [Input('ontology-view-update-layout', 'value'),
+     Input('ontology-view-endpoint', 'data'),
+     Input('ontology-view-detail', 'value'),
+     Input('ontology-view-expanded', 'data')])
+@traced_callback('view_layout')
+def update_layout(layout, ontology_endpoint, detail, expanded):
+    # node positions are computed on the server and cached, the browser only places them
+    if ontology_endpoint is None:
+        return {'name': 'grid'}
+    return get_view_layout(ontology_endpoint, layout, detail, expanded)
+
+
+@app.callback(
+    Output('ontology-view', 'elements'),
+    Output('ontology-view-expanded', 'data'),
+    [Input('ontology-view-endpoint', 'data'),
+     Input('ontology-view-detail', 'value'),
+     Input('ontology-view', 'tapNodeData'),
+     Input('ontology-view-search', 'value')],
+    [State('ontology-view-expanded', 'data'),
+     State('ontology-view', 'elements')])
+@traced_callback('view_elements')
+def update_ontology_view(ontology_endpoint, detail, tap_node, search_node, expanded, elements):
+    if ontology_endpoint is None:
+        return ontology_view_elements, []
+    triggered = dash.callback_context.triggered_id
+    if detail == 'full':
+        if triggered == 'ontology-view-search':
+            return dash.no_update, dash.no_update
+        return get_cytoscape_elements(ontology_endpoint), []
+
+    view = get_graph_view(ontology_endpoint)
+    if triggered == 'ontology-view' and tap_node:
+        node_id = tap_node['id']
+    elif triggered == 'ontology-view-search' and search_node:
+        # a node found by search is highlighted, and expanded when it is not shown yet
+        if any(e['data']['id'] == search_node for e in elements or ()):
+            return dash.no_update, dash.no_update
+        node_id = search_node
+    else:
+        return view.summary(), []
+
+    # expanding a node only sends the elements that are not shown yet
+    if node_id in expanded:
+        return dash.no_update, dash.no_update
+    delta = view.expand(node_id, expanded)
+    if Patch is not None:
+        patch = Patch()
+        patch.extend(delta)
+        return patch, expanded + [node_id]
+    return elements + delta, expanded + [node_id]
+
+
+@app.callback(
+    Output('ontology-view-search', 'options'),
+    [Input('ontology-view-search', 'search_value')],
+    [State('ontology-view-endpoint', 'data'),
+     State('ontology-view-search', 'value'),
+     State('ontology-view-search', 'options')])
+@traced_callback('view_search')
+def search_ontology_view(search_value, ontology_endpoint, value, options):
+    if not search_value or ontology_endpoint is None:
+        # keep the selected option, the dropdown shows its label
+        return [o for o in options or () if o['value'] == value]
+    # matches are not always substrings of the text, search is set so the dropdown does not hide them
+    return [{'label': name, 'value': str(iri), 'title': str(iri), 'search': search_value}
+            for iri, name in search_ontology(ontology_endpoint, search_value)]
+
+
+@app.callback(
+    Output('ontology-view', 'stylesheet'),
+    [Input('ontology-view-search', 'value')])
+def highlight_search_node(node_id):
+    if not node_id:
+        return ontology_view_stylesheet
+    selector = node_id.replace('\\', '\\\\').replace('"', '\\"')
+    return ontology_view_stylesheet + [
+        {'selector': f'node[id = "{selector}"]',
+         'style': {'border-width': 3, 'border-color': '#d62728', 'font-size': '12px', 'font-weight': 'bold'}},
+    ]
+
+
+# classes rendered in the hierarchy tree, beyond which the tree is cut
+MAX_TREE_NODES = 2000
+
+# nesting of the hierarchy tree, deeper subclasses are not expanded
+MAX_TREE_DEPTH = 100
+
+
+@app.callback(
+    Output('ontology-hierarchy', 'children'),
+    [Input('ontology-view-endpoint', 'data')])
+@traced_callback('view_hierarchy')
+def update_ontology_hierarchy(ontology_endpoint):
+    if ontology_endpoint is None:
+        return html.P("Select an ontology to see its class hierarchy.", className=accordian_item_format)
+    hierarchy = get_class_hierarchy(ontology_endpoint)
+    rendered = [0]
+
+    def by_name(nodes):
+        return sorted(nodes, key=lambda c: (local_name(c) or str(c)).lower())
+
+    def visit(c, path):
+        rendered[0] += 1
+        label = f"{local_name(c) or c} ({hierarchy.instance_count(c):,} instances)"
+        # a class is shown once per path, the hierarchy may contain cycles
+        children = [child for child in by_name(hierarchy.named_children(c)) if child not in path]
+        if not children:
+            return html.Div(label, style={'margin-left': '1.2em'}), None
+        if len(path) >= MAX_TREE_DEPTH:
+            return html.Div(f"{label} …", style={'margin-left': '1.2em'}), None
+        return None, (label, path, iter(children), [])
+
+    def node(c):
+        # depth first with an explicit stack, subClassOf chains can be deeper than the recursion limit
+        leaf, frame = visit(c, {c})
+        if leaf is not None:
+            return leaf
+        stack = [frame]
+        while True:
+            label, path, children, items = stack[-1]
+            child = next(children, None)
+            if child is not None and rendered[0] >= MAX_TREE_NODES:
+                items.append(html.Div('…', style={'margin-left': '1.2em'}))
+                child = None
+            if child is not None:
+                leaf, frame = visit(child, path | {child})
+                if leaf is not None:
+                    items.append(leaf)
+                else:
+                    stack.append(frame)
+                continue
+            stack.pop()
+            details = html.Details([html.Summary(label), html.Div(items, style={'margin-left': '1.2em'})])
+            if not stack:
+                return details
+            stack[-1][3].append(details)
+
+    roots = []
+    for c in by_name(hierarchy.roots()):
+        if rendered[0] >= MAX_TREE_NODES:
+            roots.append(html.P(f"Showing the first {MAX_TREE_NODES:,} of {len(hierarchy):,} classes.",
+                                className=accordian_item_format))
+            break
+        roots.append(node(c))
+    return roots or html.P("The ontology has no rdfs:subClassOf statements.", className=accordian_item_format)
 
 
 ####################################################################################################################
@@ -424,8 +684,26 @@ body_container_query = \
                                         width=6,
                                     ),
                                 ],
-                            )
-
+                            ),
+                            dbc.Row(
+                                [
+                                    dbc.Col(
+                                        [
+                                            dbc.Button(
+                                                id="profile-button",
+                                                children="Profile SPARQL Query",
+                                                n_clicks=0,
+                                                color="secondary",
+                                                style={'margin-top': '4px'},
+                                            ),
+                                            dcc.Store(id='profile-job'),
+                                            dcc.Interval(id='profile-job-interval', interval=500, disabled=True),
+                                            html.Div(id="query-profile"),
+                                        ],
+                                        width=12,
+                                    ),
+                                ],
+                            ),
                         ],
                         title="Query",
                     ),
@@ -441,16 +719,21 @@ body_container_query = \
                                                    ),
                                             dcc.Graph(
                                                 id="query-results-chart"
-                                            )
+                                            ),
+                                            dcc.Store(id='query-results-chart-width'),
                                         ],
                                         width=6,
                                     ),
                                     dbc.Col(
                                         [
+                                            html.P(id="query-job-status",
+                                                   className=accordian_item_format,
+                                                   ),
                                             html.P("Table",
                                                    className=accordian_item_format,
                                                    style={"font-weight": "bold"}
                                                    ),
+                                            dcc.Store(id='query-results-session'),
                                             dash_table.DataTable(
                                                 id='query-results-table',
                                                 data=df_query_results.to_dict('records'),
@@ -458,6 +741,7 @@ body_container_query = \
 
                                                 page_current=0,
                                                 page_size=25,
+                                                page_action="custom",
                                                 fixed_rows={'headers': True},
 
                                                 style_cell={'textAlign': 'left'},
@@ -465,11 +749,24 @@ body_container_query = \
 
                                                 row_deletable=False,
                                                 editable=False,
-                                                filter_action="native",
-                                                sort_action="native",
+                                                filter_action="custom",
+                                                filter_query='',
+                                                sort_action="custom",
+                                                sort_mode="multi",
+                                                sort_by=[],
                                                 style_table={"overflowX": "auto", 'overflowY': 'auto'},
-                                                export_format="csv",
-                                            )
+                                            ),
+                                            # the table only holds the visible page, the whole result is exported
+                                            # from the server
+                                            dbc.Button(
+                                                id="query-results-export-button",
+                                                children="Export CSV",
+                                                n_clicks=0,
+                                                color="secondary",
+                                                size="sm",
+                                                style={'margin-top': '4px'},
+                                            ),
+                                            dcc.Download(id="query-results-download"),
                                         ],
                                         width=6,
                                     ),
@@ -478,6 +775,18 @@ body_container_query = \
                         ],
                         title="Query Results",
                     ),
+                    dbc.AccordionItem(
+                        [
+                            dbc.Switch(
+                                id="query-timings-switch",
+                                label="Show the time spent in each stage of the last query",
+                                value=False,
+                            ),
+                            dcc.Store(id='query-timings-trace'),
+                            html.Div(id="query-timings"),
+                        ],
+                        title="Timings",
+                    ),
 
                 ],
                 start_collapsed=False, always_open=True, flush=True,
@@ -610,11 +919,18 @@ def sparql_query_select_dropdown_selected(query_selected, ontology_selected):
 @app.callback(
     Output("sparql-query-text", "value"),
     Output("sparql-query-text", "disabled"),
-    Output("query-results-table", "data"),
+    Output("query-results-session", "data"),
     Output("query-results-table", "columns"),
-    Output("ontology-view", "elements"),
-    Output("query-results-chart", "figure"),
-    [Input("submit-button", "n_clicks")],
+    Output("query-results-table", "page_current"),
+    Output("ontology-view-endpoint", "data"),
+    Output("query-job", "data"),
+    Output("query-job-interval", "disabled"),
+    Output("query-job-status", "children"),
+    Output("cancel-button", "disabled"),
+    Output("query-timings-trace", "data"),
+    [Input("submit-button", "n_clicks"),
+     Input("cancel-button", "n_clicks"),
+     Input("query-job-interval", "n_intervals")],
     [State("ontology-endpoint", "children"),
      State("sparql-query-template-text", "value"),
      State("dropdown1-select", "value"),
@@ -623,75 +939,370 @@ def sparql_query_select_dropdown_selected(query_selected, ontology_selected):
      State("dropdown4-select", "value"),
      State("date-range-picker-select", "start_date"),
      State("date-range-picker-select", "end_date"),
-     State("precision-select", "value")
+     State("precision-select", "value"),
+     State("query-job", "data")
      ]
 )
-def submit_button_selected(n_clicks, ontology_endpoint, sparql_query_template,
+@traced_callback('submit')
+def submit_button_selected(n_clicks, cancel_clicks, n_intervals, ontology_endpoint, sparql_query_template,
                            dropdown_1, dropdown_2, dropdown_3, dropdown_4,
-                           start_date, end_date, precision):
-    import plotly.express as px
-    figure = px.line(x=['a', 'b', 'c', 'd'], y=[1, 2, 2, 1], title='placeholder figure')
+                           start_date, end_date, precision, query_job):
+    no_update = dash.no_update
+    triggered = dash.callback_context.triggered_id
+
+    # a running query is polled until it finishes, or killed on cancel
+    if triggered in ("query-job-interval", "cancel-button"):
+        if query_job is None:
+            return (no_update,) * 6 + (None, True, no_update, True, no_update)
+        if triggered == "cancel-button":
+            job = query_jobs.cancel(query_job['id'])
+        else:
+            job = query_jobs.poll(query_job['id'])
+        if job is None:
+            return (no_update,) * 6 + (None, True, 'Query is no longer available', True, no_update)
+        if job.status in (QUEUED, RUNNING):
+            status = f"Query {job.status}: {job.progress or 'starting'} ({job.elapsed:.1f} s)"
+            return (no_update,) * 6 + (no_update, False, status, False, no_update)
+        if job.status != DONE:
+            status = f"Query {job.status} after {job.elapsed:.1f} s" + (f": {job.error}" if job.error else '')
+            return (no_update,) * 6 + (None, True, status, True, no_update)
+
+        fingerprint, results_columns, results_df, spans = job.result
+        record_spans(spans + [{'stage': 'query_job', 'seconds': job.elapsed, 'counts': {'rows': len(results_df)}}])
+        template = get_query_template(query_job['template'])
+        cache_template_results(query_job['endpoint'], fingerprint, template, query_job['values'],
+                               (None, results_columns, results_df))
+        session_id = result_sessions.create(results_df)
+        warm_up.mark_query()
+        status = f"{len(results_df)} rows in {job.elapsed:.1f} s"
+        return (no_update, no_update, session_id, results_columns, 0, query_job['endpoint'],
+                None, True, status, True, current_trace_id())
 
     if n_clicks == 0 or ontology_endpoint is None or sparql_query_template is None:
-        data = ontologies_df.to_dict('records')
         columns = [{'id': c, 'name': c} for c in ontologies_df.columns]
-        return '', True, data, columns, ontology_view_elements, figure
+        return '', True, None, columns, 0, None, None, True, '', True, None
 
-    sparql_query_text = sparql_query_template
+    # bind the parameter controls to the prepared query of the template
+    template = get_query_template(sparql_query_template)
+    values = {
+        'dropdown1': dropdown_1,
+        'dropdown2': dropdown_2,
+        'dropdown3': dropdown_3,
+        'dropdown4': dropdown_4,
+        'start_date': start_date,
+        'end_date': end_date,
+        'precision': precision,
+    }
+    try:
+        sparql_query_text = template.render(values)
+    except ValueError as e:
+        return (no_update,) * 6 + (no_update, no_update, str(e), no_update, no_update)
+
+    # a new submission replaces the query still running
+    if query_job is not None:
+        query_jobs.cancel(query_job['id'])
+
+    # cached and time-series results are returned at once, other queries run in a job process
+    results = get_ready_template_results(ontology_endpoint, template, values)
+    if results is not None:
+        _, results_columns, results_df = results
+        session_id = result_sessions.create(results_df)
+        warm_up.mark_query()
+        return (sparql_query_text, False, session_id, results_columns, 0, ontology_endpoint,
+                None, True, f"{len(results_df)} rows", True, current_trace_id())
+
+    job_id = query_jobs.submit(run_query_job, ontology_endpoint, sparql_query_template, values)
+    query_job = {'id': job_id, 'endpoint': ontology_endpoint, 'template': sparql_query_template, 'values': values}
+    return (sparql_query_text, False, no_update, no_update, no_update, no_update,
+            query_job, False, 'Query queued', False, no_update)
+
+
+def render_profile(profile):
+    """
+    Render the operator tree of a query profile as nested lists, the operator with the
+    largest self time highlighted.
+    :param profile: dictionary returned by run_profile_job
+    :return: dash component
+    """
+    def walk(node):
+        yield node
+        for child in node['children']:
+            yield from walk(child)
+
+    slowest = max(walk(profile['tree']), key=lambda node: node['self_seconds'])
+
+    def item(node):
+        name = f"{node['name']} {node['label']}" if node['label'] else node['name']
+        text = (f"{name} — {node['solutions']} solutions, "
+                f"{node['seconds'] * 1000:.1f} ms (self {node['self_seconds'] * 1000:.1f} ms)")
+        if node['calls'] > 1:
+            text += f", {node['calls']} calls"
+        children = [html.B(text, className='text-danger') if node is slowest else text]
+        if node['children']:
+            children.append(html.Ul([item(child) for child in node['children']]))
+        return html.Li(children)
+
+    return html.Div([
+        html.P(f"{profile['rows']} rows in {profile['seconds'] * 1000:.1f} ms; "
+               "time includes the operators below, self time excludes them",
+               className=textarea_format),
+        html.Ul([item(profile['tree'])], className=textarea_format, style={'font-family': 'monospace'}),
+    ])
+
+
+@app.callback(
+    Output("profile-job", "data"),
+    Output("profile-job-interval", "disabled"),
+    Output("query-profile", "children"),
+    [Input("profile-button", "n_clicks"),
+     Input("profile-job-interval", "n_intervals")],
+    [State("ontology-endpoint", "children"),
+     State("sparql-query-template-text", "value"),
+     State("dropdown1-select", "value"),
+     State("dropdown2-select", "value"),
+     State("dropdown3-select", "value"),
+     State("dropdown4-select", "value"),
+     State("date-range-picker-select", "start_date"),
+     State("date-range-picker-select", "end_date"),
+     State("precision-select", "value"),
+     State("profile-job", "data")
+     ]
+)
+def profile_button_selected(n_clicks, n_intervals, ontology_endpoint, sparql_query_template,
+                            dropdown_1, dropdown_2, dropdown_3, dropdown_4,
+                            start_date, end_date, precision, profile_job):
+    no_update = dash.no_update
+
+    # a running profile is polled until it finishes
+    if dash.callback_context.triggered_id == "profile-job-interval":
+        if profile_job is None:
+            return None, True, no_update
+        job = query_jobs.poll(profile_job['id'])
+        if job is None:
+            return None, True, html.P('Profile is no longer available', className=textarea_format)
+        if job.status in (QUEUED, RUNNING):
+            status = f"Profile {job.status}: {job.progress or 'starting'} ({job.elapsed:.1f} s)"
+            return no_update, False, html.P(status, className=textarea_format)
+        if job.status != DONE:
+            status = f"Profile {job.status} after {job.elapsed:.1f} s" + (f": {job.error}" if job.error else '')
+            return None, True, html.P(status, className=textarea_format)
+        return None, True, render_profile(job.result)
+
+    if not n_clicks:
+        return None, True, None
+    if ontology_endpoint is None or not sparql_query_template:
+        return None, True, html.P("Select a query to profile.", className=textarea_format)
+
+    values = {
+        'dropdown1': dropdown_1,
+        'dropdown2': dropdown_2,
+        'dropdown3': dropdown_3,
+        'dropdown4': dropdown_4,
+        'start_date': start_date,
+        'end_date': end_date,
+        'precision': precision,
+    }
+    try:
+        get_query_template(sparql_query_template).render(values)
+    except ValueError as e:
+        return no_update, no_update, html.P(str(e), className=textarea_format)
+
+    if profile_job is not None:
+        query_jobs.cancel(profile_job['id'])
+    job_id = query_jobs.submit(run_profile_job, ontology_endpoint, sparql_query_template, values)
+    return {'id': job_id}, False, html.P('Profile queued', className=textarea_format)
+
+
+# the plot width in pixels decides how many points of each series are worth sending
+app.clientside_callback(
+    """
+    function(relayoutData) {
+        var graph = document.getElementById('query-results-chart');
+        return graph ? graph.offsetWidth : window.dash_clientside.no_update;
+    }
+    """,
+    Output('query-results-chart-width', 'data'),
+    Input('query-results-chart', 'relayoutData'),
+)
+
+
+@app.callback(
+    Output("query-results-chart", "figure"),
+    [Input("query-results-session", "data"),
+     Input("query-results-chart", "relayoutData")],
+    [State("query-results-chart-width", "data")]
+)
+@traced_callback('chart')
+def query_results_chart_updated(session_id, relayout_data, width):
+    results_df = result_sessions.dataframe(session_id)
+    if results_df is None:
+        import plotly.express as px
+        return px.line(x=['a', 'b', 'c', 'd'], y=[1, 2, 2, 1], title='placeholder figure')
+
+    # a new result is drawn in full, a zoom re-fetches the points of the zoomed range
+    x_range = None
+    if dash.callback_context.triggered_id == "query-results-chart":
+        x_range = relayout_range(relayout_data)
+        if x_range is False:
+            return dash.no_update
+    return compact_figure(build_figure(results_df, x_range, width, revision=session_id))
+
+
+@app.callback(
+    Output("query-results-table", "data"),
+    Output("query-results-table", "page_count"),
+    [Input("query-results-session", "data"),
+     Input("query-results-table", "page_current"),
+     Input("query-results-table", "page_size"),
+     Input("query-results-table", "sort_by"),
+     Input("query-results-table", "filter_query")]
+)
+@traced_callback('table_page')
+def query_results_table_updated(session_id, page_current, page_size, sort_by, filter_query):
+    # before the first query the table lists the ontologies
+    if session_id is None:
+        index = ontologies_session.view(sort_by, filter_query)
+        return page_dataframe(ontologies_df, page_current, page_size, index)
+
+    return result_sessions.page(session_id, page_current, page_size, sort_by, filter_query)
+
+
+@app.callback(
+    Output("query-results-download", "data"),
+    Input("query-results-export-button", "n_clicks"),
+    [State("query-results-session", "data"),
+     State("query-results-table", "sort_by"),
+     State("query-results-table", "filter_query")],
+    prevent_initial_call=True,
+)
+def query_results_exported(n_clicks, session_id, sort_by, filter_query):
+    if session_id is None:
+        content = ontologies_session.csv(sort_by, filter_query)
+    else:
+        content = result_sessions.csv(session_id, sort_by, filter_query)
+    if content is None:
+        return dash.no_update
+    return dict(content=content, filename="query_results.csv")
+
+
+##############################################
+# statistics
+#
+# properties and classes listed in the statistics panel
+STATISTICS_TOP = 5
+
+
+@app.callback(
+    Output("ontology-statistics", "children"),
+    [Input("ontology-endpoint", "children")]
+)
+def ontology_statistics_updated(ontology_endpoint):
+    if not ontology_endpoint:
+        return html.P("Select an ontology to see its statistics.", className=accordian_item_format)
+    stats = get_ontology_statistics(ontology_endpoint).to_dict(top=STATISTICS_TOP)
+
+    def counts(title, items):
+        rows = [html.Tr([html.Td(local_name(item['iri']) or item['iri']), html.Td(f"{item['count']:,}")])
+                for item in items]
+        return dbc.Table([html.Thead(html.Tr([html.Th(title), html.Th('count')])), html.Tbody(rows)],
+                         size='sm', striped=True)
+
+    summary = [('Triples', stats['triples']), ('Properties', stats['property_count']),
+               ('Classes', stats['class_count']), ('Type assertions', stats['typed'])]
+    return [
+        dbc.Table(html.Tbody([html.Tr([html.Td(name), html.Td(f'{n:,}')]) for name, n in summary]),
+                  size='sm', striped=True),
+        counts('Top properties', stats['properties']),
+        counts('Top classes', stats['classes']),
+    ]
+
+
+@app.server.route("/statistics/<name>")
+def ontology_statistics(name):
+    df = ontologies_df[ontologies_df['Name'] == name]
+    if df.empty:
+        return {'error': f'unknown ontology {name}'}, 404
+    top = flask.request.args.get('top', type=int)
+    return get_ontology_statistics(df['Endpoint'].iloc[0]).to_dict(top=top)
+
+
+##############################################
+# metrics
+#
+@app.server.before_request
+def start_request_trace():
+    if flask.request.path.endswith('/_dash-update-component'):
+        start_trace()
+
+
+@app.server.after_request
+def finish_request_trace(response):
+    mark_response_encoded()
+    # the component bundles are fingerprinted and never change, they are compressed once
+    path = flask.request.path
+    cache_key = path if path.startswith('/_dash-component-suites/') else None
+    size, wire_size = compress_response(response, flask.request.accept_encodings, cache_key)
+    finish_trace(bytes=size, wire_bytes=wire_size)
+    return response
+
+
+@app.server.route("/metrics")
+def prometheus_metrics():
+    return flask.Response(metrics.prometheus(), mimetype='text/plain; version=0.0.4')
+
+
+@app.callback(
+    Output("query-timings", "children"),
+    [Input("query-timings-trace", "data"),
+     Input("query-timings-switch", "value")]
+)
+def query_timings_updated(trace_id, shown):
+    if not shown:
+        return None
+    trace = get_trace(trace_id) if trace_id else None
+    if trace is None:
+        return html.P("Submit a query to see its timings.", className=accordian_item_format)
+
+    # spans are listed as they finished, a stage after the stages it contains
+    rows = [html.Tr([html.Td(s['stage']),
+                     html.Td(f"{s['seconds'] * 1000:.1f}"),
+                     html.Td(', '.join(f'{n} {unit}' for unit, n in s['counts'].items()))])
+            for s in trace['spans']]
+    rows.append(html.Tr([html.Td(html.B('request')), html.Td(html.B(f"{trace['seconds'] * 1000:.1f}")), html.Td()]))
+    return dbc.Table([html.Thead(html.Tr([html.Th('Stage'), html.Th('ms'), html.Th('Items')])), html.Tbody(rows)],
+                     size='sm', striped=True)
+
+
+##############################################
+# readiness
+#
+@app.server.route("/ready")
+def ready():
+    status = warm_up.status()
+    return status, 200 if status['ready'] else 503
+
+
+def start_warm_up():
+    """
+    Load and index every ontology of ontologies.csv in background threads, and start
+    watching their files for changes.
+    :return: None
+    """
+    tasks = {endpoint: functools.partial(warm_up_ontology, endpoint) for endpoint in ontologies_df['Endpoint']}
+    tasks['theme-changer'] = build_theme_changer
+    warm_up.start(tasks)
+    ontology_watcher.start()
 
-    # replace according to meta tags
-    start_tag, end_tag = "<<", ">>"
-    start_index = 0
-    while True:
-        idx_1 = sparql_query_template.find(start_tag, start_index)
-        if idx_1 == -1:
-            break
-        idx_2 = sparql_query_template.find(end_tag, start_index + len(start_tag))
-        if idx_2 == -1:
-            break
-        tag = sparql_query_template[idx_1 + len(start_tag): idx_2]
-        name_value = tag.split(':')
-
-        if name_value[1].strip() == 'dropdown1':
-            sparql_query_text = sparql_query_text.replace(name_value[0], dropdown_1)
-        elif name_value[1].strip() == 'dropdown2':
-            sparql_query_text = sparql_query_text.replace(name_value[0], dropdown_2)
-        elif name_value[1].strip() == 'dropdown3':
-            sparql_query_text = sparql_query_text.replace(name_value[0], dropdown_3)
-        elif name_value[1].strip() == 'dropdown4':
-            sparql_query_text = sparql_query_text.replace(name_value[0], dropdown_4)
-        elif name_value[1].strip() == 'start_date':
-            sparql_query_text = sparql_query_text.replace(name_value[0], start_date)
-        elif name_value[1].strip() == 'end_date':
-            sparql_query_text = sparql_query_text.replace(name_value[0], end_date)
-        elif name_value[1].strip() == 'precision':
-            sparql_query_text = sparql_query_text.replace('precision', str(math.pow(10, precision)))
-        start_index = idx_2
-
-    results_table, results_columns, results_df = get_sparql_query_results(ontology_endpoint, sparql_query_text)
-
-    data = []
-    for col in results_df.columns:
-        if col == 'date':
-            continue
-        d = dict(
-            type="line",
-            x=results_df['date'],
-            y=results_df[col],
-            name=col,
-        )
-        data.append(d)
-
-    layout = {"title": "Results", "dragmode": "select", "showlegend": True, "autosize": True}
-    figure = dict(data=data, layout=layout)
-
-    cytoscape_elements = get_cytoscape_elements(ontology_endpoint)
-
-    return sparql_query_text, False, results_table, results_columns, cytoscape_elements, figure
 
+warm_up.mark_imported()
 
 ##############################################
 # Run the server
 #
 if __name__ == "__main__":
-    app.run_server(debug=True)
+    debug = True
+    # with the debugger the reloader process only restarts the server process, which sets WERKZEUG_RUN_MAIN,
+    # and warm-up runs in the server process alone
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_warm_up()
+    app.run_server(debug=debug)
@@ -0,0 +1,119 @@
+"""
+Compare bringing a loaded ontology up to date after an edit of its file by a triple delta
+against reloading it, for the default and the NumPy store.
+
+    python -m benchmarks.delta
+"""
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from utilities.delta import update_graph
+from utilities.ont import build_ontology_as_rdflib_graph
+from utilities.registry import GraphRegistry
+
+ENDPOINTS = ['data/pizza/pizza.owl', 'data/defi/defi.owl']
+
+STORES = ['default', 'NumPy']
+
+RDF = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'
+OWL = 'http://www.w3.org/2002/07/owl#'
+
+# edits appended to the file, spelled without prefixes so they apply to any RDF/XML document
+NEW_CLASS = f'''<rdf:Description rdf:about="http://example.org/NewClass">
+  <rdf:type rdf:resource="{OWL}Class"/>
+</rdf:Description>
+'''
+NEW_RESTRICTION = f'''<rdf:Description rdf:about="http://example.org/NewClass">
+  <rdf:type rdf:resource="{OWL}Class"/>
+  <subClassOf xmlns="http://www.w3.org/2000/01/rdf-schema#">
+    <rdf:Description>
+      <rdf:type rdf:resource="{OWL}Restriction"/>
+      <onProperty xmlns="{OWL}" rdf:resource="http://example.org/hasPart"/>
+      <someValuesFrom xmlns="{OWL}" rdf:resource="http://example.org/Part"/>
+    </rdf:Description>
+  </subClassOf>
+</rdf:Description>
+'''
+
+
+def _append(text, element):
+    i = text.rindex('</rdf:RDF>')
+    return text[:i] + element + text[i:]
+
+
+# edit name to function of the file text returning the edited text
+EDITS = {
+    'rewrite': lambda text: text,
+    'add_class': lambda text: _append(text, NEW_CLASS),
+    'add_restriction': lambda text: _append(text, NEW_RESTRICTION),
+}
+
+
+def time_call(fn, setup, repeat=5):
+    """
+    Return the median wall time of a call in milliseconds.
+    :param fn: callable without arguments
+    :param setup: callable run untimed before every call
+    :param repeat: number of runs
+    :return: milliseconds
+    """
+    timings = []
+    for _ in range(repeat):
+        setup()
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def run(endpoints=ENDPOINTS, stores=STORES, repeat=5):
+    """
+    Time loading each edit of each endpoint into each store by reload and by delta.
+    :param endpoints: ontology endpoints
+    :param stores: rdflib store plugin names
+    :param repeat: number of runs per measurement
+    :return: list of dictionaries
+    """
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for endpoint in endpoints:
+            filename = os.path.join(tmp, os.path.basename(endpoint))
+            with open(endpoint) as f:
+                original = f.read()
+            for store in stores:
+                for edit, fn in EDITS.items():
+                    edited = fn(original)
+                    registries = {
+                        'reload': GraphRegistry(build_ontology_as_rdflib_graph),
+                        'delta': GraphRegistry(build_ontology_as_rdflib_graph, updater=update_graph),
+                    }
+
+                    def setup(registry):
+                        shutil.copyfile(endpoint, filename)
+                        registry.invalidate()
+                        registry.entry(filename, store=store)
+                        with open(filename, 'w') as f:
+                            f.write(edited)
+                        # a new mtime, even on filesystems with coarse timestamps
+                        os.utime(filename, ns=(time.time_ns(), time.time_ns() + 1))
+
+                    row = {'endpoint': endpoint, 'store': store, 'edit': edit}
+                    for path, registry in registries.items():
+                        row[f'{path}_ms'] = time_call(lambda: registry.entry(filename, store=store),
+                                                      lambda: setup(registry), repeat)
+                    reloaded, updated = (set(registry.get(filename, store=store)) for registry in registries.values())
+                    row['same'] = reloaded == updated
+                    row['updates'] = registries['delta'].updates
+                    rows.append(row)
+    return rows
+
+
+if __name__ == '__main__':
+    print(f"{'endpoint':<24}{'store':<10}{'edit':<18}{'reload ms':>12}{'delta ms':>12}{'speedup':>10}")
+    for row in run():
+        print(f"{row['endpoint']:<24}{row['store']:<10}{row['edit']:<18}{row['reload_ms']:12.2f}"
+              f"{row['delta_ms']:12.2f}{row['reload_ms'] / row['delta_ms']:9.1f}x"
+              + ('' if row['same'] else '  DIFFERENT TRIPLES'))
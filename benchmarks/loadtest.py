@@ -0,0 +1,312 @@
+"""
+Load-test the dashboard over HTTP with concurrent simulated users running the canned queries.
+
+Each user does what the browser does after pressing Submit: posts the submit callback to
+/_dash-update-component, polls the query-job interval until the query finished, then
+requests the first table page and the chart. Throughput and p50/p95/p99 latency are
+reported per callback and for whole queries.
+
+    python -m benchmarks.loadtest --users 16 --duration 60
+    python -m benchmarks.loadtest --url http://127.0.0.1:8050 --endpoint Defi=/tmp/defi_50x3650.owl
+
+Without --url the app is served in-process by a threaded werkzeug server.
+"""
+import argparse
+import http.client
+import json
+import logging
+import random
+import threading
+import time
+import urllib.parse
+from collections import defaultdict
+
+import numpy as np
+
+from benchmarks.queries import VALUES, canned_queries
+
+# the dcc.Interval polling a running query job, in seconds
+POLL_INTERVAL = 0.5
+
+# default page size of the query-results-table
+PAGE_SIZE = 25
+
+
+def _outputs(output):
+    """
+    Return the outputs of a dependency in the form the renderer posts them.
+    :param output: dependency output string, '..id.prop...id.prop..' for several outputs
+    :return: list of {'id', 'property'} for several outputs, one dictionary otherwise
+    """
+    def split(spec):
+        component, prop = spec.rsplit('.', 1)
+        return {'id': component, 'property': prop}
+    if output.startswith('..'):
+        return [split(spec) for spec in output[2:-2].split('...')]
+    return split(output)
+
+
+class DashClient:
+    """
+    Posts callbacks to a Dash server the way the renderer does, over one keep-alive connection.
+    """
+
+    def __init__(self, url, dependencies):
+        """
+        :param url: base url of the dashboard
+        :param dependencies: dictionary of output property, e.g. 'query-job-status.children', to dependency
+        """
+        parsed = urllib.parse.urlsplit(url)
+        self.prefix = parsed.path.rstrip('/')
+        self.connection = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=120)
+        self.dependencies = dependencies
+
+    @staticmethod
+    def load_dependencies(url):
+        """
+        Fetch the callback graph of a dashboard.
+        :param url: base url of the dashboard
+        :return: dictionary of every output property to its dependency
+        """
+        parsed = urllib.parse.urlsplit(url)
+        connection = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=30)
+        connection.request('GET', parsed.path.rstrip('/') + '/_dash-dependencies')
+        dependencies = json.loads(connection.getresponse().read())
+        connection.close()
+        by_output = {}
+        for dependency in dependencies:
+            outputs = _outputs(dependency['output'])
+            for output in outputs if isinstance(outputs, list) else [outputs]:
+                by_output[f"{output['id']}.{output['property']}"] = dependency
+        return by_output
+
+    def call(self, output, values, changed):
+        """
+        Run the callback of an output.
+        :param output: one output property of the callback, e.g. 'query-job-status.children'
+        :param values: dictionary of 'id.prop' to the value of its inputs and states, None when missing
+        :param changed: the 'id.prop' of the input that triggered the callback
+        :return: dictionary of component id to dictionary of updated properties
+        """
+        dependency = self.dependencies[output]
+
+        def props(items):
+            return [dict(item, value=values.get(f"{item['id']}.{item['property']}")) for item in items]
+
+        body = json.dumps({
+            'output': dependency['output'],
+            'outputs': _outputs(dependency['output']),
+            'inputs': props(dependency['inputs']),
+            'state': props(dependency['state']),
+            'changedPropIds': [changed],
+        })
+        self.connection.request('POST', self.prefix + '/_dash-update-component', body,
+                                {'Content-Type': 'application/json'})
+        response = self.connection.getresponse()
+        content = response.read()
+        if response.status == 204:
+            # every output was left unchanged
+            return {}
+        if response.status != 200:
+            raise RuntimeError(f'{output}: HTTP {response.status}')
+        return json.loads(content)['response']
+
+    def close(self):
+        self.connection.close()
+
+
+class Recorder:
+    """
+    Collects latencies per name from every user thread.
+    """
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def timed(self, name, fn, *args):
+        started = time.perf_counter()
+        try:
+            result = fn(*args)
+        except Exception:
+            with self._lock:
+                self.errors[name] += 1
+            raise
+        with self._lock:
+            self.latencies[name].append(time.perf_counter() - started)
+        return result
+
+    def report(self, seconds):
+        """
+        Return throughput and latency percentiles per name.
+        :param seconds: duration of the measured run
+        :return: dictionary of name to dictionary of statistics
+        """
+        with self._lock:
+            names = sorted(set(self.latencies) | set(self.errors))
+            report = {}
+            for name in names:
+                ms = np.array(self.latencies[name]) * 1000
+                report[name] = {
+                    'count': len(ms),
+                    'errors': self.errors[name],
+                    'per_second': len(ms) / seconds if seconds else 0.0,
+                    'p50_ms': float(np.percentile(ms, 50)) if len(ms) else None,
+                    'p95_ms': float(np.percentile(ms, 95)) if len(ms) else None,
+                    'p99_ms': float(np.percentile(ms, 99)) if len(ms) else None,
+                }
+            return report
+
+
+def run_query(client, recorder, endpoint, template_text, n_clicks, poll_interval=POLL_INTERVAL):
+    """
+    Submit one canned query, poll it to completion and fetch its first table page and chart.
+    :param client: DashClient
+    :param recorder: Recorder
+    :param endpoint: ontology endpoint
+    :param template_text: sparql query template text
+    :param n_clicks: submit-button clicks so far, including this one
+    :param poll_interval: seconds between polls of a running query
+    :return: None
+    """
+    values = {
+        'submit-button.n_clicks': n_clicks,
+        'ontology-endpoint.children': endpoint,
+        'sparql-query-template-text.value': template_text,
+        'dropdown1-select.value': VALUES['dropdown1'],
+        'dropdown2-select.value': VALUES['dropdown2'],
+        'dropdown3-select.value': VALUES['dropdown3'],
+        'dropdown4-select.value': VALUES['dropdown4'],
+        'date-range-picker-select.start_date': VALUES['start_date'],
+        'date-range-picker-select.end_date': VALUES['end_date'],
+        'precision-select.value': VALUES['precision'],
+        'query-job-interval.n_intervals': 0,
+    }
+    status = 'query-job-status.children'
+    response = recorder.timed('submit', client.call, status, values, 'submit-button.n_clicks')
+    job = response.get('query-job', {}).get('data')
+    while job is not None:
+        time.sleep(poll_interval)
+        values['query-job.data'] = job
+        values['query-job-interval.n_intervals'] += 1
+        response = recorder.timed('poll', client.call, status, values, 'query-job-interval.n_intervals')
+        if 'query-job' in response:
+            job = response['query-job']['data']
+
+    session_id = response.get('query-results-session', {}).get('data')
+    if session_id is None:
+        raise RuntimeError(response.get('query-job-status', {}).get('children') or 'query failed')
+    values.update({
+        'query-results-session.data': session_id,
+        'query-results-table.page_current': 0,
+        'query-results-table.page_size': PAGE_SIZE,
+        'query-results-chart-width.data': 800,
+    })
+    recorder.timed('table', client.call, 'query-results-table.data', values, 'query-results-session.data')
+    recorder.timed('chart', client.call, 'query-results-chart.figure', values, 'query-results-session.data')
+
+
+def user(url, dependencies, scenarios, recorder, deadline, seed, poll_interval=POLL_INTERVAL):
+    """
+    Run random canned queries until the deadline.
+    :param scenarios: list of (endpoint, template text)
+    :return: None
+    """
+    rng = random.Random(seed)
+    client = DashClient(url, dependencies)
+    clicks = 0
+    try:
+        while time.perf_counter() < deadline:
+            endpoint, text = rng.choice(scenarios)
+            clicks += 1
+            try:
+                recorder.timed('query', run_query, client, recorder, endpoint, text, clicks, poll_interval)
+            except (OSError, RuntimeError, http.client.HTTPException):
+                client.close()
+    finally:
+        client.close()
+
+
+def serve_app():
+    """
+    Serve the dashboard in-process on a free port.
+    :return: (base url, werkzeug server)
+    """
+    from werkzeug.serving import make_server
+    from app import app
+    # one access log line per request would dominate the output
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app.server, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', server
+
+
+def run(url, users=8, duration=30.0, endpoints=None, warm_up=True, poll_interval=POLL_INTERVAL, seed=0):
+    """
+    Run the load test.
+    :param url: base url of the dashboard
+    :param users: number of concurrent simulated users
+    :param duration: seconds of measured load
+    :param endpoints: dictionary of ontology name to an endpoint replacing the bundled one
+    :param warm_up: run every canned query once before measuring, so parsing is not measured
+    :param poll_interval: seconds between polls of a running query
+    :param seed: random seed of the query choices
+    :return: dictionary of name to dictionary of statistics
+    """
+    dependencies = DashClient.load_dependencies(url)
+    scenarios = [(endpoint, text) for _, endpoint, queries in canned_queries(endpoints) for _, text in queries]
+    if warm_up:
+        client = DashClient(url, dependencies)
+        for i, (endpoint, text) in enumerate(scenarios):
+            run_query(client, Recorder(), endpoint, text, i + 1, poll_interval)
+        client.close()
+
+    recorder = Recorder()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=user, args=(url, dependencies, scenarios, recorder, started + duration,
+                                                   seed + i, poll_interval))
+               for i in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder.report(time.perf_counter() - started)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help='dashboard to load, served in-process when omitted')
+    parser.add_argument('--users', type=int, default=8, help='concurrent simulated users')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds of load')
+    parser.add_argument('--endpoint', action='append', default=[], metavar='NAME=ENDPOINT',
+                        help='replace the endpoint of an ontology, e.g. Defi=/tmp/defi_50x3650.owl')
+    parser.add_argument('--cold', action='store_true', help='skip the warm-up pass')
+    parser.add_argument('--poll-interval', type=float, default=POLL_INTERVAL)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', metavar='FILE', help='also write the report as JSON')
+    args = parser.parse_args(argv)
+
+    server = None
+    url = args.url
+    if url is None:
+        url, server = serve_app()
+    endpoints = dict(e.split('=', 1) for e in args.endpoint)
+    try:
+        report = run(url, args.users, args.duration, endpoints, not args.cold, args.poll_interval, args.seed)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    print(f"{'callback':<10}{'count':>8}{'errors':>8}{'per s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, stats in report.items():
+        latencies = ''.join(f'{stats[k]:10.1f}' if stats[k] is not None else f"{'-':>10}"
+                            for k in ('p50_ms', 'p95_ms', 'p99_ms'))
+        print(f"{name:<10}{stats['count']:8d}{stats['errors']:8d}{stats['per_second']:10.2f}{latencies}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'users': args.users, 'duration': args.duration, 'report': report}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""
+The canned queries of the bundled ontologies and the control values benchmarks run them with.
+"""
+import pathlib
+
+import pandas as pd
+
+DATA_PATH = pathlib.Path(__file__).parent.parent.joinpath('data').resolve()
+
+# control values the canned queries are run with
+VALUES = {
+    'dropdown1': 'BTC',
+    'dropdown2': 'ETH',
+    'dropdown3': 'BNB',
+    'dropdown4': 'XRP',
+    'start_date': '2023-01-01',
+    'end_date': '2023-06-30',
+    'precision': 2,
+}
+
+
+def canned_queries(endpoints=None):
+    """
+    Return every ontology of ontologies.csv with its canned queries.
+    :param endpoints: dictionary of ontology name to an endpoint replacing the bundled one,
+        e.g. a synthetic ontology of the same shape
+    :return: list of (ontology name, endpoint, list of (query name, template text))
+    """
+    ontologies = []
+    for _, row in pd.read_csv(DATA_PATH.joinpath('ontologies.csv')).iterrows():
+        queries = pd.read_csv(DATA_PATH.joinpath(row['Sparql']))
+        endpoint = (endpoints or {}).get(row['Name'], row['Endpoint'])
+        ontologies.append((row['Name'], endpoint, list(zip(queries['Name'], queries['Sparql']))))
+    return ontologies
@@ -0,0 +1,222 @@
+"""
+Benchmark suite over the bundled ontologies and every canned query of their sparql files:
+parsing, sparql queries, result conversion, the cytoscape export, snapshot serialize and
+deserialize, and the full submit_button_selected callback. Each case records its median
+wall time and peak traced memory; results can be saved as a JSON baseline and compared.
+Memory is traced in the benchmark process only: the submit cases run their query in a job
+process started by the forkserver, so their peak covers the callbacks and polls but not the
+query, whose memory the query cases measure.
+
+    python -m benchmarks.run
+    python -m benchmarks.run --save benchmarks/baseline.json
+    python -m benchmarks.run --compare benchmarks/baseline.json
+"""
+import argparse
+import contextvars
+import datetime
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import dash
+import rdflib
+
+# the suite must not depend on how the server is configured
+os.environ['SEMANTIC_WEB_STORE'] = 'default'
+
+import app  # noqa: E402
+from benchmarks.queries import VALUES, canned_queries  # noqa: E402
+from utilities import ont  # noqa: E402
+from utilities.ont import build_ontology_as_rdflib_graph, get_cytoscape_elements, get_sparql_query_results  # noqa: E402
+from utilities.results import dataframe_to_table, query_results_to_dataframe  # noqa: E402
+from utilities.serialization import deserialize, serialize  # noqa: E402
+from utilities.templates import get_query_template  # noqa: E402
+
+# a case is a regression when its median grows by more than this share
+DEFAULT_THRESHOLD = 0.2
+
+
+def measure(fn, setup=None, repeat=5):
+    """
+    Return the median and minimum wall time of a call and its peak traced memory.
+    Memory is traced in a separate run, so tracing does not slow the timed runs, and only
+    in this process, so allocations of child processes are not counted.
+    :param fn: callable without arguments
+    :param setup: callable run untimed before every call, e.g. to clear caches
+    :param repeat: number of timed runs
+    :return: dictionary of statistics
+    """
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    if setup is not None:
+        setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'median_ms': statistics.median(timings), 'min_ms': min(timings), 'peak_kib': peak / 1024}
+
+
+def clear_caches():
+    ont.query_cache.invalidate()
+    ont.graph_views.clear()
+    ont.time_series_indexes.clear()
+    ont.view_layouts.clear()
+
+
+def submit(endpoint, template_text, values=VALUES, poll_interval=0.001):
+    """
+    Run the submit_button_selected callback as the browser does: one submit click, then
+    interval polls until the query job finished.
+    :param endpoint: ontology endpoint
+    :param template_text: sparql query template text
+    :param values: control values
+    :param poll_interval: seconds between polls
+    :return: callback outputs of the last call
+    """
+    from dash._callback_context import context_value
+    from dash._utils import AttributeDict
+
+    def call(trigger, n_clicks, query_job):
+        def run():
+            context_value.set(AttributeDict(triggered_inputs=[{'prop_id': trigger, 'value': n_clicks}]))
+            return app.submit_button_selected(
+                n_clicks, None, None, endpoint, template_text,
+                values['dropdown1'], values['dropdown2'], values['dropdown3'], values['dropdown4'],
+                values['start_date'], values['end_date'], values['precision'], query_job)
+        return contextvars.copy_context().run(run)
+
+    outputs = call('submit-button.n_clicks', 1, None)
+    query_job = outputs[6]
+    while query_job is not None:
+        time.sleep(poll_interval)
+        outputs = call('query-job-interval.n_intervals', 1, query_job)
+        # the job store is left unchanged while the job runs
+        if outputs[6] is not dash.no_update:
+            query_job = outputs[6]
+    return outputs
+
+
+def run(repeat=5):
+    """
+    Run every benchmark case.
+    :param repeat: number of timed runs per case
+    :return: dictionary of case name to dictionary of statistics
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, endpoint, queries in canned_queries():
+            results[f'parse/{name}'] = measure(lambda: build_ontology_as_rdflib_graph(endpoint), repeat=repeat)
+
+            graph = ont.get_ontology_graph(endpoint)
+            results[f'cytoscape/{name}'] = measure(lambda: get_cytoscape_elements(endpoint), clear_caches, repeat)
+
+            filename = os.path.join(tmp, f'{name}.swsnap')
+            results[f'serialize/{name}'] = measure(lambda: serialize(graph, filename), repeat=repeat)
+            results[f'deserialize/{name}'] = measure(lambda: deserialize(filename), repeat=repeat)
+
+            for query_name, text in queries:
+                template = get_query_template(text)
+                bindings, column_names = template.bindings(VALUES), template.column_names(VALUES)
+                # without a cache key the prepared query is run every time
+                results[f'query/{name}/{query_name}'] = measure(
+                    lambda: get_sparql_query_results(endpoint, template.query, bindings, column_names), repeat=repeat)
+
+                query_results = graph.query(template.query, initBindings=bindings)
+                query_results.bindings  # evaluate once, so only the conversion is timed
+                results[f'convert/{name}/{query_name}'] = measure(
+                    lambda: dataframe_to_table(query_results_to_dataframe(query_results, column_names)), repeat=repeat)
+
+                # peak_kib excludes the job process the query runs in
+                results[f'submit/{name}/{query_name}'] = measure(lambda: submit(endpoint, text), clear_caches, repeat)
+    return results
+
+
+def environment():
+    """
+    Return what a run depends on, saved with a baseline so comparisons can be judged.
+    :return: dictionary
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'rdflib': rdflib.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare a run with a baseline, case by case.
+    :param results: dictionary of case name to statistics
+    :param baseline: dictionary of case name to statistics
+    :param threshold: share of growth of the median time flagged as a regression
+    :return: list of (case, baseline ms, ms, ratio, regressed), for the cases in both
+    """
+    rows = []
+    for case, stats in results.items():
+        if case not in baseline:
+            continue
+        before = baseline[case]['median_ms']
+        ratio = stats['median_ms'] / before if before else float('inf')
+        rows.append((case, before, stats['median_ms'], ratio, ratio > 1 + threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per case')
+    parser.add_argument('--save', metavar='FILE', help='save the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='FILE', help='compare with a JSON baseline, exit 1 on regressions')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='regression threshold')
+    args = parser.parse_args(argv)
+
+    results = run(args.repeat)
+    try:
+        for case, stats in results.items():
+            print(f"{case:<60}{stats['median_ms']:10.2f} ms{stats['peak_kib']:12.0f} KiB")
+
+        if args.save:
+            with open(args.save, 'w') as f:
+                json.dump({'environment': environment(), 'results': results}, f, indent=2)
+            print(f'saved {args.save}')
+
+        if args.compare:
+            with open(args.compare) as f:
+                baseline = json.load(f)
+            print(f"compared with {args.compare} ({baseline['environment'].get('commit')})")
+            rows = compare(results, baseline['results'], args.threshold)
+            for case, before, after, ratio, regressed in rows:
+                flag = '  REGRESSION' if regressed else ''
+                print(f'{case:<60}{before:10.2f} ->{after:10.2f} ms{ratio:8.2f}x{flag}')
+            return 1 if any(row[-1] for row in rows) else 0
+        return 0
+    finally:
+        app.query_jobs.shutdown()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+Compare cold-start load time of the graph snapshot format against pickle and an RDF/XML parse.
+
+    python -m benchmarks.snapshot
+"""
+import os
+import pickle
+import statistics
+import tempfile
+import time
+
+from utilities.ont import build_ontology_as_rdflib_graph
+from utilities.serialization import deserialize, load_snapshot, serialize
+
+ENDPOINTS = ['data/pizza/pizza.owl', 'data/defi/defi.owl']
+
+
+def time_call(fn, repeat=5):
+    """
+    Return the median wall time of a call in milliseconds.
+    :param fn: callable without arguments
+    :param repeat: number of runs
+    :return: milliseconds
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def pickle_load(filename):
+    with open(filename, 'rb') as f:
+        return pickle.load(f)
+
+
+def run(endpoints=ENDPOINTS, repeat=5):
+    """
+    Benchmark each endpoint and return one row of timings per endpoint.
+    :param endpoints: ontology endpoints
+    :param repeat: number of runs per measurement
+    :return: list of dictionaries
+    """
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for endpoint in endpoints:
+            g = build_ontology_as_rdflib_graph(endpoint)
+            snapshot_file = os.path.join(tmp, 'graph.snap')
+            pickle_file = os.path.join(tmp, 'graph.pickle')
+            serialize(g, snapshot_file)
+            with open(pickle_file, 'wb') as f:
+                pickle.dump(g, f)
+
+            rows.append({
+                'endpoint': endpoint,
+                'triples': len(g),
+                'round_trip': set(deserialize(snapshot_file)) == set(g),
+                'parse_ms': time_call(lambda: build_ontology_as_rdflib_graph(endpoint), repeat),
+                'pickle_ms': time_call(lambda: pickle_load(pickle_file), repeat),
+                'snapshot_mmap_ms': time_call(lambda: load_snapshot(snapshot_file), repeat),
+                'snapshot_graph_ms': time_call(lambda: deserialize(snapshot_file), repeat),
+                'pickle_bytes': os.path.getsize(pickle_file),
+                'snapshot_bytes': os.path.getsize(snapshot_file),
+            })
+    return rows
+
+
+if __name__ == '__main__':
+    for row in run():
+        print(row['endpoint'], f"({row['triples']} triples, round trip {'ok' if row['round_trip'] else 'FAILED'})")
+        for k, v in row.items():
+            if k.endswith('_ms'):
+                print(f'  {k:<20}{v:10.2f}')
+            elif k.endswith('_bytes'):
+                print(f'  {k:<20}{v:10d}')
@@ -0,0 +1,66 @@
+"""
+Measure app import time and time to first query in fresh interpreters, with and without
+the background warm-up.
+
+    python -m benchmarks.startup
+"""
+import json
+import statistics
+import subprocess
+import sys
+
+# run in a child interpreter so every measurement starts cold
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+import app
+from utilities.ont import get_template_results
+from utilities.templates import get_query_template
+imported = time.perf_counter()
+if {warm_up}:
+    app.start_warm_up()
+    while not app.warm_up.ready:
+        time.sleep(0.01)
+warmed = time.perf_counter()
+template = get_query_template({query!r})
+get_template_results({endpoint!r}, template, {{'precision': 2}}, with_records=False)
+answered = time.perf_counter()
+print(json.dumps({{'import_s': imported - started, 'warm_up_s': warmed - imported, 'query_s': answered - warmed,
+                  'first_query_s': answered - started}}))
+'''
+
+ENDPOINT = 'data/pizza/pizza.owl'
+QUERY = 'SELECT ?s WHERE { ?s a <http://www.w3.org/2002/07/owl#Class> }'
+
+
+def measure(warm_up, endpoint=ENDPOINT, query=QUERY):
+    """
+    Return the startup timings of one fresh interpreter.
+    :param warm_up: wait for the background warm-up before the first query
+    :param endpoint: ontology endpoint queried
+    :param query: sparql query text
+    :return: dictionary of seconds
+    """
+    code = CHILD.format(warm_up=warm_up, endpoint=endpoint, query=query)
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(repeat=3):
+    """
+    Return the median startup timings without and with warm-up.
+    :param repeat: number of interpreters per mode
+    :return: dictionary of mode to dictionary of seconds
+    """
+    results = {}
+    for mode, warm_up in (('cold', False), ('warm', True)):
+        runs = [measure(warm_up) for _ in range(repeat)]
+        results[mode] = {k: statistics.median(r[k] for r in runs) for k in runs[0]}
+    return results
+
+
+if __name__ == '__main__':
+    for mode, timings in run().items():
+        print(mode)
+        for k, v in timings.items():
+            print(f'  {k:<20}{v * 1000:10.1f} ms')
@@ -0,0 +1,168 @@
+"""
+Write synthetic ontologies shaped like the bundled ones, at any scale.
+
+    python -m benchmarks.synth defi --tickers 50 --days 3650 --output /tmp/defi_50x3650.owl
+    python -m benchmarks.synth pizza --classes 20000 --branching 6 --individuals 5000 --output /tmp/pizza_20k.owl
+
+defi: N tickers x M days of Defi#<TICKER>_<day> resources with <TICKER>_date and
+<TICKER>_price literals, so the canned defi query and the time-series index apply.
+pizza: a tree of pizza classes under NamedPizza and of toppings under PizzaTopping, each
+pizza with owl:Restriction blank nodes on hasTopping and each topping on hasSpiciness,
+so the canned pizza queries (class hierarchy, hot spices) have work to do.
+"""
+import argparse
+import datetime
+import os
+import random
+from xml.sax.saxutils import escape
+
+DEFI = 'http://www.semanticweb.org/sichengyun/ontologies/2023/6/'
+PIZZA = 'http://www.co-ode.org/ontologies/pizza/pizza.owl#'
+
+# tickers of the defi dropdowns come first, so the canned query runs against any scale
+TICKERS = ['BTC', 'ETH', 'BNB', 'XRP']
+
+SPICINESS = ['Hot', 'Medium', 'Mild']
+
+
+def ticker_names(count):
+    """
+    Return the ticker names of a synthetic defi ontology.
+    :param count: number of tickers
+    :return: list of names
+    """
+    return (TICKERS + [f'T{i:04d}' for i in range(len(TICKERS), count)])[:count]
+
+
+def write_defi(filename, tickers=4, days=182, start='2023-01-01', seed=0):
+    """
+    Write a defi-shaped ontology of daily ticker prices.
+    :param filename: output RDF/XML file
+    :param tickers: number of tickers
+    :param days: number of days per ticker
+    :param start: first date
+    :param seed: random seed of the price walks
+    :return: number of triples written
+    """
+    rng = random.Random(seed)
+    first = datetime.date.fromisoformat(start)
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n<rdf:RDF\n'
+                f'   xmlns:ns1="{DEFI}"\n'
+                '   xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"\n'
+                '   xmlns:rdfs="http://www.w3.org/2000/01/rdf-schema#"\n>\n')
+        for ticker in ticker_names(tickers):
+            price = rng.uniform(0.1, 50000)
+            for day in range(days):
+                price *= 1 + rng.gauss(0, 0.03)
+                f.write(f'  <rdf:Description rdf:about="{DEFI}Defi#{ticker}_{day}">\n'
+                        f'    <ns1:{ticker}_date rdf:datatype="http://www.w3.org/2001/XMLSchema#date">'
+                        f'{first + datetime.timedelta(days=day)}</ns1:{ticker}_date>\n'
+                        f'    <ns1:{ticker}_price rdf:datatype="http://www.w3.org/2001/XMLSchema#decimal">'
+                        f'{price:.6f}</ns1:{ticker}_price>\n'
+                        '  </rdf:Description>\n')
+        f.write('</rdf:RDF>\n')
+    return tickers * days * 2
+
+
+def _class(f, name, parents, label, restrictions=()):
+    """
+    Write one owl:Class with its superclasses, labels and someValuesFrom restrictions.
+    :return: number of triples written
+    """
+    f.write(f'<owl:Class rdf:about="{PIZZA}{name}">\n')
+    for parent in parents:
+        f.write(f'<rdfs:subClassOf rdf:resource="{PIZZA}{parent}"/>\n')
+    for prop, value in restrictions:
+        f.write('<rdfs:subClassOf>\n<owl:Restriction>\n'
+                f'<owl:onProperty rdf:resource="{PIZZA}{prop}"/>\n'
+                f'<owl:someValuesFrom rdf:resource="{PIZZA}{value}"/>\n'
+                '</owl:Restriction>\n</rdfs:subClassOf>\n')
+    f.write(f'<rdfs:label xml:lang="en">{escape(label)}</rdfs:label>\n'
+            f'<skos:prefLabel xml:lang="en">{escape(label)}</skos:prefLabel>\n'
+            '</owl:Class>\n')
+    return 1 + len(parents) + 4 * len(restrictions) + 2
+
+
+def write_pizza(filename, classes=100, branching=4, toppings_per_pizza=3, individuals=0, seed=0):
+    """
+    Write a pizza-shaped ontology: a class hierarchy with restrictions and, optionally, individuals.
+    :param filename: output RDF/XML file
+    :param classes: number of pizza and topping classes, a third of them toppings
+    :param branching: subclasses per class in both hierarchies
+    :param toppings_per_pizza: hasTopping restrictions per pizza
+    :param individuals: number of named individuals typed with random pizza classes
+    :param seed: random seed
+    :return: number of triples written
+    """
+    rng = random.Random(seed)
+    toppings = [f'Topping{i}' for i in range(max(classes // 3, 1))]
+    pizzas = [f'Pizza{i}' for i in range(max(classes - len(toppings), 1))]
+    count = 0
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0"?>\n'
+                f'<rdf:RDF xmlns="{PIZZA}" xmlns:pizza="{PIZZA}" '
+                'xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#" '
+                'xmlns:owl="http://www.w3.org/2002/07/owl#" '
+                'xmlns:skos="http://www.w3.org/2004/02/skos/core#" '
+                'xmlns:rdfs="http://www.w3.org/2000/01/rdf-schema#" '
+                f'xml:base="{PIZZA[:-1]}">\n'
+                '<owl:Ontology rdf:about="http://www.co-ode.org/ontologies/pizza"/>\n')
+        count += 1
+        for prop in ('hasTopping', 'hasSpiciness'):
+            f.write(f'<owl:ObjectProperty rdf:about="{PIZZA}{prop}"/>\n')
+            count += 1
+
+        count += _class(f, 'Food', [], 'Food')
+        count += _class(f, 'Pizza', ['Food'], 'Pizza')
+        count += _class(f, 'NamedPizza', ['Pizza'], 'NamedPizza')
+        count += _class(f, 'PizzaTopping', ['Food'], 'PizzaTopping')
+        count += _class(f, 'Spiciness', [], 'Spiciness')
+        for spiciness in SPICINESS:
+            count += _class(f, spiciness, ['Spiciness'], spiciness)
+
+        # class i is a subclass of class (i - 1) // branching, the first of the root
+        for i, name in enumerate(toppings):
+            parent = toppings[(i - 1) // branching] if i else 'PizzaTopping'
+            count += _class(f, name, [parent], f'Topping {i}', [('hasSpiciness', rng.choice(SPICINESS))])
+        for i, name in enumerate(pizzas):
+            parent = pizzas[(i - 1) // branching] if i else 'NamedPizza'
+            chosen = rng.sample(toppings, min(toppings_per_pizza, len(toppings)))
+            count += _class(f, name, [parent], f'Pizza {i}', [('hasTopping', t) for t in chosen])
+
+        for i in range(individuals):
+            f.write(f'<owl:NamedIndividual rdf:about="{PIZZA}Order{i}">\n'
+                    f'<rdf:type rdf:resource="{PIZZA}{rng.choice(pizzas)}"/>\n'
+                    '</owl:NamedIndividual>\n')
+            count += 2
+        f.write('</rdf:RDF>\n')
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    shapes = parser.add_subparsers(dest='shape', required=True)
+    defi = shapes.add_parser('defi', help='daily ticker prices')
+    defi.add_argument('--tickers', type=int, default=4)
+    defi.add_argument('--days', type=int, default=182)
+    defi.add_argument('--start', default='2023-01-01')
+    pizza = shapes.add_parser('pizza', help='class hierarchy with restrictions')
+    pizza.add_argument('--classes', type=int, default=100)
+    pizza.add_argument('--branching', type=int, default=4)
+    pizza.add_argument('--toppings-per-pizza', type=int, default=3)
+    pizza.add_argument('--individuals', type=int, default=0)
+    for shape in (defi, pizza):
+        shape.add_argument('--seed', type=int, default=0)
+        shape.add_argument('--output', required=True, help='RDF/XML file to write')
+    args = parser.parse_args(argv)
+
+    if args.shape == 'defi':
+        triples = write_defi(args.output, args.tickers, args.days, args.start, args.seed)
+    else:
+        triples = write_pizza(args.output, args.classes, args.branching, args.toppings_per_pizza,
+                              args.individuals, args.seed)
+    print(f'{args.output}: {triples} triples, {os.path.getsize(args.output) / 1e6:.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+# gunicorn -c gunicorn.conf.py wsgi:server
+import multiprocessing
+import os
+
+bind = os.environ.get('SEMANTIC_WEB_BIND', '0.0.0.0:8050')
+
+# query jobs, result sessions and timing traces are shared by the workers through files under the
+# snapshot directory, so the requests polling a job or paging its result may reach any worker
+workers = int(os.environ.get('SEMANTIC_WEB_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('SEMANTIC_WEB_THREADS', 4))
+
+# import the app and map the ontology snapshots once in the master, before forking the workers
+preload_app = True
+
+# sparql queries run in job processes with their own timeout, the request itself stays short
+timeout = 120
+
+
+def post_fork(server, worker):
+    # each worker builds its views and indexes in the background, /ready reports when it is done,
+    # and watches the ontology files for changes
+    from app import start_warm_up
+    start_warm_up()
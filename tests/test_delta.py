@@ -0,0 +1,113 @@
+import os
+
+from rdflib import OWL, Graph, Literal, URIRef
+
+from utilities.delta import apply_delta, update_graph
+from utilities.ingest import SourceDocument
+from utilities.ont import build_ontology_as_rdflib_graph
+from utilities.registry import GraphRegistry
+from utilities.store import NumpyStore, OverlayStore
+
+EX = 'http://example.org/'
+
+
+def _triple(s, p, o):
+    return URIRef(EX + s), URIRef(EX + p), o if isinstance(o, Literal) else URIRef(EX + o)
+
+
+def _numpy_graph(triples):
+    graph = Graph(store=NumpyStore())
+    graph.addN((s, p, o, graph) for s, p, o in triples)
+    graph.bind('ex', EX)
+    return graph
+
+
+def test_apply_delta_leaves_numpy_graph_unchanged():
+    kept, removed, added = _triple('a', 'p', 'b'), _triple('a', 'p', 'c'), _triple('d', 'q', Literal('new'))
+    graph = _numpy_graph([kept, removed])
+    updated = apply_delta(graph, {added}, {removed})
+
+    assert updated is not graph and isinstance(updated.store, NumpyStore)
+    assert set(graph) == {kept, removed}
+    assert set(updated) == {kept, added}
+    assert len(graph.store.copy()) == 2
+    assert dict(updated.namespaces())['ex'] == URIRef(EX)
+
+
+def test_apply_delta_copy_interns_terms_separately():
+    graph = _numpy_graph([_triple('a', 'p', 'b')])
+    updated = apply_delta(graph, {_triple('x', 'p', 'y')}, set())
+    assert graph.store.term_id(URIRef(EX + 'x')) is None
+    assert list(graph.triples((URIRef(EX + 'x'), None, None))) == []
+    assert len(list(updated.triples((URIRef(EX + 'x'), None, None)))) == 1
+
+
+RDFXML = '''<?xml version="1.0"?>
+<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+         xmlns:owl="http://www.w3.org/2002/07/owl#"
+         xmlns:rdfs="http://www.w3.org/2000/01/rdf-schema#">
+  <owl:Class rdf:about="http://example.org/Pizza"/>
+  <owl:Class rdf:about="http://example.org/Margherita">
+    <rdfs:subClassOf rdf:resource="http://example.org/Pizza"/>
+    <rdfs:subClassOf>
+      <owl:Restriction>
+        <owl:onProperty rdf:resource="http://example.org/hasTopping"/>
+        <owl:someValuesFrom rdf:resource="http://example.org/%s"/>
+      </owl:Restriction>
+    </rdfs:subClassOf>
+  </owl:Class>
+  <owl:Class rdf:about="http://example.org/Topping"/>
+%s</rdf:RDF>
+'''
+
+
+def _rdfxml(topping, classes=20):
+    return RDFXML % (topping, ''.join(f'  <owl:Class rdf:about="http://example.org/C{i}"/>\n' for i in range(classes)))
+
+
+def test_update_graph_parses_only_changed_elements(tmp_path, monkeypatch):
+    source = tmp_path / 'pizza.owl'
+    source.write_text(_rdfxml('Tomato'))
+    graph = build_ontology_as_rdflib_graph(str(source))
+    source.write_text(_rdfxml('Mozzarella'))
+
+    parsed = []
+    monkeypatch.setattr(SourceDocument, 'elements', _recording(SourceDocument.elements, parsed))
+    updated, added, removed = update_graph(graph, str(source), 'application/rdf+xml')
+
+    # only the Margherita element, before and after the edit, was parsed
+    assert len(parsed) == 2 and all(len(ranges) == 1 for ranges in parsed)
+    assert (_bnode_of(updated), OWL.someValuesFrom, URIRef(EX + 'Mozzarella')) in added
+    assert (_bnode_of(graph), OWL.someValuesFrom, URIRef(EX + 'Tomato')) in removed
+    assert {s for s, _, _ in added | removed} == {URIRef(EX + 'Margherita'), _bnode_of(graph), _bnode_of(updated)}
+    assert set(updated) == set(build_ontology_as_rdflib_graph(str(source)))
+    assert len(graph) == len(updated)
+    assert isinstance(updated.store, OverlayStore)
+
+
+def test_unchanged_triples_keep_the_version(tmp_path):
+    source = tmp_path / 'pizza.owl'
+    source.write_text(_rdfxml('Tomato'))
+    registry = GraphRegistry(build_ontology_as_rdflib_graph, updater=update_graph)
+    entry = registry.entry(str(source))
+
+    # reformatted, the same triples
+    source.write_text(_rdfxml('Tomato').replace('<rdf:RDF ', '<rdf:RDF  '))
+    os.utime(source, ns=(1, 1))
+    assert registry.entry(str(source)).version == entry.version
+
+    source.write_text(_rdfxml('Mozzarella'))
+    os.utime(source, ns=(2, 2))
+    assert registry.entry(str(source)).version != entry.version
+    assert registry.stats()['loads'] == 1 and registry.stats()['updates'] == 1
+
+
+def _recording(elements, parsed):
+    def wrapper(self, ranges):
+        parsed.append(ranges)
+        return elements(self, ranges)
+    return wrapper
+
+
+def _bnode_of(graph):
+    return next(graph.subjects(OWL.onProperty, URIRef(EX + 'hasTopping')))
@@ -0,0 +1,52 @@
+import time
+
+from utilities.jobs import CANCELLED, DONE, QUEUED, RUNNING, TIMEOUT, JobRunner
+
+
+def _sleep(seconds, progress):
+    progress('sleeping')
+    time.sleep(seconds)
+    return seconds
+
+
+def _wait(predicate, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+def test_timeout_enforced_without_polls():
+    runner = JobRunner(max_workers=1, timeout=0.5)
+    job_id = runner.submit(_sleep, 60)
+    job = runner._jobs[job_id]
+    # nobody polls: the monitor thread kills the process
+    _wait(lambda: job.status == TIMEOUT)
+    assert not job.process.is_alive()
+    _wait(lambda: runner._monitor is None)
+
+
+def test_result_and_cancel():
+    runner = JobRunner(max_workers=2, timeout=30)
+    done_id, cancelled_id = runner.submit(_sleep, 0.1), runner.submit(_sleep, 60)
+    _wait(lambda: runner._jobs[done_id].status == DONE)
+    assert runner.poll(done_id).result == 0.1
+    assert runner.cancel(cancelled_id).status == CANCELLED
+    runner.shutdown()
+
+
+def test_job_shared_between_runners(tmp_path):
+    # two gunicorn workers: the second polls and cancels the jobs the first runs
+    owner = JobRunner(max_workers=2, timeout=30, directory=tmp_path)
+    other = JobRunner(max_workers=2, timeout=30, directory=tmp_path)
+    done_id, cancelled_id = owner.submit(_sleep, 0.1), owner.submit(_sleep, 60)
+    _wait(lambda: other.poll(done_id).status == DONE)
+    assert other.poll(done_id).result == 0.1
+    assert other.poll(cancelled_id).status in (QUEUED, RUNNING)
+    other.cancel(cancelled_id)
+    # the owner's monitor thread kills the process
+    _wait(lambda: owner._jobs[cancelled_id].status == CANCELLED)
+    assert other.poll(cancelled_id).status == CANCELLED
+    assert other.poll('unknown') is None
+    owner.shutdown()
+    assert other.poll(done_id) is None
@@ -0,0 +1,56 @@
+import base64
+import os
+
+import numpy as np
+import pytest
+from packaging.requirements import Requirement
+from packaging.version import Version
+
+from utilities import payload
+from utilities.payload import TYPED_ARRAYS_SINCE, compact_figure, plotly_js_version, typed_arrays_supported
+
+REQUIREMENTS = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'requirements.txt')
+
+
+def _figure():
+    dates = np.array(['2023-01-01', '2023-01-02'], dtype='datetime64[ns]')
+    return {'data': [{'x': dates, 'y': np.array([1.5, 2.5])}], 'layout': {}}
+
+
+def _pinned(package):
+    with open(REQUIREMENTS) as f:
+        for line in f:
+            line = line.split('#')[0].strip()
+            if line and Requirement(line).name == package:
+                return Requirement(line)
+    return None
+
+
+def test_typed_arrays():
+    figure = compact_figure(_figure(), typed_arrays=True)
+    y = figure['data'][0]['y']
+    assert y['dtype'] == 'f8'
+    assert np.frombuffer(base64.b64decode(y['bdata']), '<f8').tolist() == [1.5, 2.5]
+    assert figure['layout']['xaxis']['type'] == 'date'
+
+
+def test_plain_lists_for_old_plotly_js(monkeypatch):
+    monkeypatch.setattr(payload, 'plotly_js_version', lambda: (2, 18, 0))
+    assert not typed_arrays_supported()
+    figure = compact_figure(_figure())
+    trace = figure['data'][0]
+    assert [str(d.date()) for d in trace['x']] == ['2023-01-01', '2023-01-02']
+    assert trace['y'] == [1.5, 2.5]
+    assert figure['layout']['xaxis']['type'] == 'date'
+
+
+def test_pinned_dash_bundle_version():
+    dash = pytest.importorskip('dash')
+    pinned = _pinned('dash')
+    if pinned is None or Version(dash.__version__) not in pinned.specifier:
+        pytest.skip(f'dash {dash.__version__} is not the pinned {pinned}')
+    # dash 2.8 bundles plotly.js 2.18, charts are then sent as lists
+    version = plotly_js_version()
+    assert version is not None
+    y = compact_figure(_figure())['data'][0]['y']
+    assert isinstance(y, dict) == (version >= TYPED_ARRAYS_SINCE)
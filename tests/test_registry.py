@@ -0,0 +1,33 @@
+from pathlib import Path
+
+from rdflib import Graph, URIRef
+
+from utilities.registry import GraphRegistry
+
+
+def _registry(tmp_path):
+    source = tmp_path / 'ontology.ttl'
+    source.write_text('<http://example.org/a> <http://example.org/p> <http://example.org/b> .\n')
+
+    def loader(endpoint, fmt):
+        graph = Graph()
+        graph.parse(endpoint, format=fmt)
+        return graph
+
+    return GraphRegistry(loader), source
+
+
+def test_invalidate_normalizes_endpoint(tmp_path):
+    registry, source = _registry(tmp_path)
+    registry.get(str(source), 'turtle')
+    assert registry.invalidate(Path(source)) == 1
+    registry.get(str(source), 'turtle')
+    assert registry.invalidate(URIRef(str(source))) == 1
+    assert registry.stats()['loads'] == 2
+
+
+def test_invalidate_other_endpoint(tmp_path):
+    registry, source = _registry(tmp_path)
+    registry.get(source, 'turtle')
+    assert registry.invalidate(Path(tmp_path / 'other.ttl')) == 0
+    assert registry.invalidate() == 1
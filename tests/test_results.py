@@ -0,0 +1,51 @@
+import numpy as np
+from rdflib import Graph
+
+from utilities.results import query_results_to_dataframe, table_columns
+
+GRAPH = '''
+@prefix ex: <http://example.org/> .
+@prefix xsd: <http://www.w3.org/2001/XMLSchema#> .
+ex:a ex:at "2023-01-02T03:04:05"^^xsd:dateTime ; ex:on "2023-01-02"^^xsd:date .
+ex:b ex:at "2023-01-02T03:04:05.250+02:00"^^xsd:dateTime ; ex:on "2023-01-03"^^xsd:date .
+ex:c ex:at "2023-01-03T00:00:00Z"^^xsd:dateTime ; ex:on "2023-01-04"^^xsd:date .
+'''
+
+
+def _dataframe():
+    graph = Graph().parse(data=GRAPH, format='turtle')
+    return query_results_to_dataframe(graph.query(
+        'SELECT ?s ?at ?on WHERE { ?s <http://example.org/at> ?at ; <http://example.org/on> ?on } ORDER BY ?s'))
+
+
+def test_datetime_column_kind():
+    dataframe = _dataframe()
+    assert dataframe['at'].dtype.kind == 'M'
+    assert dataframe['on'].dtype.kind == 'M'
+    assert [c['type'] for c in table_columns(dataframe)] == ['text', 'datetime', 'datetime']
+
+
+def test_datetime_values_in_utc():
+    expected = np.array(['2023-01-02T03:04:05', '2023-01-02T01:04:05.250', '2023-01-03T00:00'], dtype='datetime64[ms]')
+    assert (_dataframe()['at'].to_numpy() == expected).all()
+
+
+def _column(turtle_objects):
+    graph = Graph().parse(data='@prefix ex: <http://example.org/> .\n@prefix xsd: <http://www.w3.org/2001/XMLSchema#> .\n'
+                          + ''.join(f'ex:s{i} ex:v {o} .\n' for i, o in enumerate(turtle_objects)), format='turtle')
+    dataframe = query_results_to_dataframe(graph.query(
+        'SELECT ?s ?v WHERE { ?s <http://example.org/v> ?v } ORDER BY ?s'))
+    return dataframe['v']
+
+
+def test_integer_beyond_int64_is_text():
+    column = _column(['"1"^^xsd:integer', '"123456789012345678901234567890"^^xsd:integer'])
+    assert column.dtype.kind not in 'iufM'
+    assert column.tolist() == ['1', '123456789012345678901234567890']
+
+
+def test_ill_typed_literal_is_text():
+    column = _column(['"1"^^xsd:integer', '"abc"^^xsd:integer'])
+    assert column.dtype.kind not in 'iufM'
+    assert column.tolist() == ['1', 'abc']
+    assert _column(['"2.5"^^xsd:decimal', '"abc"^^xsd:decimal']).tolist() == ['2.5', 'abc']
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+from utilities.sessions import ResultSessionStore
+
+
+def _dataframe(rows=60):
+    dataframe = pd.DataFrame({
+        'date': pd.date_range('2023-01-01', periods=rows).to_numpy(),
+        'price': np.arange(rows, dtype=np.float64),
+    })
+    dataframe.attrs['date_columns'] = ['date']
+    return dataframe
+
+
+def test_csv_exports_every_row_in_view_order():
+    store = ResultSessionStore()
+    session_id = store.create(_dataframe())
+    records, page_count = store.page(session_id, 0, 25)
+    assert len(records) == 25 and page_count == 3
+
+    lines = store.csv(session_id, [{'column_id': 'price', 'direction': 'desc'}], '{price} >= 10').splitlines()
+    assert lines[0] == 'date,price'
+    assert len(lines) == 51
+    assert lines[1] == '2023-03-01,59.0'
+    assert lines[-1] == '2023-01-11,10.0'
+
+
+def test_csv_of_missing_session():
+    assert ResultSessionStore().csv('unknown') is None
+
+
+def test_session_shared_between_stores(tmp_path):
+    # two gunicorn workers: the second pages a result the first created
+    first, second = ResultSessionStore(directory=tmp_path), ResultSessionStore(directory=tmp_path)
+    session_id = first.create(_dataframe())
+    records, page_count = second.page(session_id, 2, 25)
+    assert len(records) == 10 and page_count == 3
+    assert second.csv(session_id).splitlines()[1] == '2023-01-01,0.0'
+    assert second.get('../' + session_id) is None
@@ -0,0 +1,43 @@
+from decimal import Decimal
+
+import numpy as np
+from rdflib import Graph
+
+from utilities.timeseries import TimeSeriesIndex, round_half_up
+
+GRAPH = '''
+@prefix ns1: <http://example.org/defi#> .
+@prefix xsd: <http://www.w3.org/2001/XMLSchema#> .
+ns1:o1 ns1:BTC_date "2023-01-01"^^xsd:date ; ns1:BTC_price "1.005"^^xsd:decimal .
+ns1:o2 ns1:BTC_date "2023-01-02"^^xsd:date ; ns1:BTC_price "0.285"^^xsd:decimal .
+'''
+
+
+def test_round_half_up_decimal():
+    # binary floating point rounds these down, the decimal sparql ROUND rounds them up
+    values = np.array([Decimal('1.005'), Decimal('0.285')], dtype=object)
+    assert round_half_up(values, 2).tolist() == [1.01, 0.29]
+
+
+def test_round_half_up_halves_towards_positive_infinity():
+    values = np.array([Decimal('2.5'), Decimal('-2.5'), Decimal('-2.51'), 0.5], dtype=object)
+    assert round_half_up(values, 0).tolist() == [3.0, -2.0, -3.0, 1.0]
+
+
+def test_index_rounds_decimal_prices():
+    index = TimeSeriesIndex(Graph().parse(data=GRAPH, format='turtle'))
+    dates, (prices,) = index.aligned(['BTC'], '2023-01-01', '2023-01-02')
+    assert dates.tolist() == list(np.array(['2023-01-01', '2023-01-02'], dtype='datetime64[D]'))
+    assert round_half_up(prices, 2).tolist() == [1.01, 0.29]
+
+
+def test_unparsable_series_left_to_sparql():
+    graph = Graph().parse(data=GRAPH + '''
+@prefix ex: <http://example.org/> .
+ex:t1 ex:trade_date "01/02/2023" ; ex:trade_price "12.5"^^xsd:decimal .
+ex:q1 ex:quote_date "2023-01-02"^^xsd:date ; ex:quote_price "n/a" .
+''', format='turtle')
+    index = TimeSeriesIndex(graph)
+    assert 'BTC' in index and index.supports(['BTC'])
+    assert 'trade' not in index and not index.supports(['trade'])
+    assert 'quote' not in index and not index.supports(['quote'])
@@ -0,0 +1,160 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache with an optional byte budget,
+    entry limit and time-to-live.
+    """
+
+    def __init__(self, max_bytes=None, max_entries=None, ttl=None, sizeof=None, sliding=False):
+        """
+        :param max_bytes: total size budget in bytes, None for unbounded
+        :param max_entries: maximum number of entries, None for unbounded
+        :param ttl: seconds after which an entry expires, None for never
+        :param sizeof: callable returning the size in bytes of a value
+        :param sliding: restart the ttl of an entry every time it is read
+        """
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.sliding = sliding
+        self.sizeof = sizeof or sys.getsizeof
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._lookup(key) is not None
+
+    def get(self, key, default=None):
+        """
+        Return the value cached under a key and mark it as recently used.
+        :param key: cache key
+        :param default: value returned on a miss
+        :return: cached value or default
+        """
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            if self.sliding:
+                self._entries[key] = (entry[0], entry[1], time.monotonic())
+            return entry[0]
+
+    def peek(self, key, default=None):
+        """
+        Return the value cached under a key without touching recency or counters.
+        :param key: cache key
+        :param default: value returned on a miss
+        :return: cached value or default
+        """
+        with self._lock:
+            entry = self._lookup(key)
+            return default if entry is None else entry[0]
+
+    def put(self, key, value, size=None):
+        """
+        Cache a value, evicting least-recently-used entries to stay within budget.
+        :param key: cache key
+        :param value: value
+        :param size: size of the value in bytes, computed with sizeof when omitted
+        :return: None
+        """
+        if size is None:
+            size = self.sizeof(value)
+        with self._lock:
+            self.pop(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._entries[key] = (value, size, time.monotonic())
+            self._bytes += size
+            self._evict()
+
+    def pop(self, key, default=None):
+        """
+        Remove a key from the cache.
+        :param key: cache key
+        :param default: value returned when the key is absent
+        :return: removed value or default
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return default
+            self._bytes -= entry[1]
+            return entry[0]
+
+    def invalidate(self, predicate=None):
+        """
+        Remove every entry whose key satisfies a predicate.
+        :param predicate: callable taking a key, None to remove everything
+        :return: number of entries removed
+        """
+        with self._lock:
+            keys = [k for k in self._entries if predicate is None or predicate(k)]
+            for k in keys:
+                self.pop(k)
+            return len(keys)
+
+    def clear(self):
+        self.invalidate()
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries)
+
+    def stats(self):
+        """
+        Return hit/miss counters and current occupancy.
+        :return: dictionary of statistics
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and self.ttl is not None and time.monotonic() - entry[2] > self.ttl:
+            self.pop(key)
+            self.evictions += 1
+            return None
+        return entry
+
+    def expire(self):
+        """
+        Remove every entry whose ttl has elapsed.
+        :return: number of entries removed
+        """
+        with self._lock:
+            expired = [k for k in list(self._entries) if self._lookup(k) is None]
+            return len(expired)
+
+    def _evict(self):
+        while self._entries and (
+                (self.max_bytes is not None and self._bytes > self.max_bytes) or
+                (self.max_entries is not None and len(self._entries) > self.max_entries)):
+            _, (_, size, _) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
@@ -0,0 +1,190 @@
+import numpy as np
+import pandas as pd
+
+# plot width assumed until the browser reports it, in pixels
+DEFAULT_WIDTH = 800
+
+# bounds of the number of points drawn per trace
+MIN_POINTS = 100
+MAX_POINTS = 5000
+
+# above this many points in a figure the traces are drawn with WebGL
+WEBGL_THRESHOLD = 2000
+
+DOWNSAMPLERS = ('lttb', 'minmax')
+
+
+def target_points(width=None, method='lttb'):
+    """
+    Return the number of points worth drawing per trace for a plot width:
+    one per pixel with LTTB, a minimum and a maximum per pixel with min/max buckets.
+    :param width: plot width in pixels, DEFAULT_WIDTH when None
+    :param method: 'lttb' or 'minmax'
+    :return: number of points
+    """
+    points = int(width or DEFAULT_WIDTH) * (2 if method == 'minmax' else 1)
+    return min(max(points, MIN_POINTS), MAX_POINTS)
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets downsampling: keep the first and last points and,
+    in each bucket, the point forming the largest triangle with the point kept in the
+    previous bucket and the average of the next bucket.
+    :param x: numeric array, sorted
+    :param y: numeric array without NaN
+    :param n_out: number of points to keep
+    :return: array of kept positions
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    # average point of each bucket, the last bucket being followed by the last point
+    sums_x = np.add.reduceat(x[:n - 1], edges[:-1])
+    sums_y = np.add.reduceat(y[:n - 1], edges[:-1])
+    counts = np.diff(edges)
+    avg_x = np.append(sums_x / counts, x[-1])
+    avg_y = np.append(sums_y / counts, y[-1])
+
+    kept = np.empty(n_out, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        bx, by = x[lo:hi], y[lo:hi]
+        area = np.abs((x[a] - avg_x[i + 1]) * (by - y[a]) - (x[a] - bx) * (avg_y[i + 1] - y[a]))
+        a = lo + int(np.argmax(area))
+        kept[i + 1] = a
+    return kept
+
+
+def minmax_indices(y, n_out):
+    """
+    Min/max bucket downsampling: keep the lowest and highest point of each of n_out / 2 equal buckets.
+    :param y: numeric array without NaN
+    :param n_out: number of points to keep
+    :return: array of kept positions, sorted
+    """
+    n = len(y)
+    buckets = n_out // 2
+    if n_out >= n or buckets < 1:
+        return np.arange(n)
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    rows = ~np.all(np.isnan(padded), axis=1)
+    offsets = np.arange(buckets)[rows] * size
+    lows = offsets + np.nanargmin(padded[rows], axis=1)
+    highs = offsets + np.nanargmax(padded[rows], axis=1)
+    return np.unique(np.concatenate((lows, highs)))
+
+
+def downsample(x, y, n_out, method='lttb'):
+    """
+    Return the positions of the points of a series worth drawing.
+    :param x: x values, numbers or datetime64, sorted
+    :param y: y values
+    :param n_out: number of points to keep
+    :param method: 'lttb' or 'minmax'
+    :return: array of positions
+    """
+    if method == 'minmax':
+        return minmax_indices(y, n_out)
+    return lttb_indices(_numeric(x), y, n_out)
+
+
+def _numeric(values):
+    values = np.asarray(values)
+    if values.dtype.kind == 'M':
+        return values.astype('datetime64[ns]').astype(np.int64).astype(np.float64)
+    return values.astype(np.float64)
+
+
+def chart_axes(dataframe):
+    """
+    Return the x column and the numeric y columns charted for a query result: the
+    date column against every numeric column, or the first column when there is no date.
+    :param dataframe: dataframe of typed columns
+    :return: (x column name or None, list of y column names)
+    """
+    columns = list(dataframe.columns)
+    if not columns:
+        return None, []
+    dates = [c for c in columns if dataframe[c].dtype.kind == 'M']
+    x = dates[0] if dates else columns[0]
+    ys = [c for c in columns if c != x and dataframe[c].dtype.kind in 'iuf']
+    return x, ys
+
+
+def relayout_range(relayout_data):
+    """
+    Return the x range a chart was zoomed to.
+    :param relayout_data: dcc.Graph relayoutData
+    :return: (start, end), None when the chart shows its full range, or False when the x axis did not change
+    """
+    if not relayout_data:
+        return False
+    if relayout_data.get('xaxis.autorange'):
+        return None
+    if 'xaxis.range[0]' in relayout_data:
+        return relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']
+    if 'xaxis.range' in relayout_data:
+        return tuple(relayout_data['xaxis.range'])
+    return False
+
+
+def _bound(x, value):
+    if x.dtype.kind == 'M':
+        return pd.Timestamp(value).to_datetime64()
+    return float(value)
+
+
+def build_figure(dataframe, x_range=None, width=None, method='lttb', revision=None):
+    """
+    Return a line chart of a query result with every series downsampled to the plot width.
+    Only the points of a zoomed range are drawn, and the traces switch to WebGL above WEBGL_THRESHOLD points.
+    :param dataframe: dataframe of typed columns
+    :param x_range: (start, end) of the zoomed x axis, None for the full range
+    :param width: plot width in pixels
+    :param method: 'lttb' or 'minmax'
+    :param revision: plotly uirevision, keeps the user's zoom while the figure is refreshed
+    :return: plotly figure dictionary
+    """
+    layout = {"title": "Results", "dragmode": "zoom", "showlegend": True, "autosize": True,
+              "uirevision": revision}
+    x_name, y_names = chart_axes(dataframe)
+    if x_name is None or not y_names:
+        return dict(data=[], layout=layout)
+
+    x = dataframe[x_name].to_numpy()
+    order = None
+    if len(x) > 1 and x.dtype.kind in 'iufM' and not np.all(x[1:] >= x[:-1]):
+        order = np.argsort(x, kind='stable')
+        x = x[order]
+    lo, hi = 0, len(x)
+    if x_range is not None and x.dtype.kind in 'iufM':
+        lo = int(np.searchsorted(x, _bound(x, x_range[0]), side='left'))
+        hi = int(np.searchsorted(x, _bound(x, x_range[1]), side='right'))
+        layout['xaxis'] = {'range': list(x_range)}
+
+    n_out = target_points(width, method)
+    traces = []
+    for name in y_names:
+        y = dataframe[name].to_numpy(dtype=np.float64, na_value=np.nan)
+        if order is not None:
+            y = y[order]
+        xs, ys = x[lo:hi], y[lo:hi]
+        valid = ~np.isnan(ys)
+        if not valid.all():
+            xs, ys = xs[valid], ys[valid]
+        if x.dtype.kind in 'iufM':
+            kept = downsample(xs, ys, n_out, method)
+            xs, ys = xs[kept], ys[kept]
+        traces.append(dict(type="scatter", mode="lines", x=xs, y=ys, name=name))
+
+    if sum(len(t['x']) for t in traces) > WEBGL_THRESHOLD:
+        for trace in traces:
+            trace['type'] = "scattergl"
+    return dict(data=traces, layout=layout)
@@ -0,0 +1,251 @@
+import os
+import pathlib
+from collections import defaultdict
+
+from rdflib import BNode, Graph
+
+from utilities.ingest import RDFXML_FORMATS, SourceDocument, iter_rdfxml_batches, source_documents
+from utilities.store import NumpyStore, OverlayStore, SnapshotStore
+
+# rounds of blank node key refinement, one level of nesting each
+MAX_ROUNDS = 32
+
+# above this share of changed triples a full reload is cheaper than a delta
+MAX_DELTA_RATIO = 0.5
+
+
+def read_triples(endpoint, fmt, namespaces=None, document=None):
+    """
+    Return the triples of an ontology source without building a store.
+    :param endpoint: ontology endpoint
+    :param fmt: ontology format
+    :param namespaces: dictionary filled with the prefixes declared by the source
+    :param document: SourceDocument of an RDF/XML file already read, its triple count is set
+    :return: set of triples
+    """
+    if fmt in RDFXML_FORMATS:
+        triples = []
+        data = None if document is None else document.data
+        for batch in iter_rdfxml_batches(endpoint, namespaces=namespaces, data=data):
+            triples.extend(batch)
+        if document is not None:
+            document.triples = len(triples)
+        return set(triples)
+    graph = Graph()
+    graph.parse(endpoint, format=fmt)
+    if namespaces is not None:
+        namespaces.update((prefix, str(namespace)) for prefix, namespace in graph.namespaces())
+    return set(graph)
+
+
+def _refine(edges):
+    """
+    Hash every blank node by its edges, replacing the blank nodes at the other end by
+    their own hashes, for as many rounds as it takes the hashes to stop splitting.
+    :param edges: dictionary of blank node to list of (predicate, term at the other end)
+    :return: dictionary of blank node to hash
+    """
+    # the edges to named terms and literals hash the same every round, only the blank node ends change
+    fixed, nested = {}, {}
+    for b, terms in edges.items():
+        fixed[b] = hash(tuple(sorted(hash((p, t)) for p, t in terms if not isinstance(t, BNode))))
+        nested[b] = [(p, t) for p, t in terms if isinstance(t, BNode)]
+    keys = fixed
+    distinct = len(set(keys.values()))
+    for _ in range(MAX_ROUNDS):
+        keys = {
+            b: hash((fixed[b], tuple(sorted(hash((p, keys[t])) for p, t in nested[b])))) if nested[b] else fixed[b]
+            for b in edges
+        }
+        # hashes only split further while nesting is deeper than the rounds so far
+        if len(set(keys.values())) == distinct:
+            break
+        distinct = len(set(keys.values()))
+    return keys
+
+
+def bnode_keys(triples):
+    """
+    Return a structural key for every blank node: a hash of its outgoing predicates and
+    objects, with nested blank nodes replaced by their own keys. Blank nodes with equal
+    keys describe the same structure, e.g. the same owl:Restriction or rdf:List.
+    Keys are only comparable within one process, like the hashes of terms they build on.
+    :param triples: iterable of triples
+    :return: dictionary of blank node to (key, context), where the context hashes the
+        incoming edges and tells apart equal structures used in different places
+    """
+    outgoing, incoming = defaultdict(list), defaultdict(list)
+    for s, p, o in triples:
+        if isinstance(s, BNode):
+            outgoing[s].append((p, o))
+            incoming.setdefault(s, [])
+        if isinstance(o, BNode):
+            incoming[o].append((p, s))
+            outgoing.setdefault(o, [])
+    keys, contexts = _refine(outgoing), _refine(incoming)
+    return {b: (keys[b], contexts[b]) for b in keys}
+
+
+def match_bnodes(old, new):
+    """
+    Pair the blank nodes of two versions of a graph by structural key.
+    Pairing any two blank nodes with equal keys is correct, since they are
+    interchangeable; ties are broken by context, so the pairing keeps the delta small.
+    :param old: set of triples of the loaded graph
+    :param new: set of triples of the changed source
+    :return: dictionary of new blank node to old blank node
+    """
+    def groups(triples):
+        grouped = defaultdict(list)
+        for b, (key, context) in bnode_keys(triples).items():
+            grouped[key].append((context, str(b), b))
+        return {key: [b for *_, b in sorted(bnodes)] for key, bnodes in grouped.items()}
+
+    old_groups = groups(old)
+    mapping = {}
+    for key, bnodes in groups(new).items():
+        mapping.update(zip(bnodes, old_groups.get(key, ())))
+    return mapping
+
+
+def graph_delta(old, new, match=True):
+    """
+    Return the triples to add to and remove from one version of a graph to get the other.
+    Applying the delta to old gives a graph isomorphic to new.
+    :param old: set of triples of the loaded graph
+    :param new: set of triples of the changed source
+    :param match: pair the blank nodes by structure, needed unless the parser labels the
+        blank nodes of unchanged parts of the source as before
+    :return: (added, removed) sets of triples
+    """
+    if match and any(isinstance(t, BNode) for triple in new for t in triple):
+        mapping = match_bnodes(old, new)
+        # unmatched blank nodes keep their fresh parser ids, which the old graph never uses
+        new = {tuple(mapping.get(t, t) for t in triple) for triple in new}
+    return new - old, old - new
+
+
+def document_delta(old, new, graph):
+    """
+    Return the delta between a graph and an edited version of the RDF/XML file it was parsed
+    from, parsing only the top-level elements that differ: the elements only in the edited
+    file give the additions, the elements only in the old one the removals.
+    :param old: SourceDocument the graph was parsed from
+    :param new: SourceDocument of the edited file, its triple count is set
+    :param graph: graph parsed from old, possibly updated since with deltas of the same file
+    :return: (added, removed) sets of triples, or None when the files must be compared whole,
+        e.g. when their prologs differ or a triple is asserted by more than one element
+    """
+    old_layout, new_layout = old.layout(), new.layout()
+    # with every triple asserted once, the triples of the removed elements are in no other element
+    if old_layout is None or new_layout is None or old.triples != len(graph):
+        return None
+    if old.data[:old_layout[0]] != new.data[:new_layout[0]] or old.data[old_layout[1]:] != new.data[new_layout[1]:]:
+        return None
+
+    unchanged = defaultdict(list)
+    for a, b in old_layout[2]:
+        unchanged[old.data[a:b]].append((a, b))
+    changed = []
+    for a, b in new_layout[2]:
+        ranges = unchanged.get(new.data[a:b])
+        if ranges:
+            ranges.pop()
+        else:
+            changed.append((a, b))
+    vanished = sorted(r for ranges in unchanged.values() for r in ranges)
+
+    removed_triples = old.elements(vanished) if vanished else []
+    added_triples = new.elements(changed) if changed else []
+    removed, added = set(removed_triples), set(added_triples)
+    # blank nodes of an element parsed alone are labelled as in the whole file unless an equal element
+    # comes first, and an added triple already in the graph would be asserted twice
+    if len(removed) != len(removed_triples) or not all(t in graph for t in removed):
+        return None
+    added, removed = added - removed, removed - added
+    if any(t in graph for t in added):
+        return None
+    new.triples = old.triples - len(removed_triples) + len(added_triples)
+    return added, removed
+
+
+def apply_delta(graph, added, removed):
+    """
+    Return a new version of a graph with a delta applied, leaving the graph unchanged, so
+    queries running on it keep seeing the old version until the registry swaps in the new
+    one. Neither copies the unchanged triples: a NumpyStore gets new index arrays merged
+    from the old ones and the delta, any other store an OverlayStore over the graph.
+    :param graph: rdflib graph
+    :param added: triples to add
+    :param removed: triples to remove
+    :return: updated graph
+    """
+    if isinstance(graph.store, NumpyStore):
+        graph = Graph(store=graph.store.copy(), identifier=graph.identifier)
+        for triple in removed:
+            graph.remove(triple)
+        graph.addN((s, p, o, graph) for s, p, o in added)
+        return graph
+    if isinstance(graph.store, OverlayStore):
+        store = graph.store.updated(added, removed)
+    else:
+        store = OverlayStore(graph, added, removed, graph.identifier)
+    return Graph(store=store, identifier=graph.identifier)
+
+
+def _delta_base_size(graph):
+    # an overlay is compacted by a reload once its combined delta outgrows the base
+    if isinstance(graph.store, OverlayStore):
+        return len(graph.store.base), len(graph.store.added) + len(graph.store.removed)
+    return len(graph), 0
+
+
+def update_graph(graph, endpoint, fmt, **kwargs):
+    """
+    Bring a loaded graph up to date with its changed source by applying only the triple delta.
+    An RDF/XML file the graph was ingested from with keep_source is compared element by element
+    and only the changed elements are parsed; other sources are parsed whole and compared triple
+    by triple.
+    :param graph: loaded graph
+    :param endpoint: ontology endpoint
+    :param fmt: ontology format
+    :param kwargs: load options of the graph, unused
+    :return: (graph, added, removed), the same graph with empty sets when the triples did not
+        change, or None when a full reload is needed
+    """
+    if isinstance(graph.store, SnapshotStore):
+        # snapshots are read-only and shared between processes
+        return None
+    namespaces, document, delta = {}, None, None
+    if fmt in RDFXML_FORMATS and os.path.isfile(endpoint):
+        document = SourceDocument(endpoint, pathlib.Path(endpoint).read_bytes(), None)
+        loaded = source_documents.get(graph.store)
+        if loaded is not None:
+            delta = document_delta(loaded, document, graph)
+        if delta is not None:
+            namespaces = document.layout()[3]
+    if delta is None:
+        new = read_triples(endpoint, fmt, namespaces, document)
+        # the streaming RDF/XML parser labels the blank nodes of unchanged elements as before
+        delta = graph_delta(set(graph), new, match=document is None)
+    added, removed = delta
+
+    if not added and not removed:
+        _keep_document(graph, graph, document)
+        return graph, added, removed
+    base_size, overlay_size = _delta_base_size(graph)
+    if overlay_size + len(added) + len(removed) > MAX_DELTA_RATIO * max(base_size, 1):
+        return None
+    updated = apply_delta(graph, added, removed)
+    for prefix, namespace in namespaces.items():
+        updated.bind(prefix, namespace, override=False)
+    _keep_document(graph, updated, document)
+    return updated, added, removed
+
+
+def _keep_document(graph, updated, document):
+    if document is None:
+        return
+    if updated is not graph:
+        source_documents.pop(graph.store, None)
+    source_documents[updated.store] = document
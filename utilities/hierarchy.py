@@ -0,0 +1,294 @@
+import contextlib
+import contextvars
+from collections import defaultdict
+
+from rdflib import OWL, RDF, RDFS, URIRef
+from rdflib.paths import AlternativePath, InvPath, MulPath, OneOrMore, SequencePath, ZeroOrMore
+from rdflib.plugins.sparql.parserutils import CompValue
+
+# predicates whose changes invalidate a hierarchy
+HIERARCHY_PREDICATES = (RDFS.subClassOf, RDF.type)
+
+# types of the declared classes listed as roots of the tree view
+CLASS_TYPES = (OWL.Class, RDFS.Class)
+
+# the hierarchy of the graph being queried, None when paths are evaluated by rdflib
+_active = contextvars.ContextVar('hierarchy', default=None)
+
+
+def _members(bits):
+    """
+    Return the positions of the set bits of an integer, lowest first.
+    """
+    positions = []
+    while bits:
+        low = bits & -bits
+        positions.append(low.bit_length() - 1)
+        bits ^= low
+    return positions
+
+
+def _closure(successors):
+    """
+    Return the nodes reachable in one or more steps from every node of a directed graph, as
+    bitsets. Strongly connected components are found with Tarjan's algorithm, which completes
+    them successors first, so each component's closure is the union of its successors'.
+    :param successors: list, per node, of the positions of its successors
+    :return: list of integers, bit i set when node i is reachable
+    """
+    n = len(successors)
+    index, low, on_stack = [None] * n, [0] * n, [False] * n
+    reach = [0] * n
+    stack, counter = [], 0
+    for root in range(n):
+        if index[root] is not None:
+            continue
+        work = [(root, 0)]
+        while work:
+            v, i = work.pop()
+            if i == 0:
+                index[v] = low[v] = counter
+                counter += 1
+                stack.append(v)
+                on_stack[v] = True
+            else:
+                # the successor visited before this resumption has been completed
+                low[v] = min(low[v], low[successors[v][i - 1]])
+            for j in range(i, len(successors[v])):
+                w = successors[v][j]
+                if index[w] is None:
+                    work.append((v, j + 1))
+                    work.append((w, 0))
+                    break
+                if on_stack[w]:
+                    low[v] = min(low[v], index[w])
+            else:
+                if low[v] != index[v]:
+                    continue
+                component = []
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = False
+                    component.append(w)
+                    if w == v:
+                        break
+                bits = 0
+                for w in component:
+                    bits |= 1 << w
+                reached = 0
+                for w in component:
+                    for x in successors[w]:
+                        reached |= (1 << x) | reach[x]
+                # the members of a cycle reach each other and themselves
+                if len(component) > 1:
+                    reached |= bits
+                for w in component:
+                    reach[w] = reached
+    return reach
+
+
+class ClassHierarchy:
+    """
+    Transitive closure of the rdfs:subClassOf relation of a graph, with the rdf:type
+    instances of every class.
+
+    Every class has a bit position; its ancestors and descendants are integer bitsets, so
+    subsumption is a bit test and listing k ancestors or descendants takes O(k) bit operations.
+    """
+
+    def __init__(self, graph):
+        self.index = {}
+        self.nodes = []
+        self.parents = defaultdict(set)
+        self.children = defaultdict(set)
+        self.instances = defaultdict(set)
+        for s, _, o in graph.triples((None, RDFS.subClassOf, None)):
+            self._position(s)
+            self._position(o)
+            self.parents[s].add(o)
+            self.children[o].add(s)
+        for s, _, o in graph.triples((None, RDF.type, None)):
+            self.instances[o].add(s)
+        self.ancestors = _closure([[self.index[p] for p in self.parents[c]] for c in self.nodes])
+        self.descendants = _closure([[self.index[c] for c in self.children[p]] for p in self.nodes])
+
+    def _position(self, node):
+        if node not in self.index:
+            self.index[node] = len(self.nodes)
+            self.nodes.append(node)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def superclasses(self, node, reflexive=False):
+        """
+        Return the transitive superclasses of a class.
+        :param node: class
+        :param reflexive: include the class itself, as rdfs:subClassOf* does
+        :return: list of classes
+        """
+        return self._related(self.ancestors, node, reflexive)
+
+    def subclasses(self, node, reflexive=False):
+        """
+        Return the transitive subclasses of a class.
+        :param node: class
+        :param reflexive: include the class itself, as rdfs:subClassOf* does
+        :return: list of classes
+        """
+        return self._related(self.descendants, node, reflexive)
+
+    def _related(self, closure, node, reflexive):
+        i = self.index.get(node)
+        if i is None:
+            return [node] if reflexive else []
+        related = [self.nodes[j] for j in _members(closure[i])]
+        if reflexive and not (closure[i] >> i) & 1:
+            related.insert(0, node)
+        return related
+
+    def is_subclass(self, sub, sup, reflexive=False):
+        """
+        Return whether a class is a transitive subclass of another.
+        :param sub: class
+        :param sup: class
+        :param reflexive: a class is a subclass of itself, as with rdfs:subClassOf*
+        :return: bool
+        """
+        if reflexive and sub == sup:
+            return True
+        i, j = self.index.get(sub), self.index.get(sup)
+        return i is not None and j is not None and bool((self.ancestors[i] >> j) & 1)
+
+    def instance_count(self, node):
+        """
+        Return the number of resources typed with a class or any of its subclasses.
+        :param node: class
+        :return: count
+        """
+        instances = set(self.instances.get(node, ()))
+        for c in self.subclasses(node):
+            instances |= self.instances.get(c, set())
+        return len(instances)
+
+    def roots(self):
+        """
+        Return the named classes without a named superclass, the roots of the tree view.
+        :return: list of IRIs
+        """
+        roots = [c for c in self.nodes
+                 if isinstance(c, URIRef) and not any(isinstance(p, URIRef) for p in self.parents[c])]
+        # declared classes outside any rdfs:subClassOf statement
+        declared = {c for t in CLASS_TYPES for c in self.instances.get(t, ()) if isinstance(c, URIRef)}
+        return roots + sorted(declared.difference(self.index))
+
+    def named_children(self, node):
+        """
+        Return the named direct subclasses of a class.
+        :param node: class
+        :return: list of IRIs
+        """
+        return [c for c in self.children.get(node, ()) if isinstance(c, URIRef)]
+
+    def updated(self, graph, added, removed):
+        """
+        Return the hierarchy after a delta, the same one unless the delta changes
+        rdfs:subClassOf or rdf:type triples.
+        :param graph: rdflib graph after the delta
+        :param added: set of triples added
+        :param removed: set of triples removed
+        :return: ClassHierarchy
+        """
+        if any(p in HIERARCHY_PREDICATES for triples in (added, removed) for _, p, _ in triples):
+            return ClassHierarchy(graph)
+        return self
+
+
+class HierarchyPath(MulPath):
+    """
+    rdfs:subClassOf* or rdfs:subClassOf+ answered from the ClassHierarchy of the queried graph
+    instead of walking it, falling back to rdflib's evaluation when no hierarchy is active or
+    neither end is bound for rdfs:subClassOf*, which matches every node of the graph.
+    """
+
+    def eval(self, graph, subj=None, obj=None, first=True):
+        hierarchy = _active.get()
+        if hierarchy is None or not first or (subj is None and obj is None and self.zero):
+            yield from super().eval(graph, subj, obj, first)
+            return
+        if subj is not None and obj is not None:
+            if hierarchy.is_subclass(subj, obj, reflexive=self.zero):
+                yield subj, obj
+        elif subj is not None:
+            for o in hierarchy.superclasses(subj, reflexive=self.zero):
+                yield subj, o
+        elif obj is not None:
+            for s in hierarchy.subclasses(obj, reflexive=self.zero):
+                yield s, obj
+        else:
+            for i, s in enumerate(hierarchy.nodes):
+                for j in _members(hierarchy.ancestors[i]):
+                    yield s, hierarchy.nodes[j]
+
+
+def hierarchy_path(path):
+    """
+    Return a property path with its rdfs:subClassOf* and rdfs:subClassOf+ steps answered from
+    the class hierarchy.
+    :param path: rdflib term or Path
+    :return: the path itself when nothing changed
+    """
+    if isinstance(path, MulPath) and not isinstance(path, HierarchyPath):
+        if path.path == RDFS.subClassOf and path.mod in (ZeroOrMore, OneOrMore):
+            return HierarchyPath(path.path, path.mod)
+        inner = hierarchy_path(path.path)
+        return path if inner is path.path else MulPath(inner, path.mod)
+    if isinstance(path, (SequencePath, AlternativePath)):
+        args = [hierarchy_path(a) for a in path.args]
+        if all(a is b for a, b in zip(args, path.args)):
+            return path
+        return type(path)(*args)
+    if isinstance(path, InvPath):
+        arg = hierarchy_path(path.arg)
+        return path if arg is path.arg else InvPath(arg)
+    return path
+
+
+def hierarchy_paths(part):
+    """
+    Return an algebra tree with the rdfs:subClassOf paths of its basic graph patterns replaced
+    by HierarchyPath.
+    :param part: algebra operator
+    :return: algebra operator, the operator itself when nothing changed
+    """
+    if not isinstance(part, CompValue):
+        return part
+    changed = None
+    if part.name == 'BGP':
+        triples = [(s, hierarchy_path(p), o) for s, p, o in part.triples]
+        if any(a[1] is not b[1] for a, b in zip(triples, part.triples)):
+            changed = part.clone()
+            changed['triples'] = triples
+        return part if changed is None else changed
+    for k, v in part.items():
+        if isinstance(v, CompValue):
+            replaced = hierarchy_paths(v)
+            if replaced is not v:
+                if changed is None:
+                    changed = part.clone()
+                changed[k] = replaced
+    return part if changed is None else changed
+
+
+@contextlib.contextmanager
+def using_hierarchy(hierarchy):
+    """
+    Answer the rdfs:subClassOf paths of the queries evaluated inside the block from a hierarchy.
+    :param hierarchy: ClassHierarchy of the queried graph, None to let rdflib walk the graph
+    :return: context manager
+    """
+    token = _active.set(hierarchy)
+    try:
+        yield hierarchy
+    finally:
+        _active.reset(token)
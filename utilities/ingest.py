@@ -0,0 +1,414 @@
+import hashlib
+import io
+import os
+import pathlib
+import time
+import weakref
+import xml.etree.ElementTree as ET
+import xml.parsers.expat
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urldefrag, urljoin
+
+from rdflib import BNode, Graph, Literal, RDF, URIRef
+
+from utilities.serialization import serialize
+
+# triples handed to the store at a time
+DEFAULT_BATCH_SIZE = 10000
+
+# formats streamed by this module
+RDFXML_FORMATS = {'application/rdf+xml', 'xml'}
+
+RDF_NS = str(RDF)
+XML_NS = 'http://www.w3.org/XML/1998/namespace'
+XML_BASE, XML_LANG = f'{{{XML_NS}}}base', f'{{{XML_NS}}}lang'
+RDF_RDF, RDF_DESCRIPTION, RDF_LI = f'{{{RDF_NS}}}RDF', f'{{{RDF_NS}}}Description', f'{{{RDF_NS}}}li'
+RDF_ABOUT, RDF_ID, RDF_NODE_ID = f'{{{RDF_NS}}}about', f'{{{RDF_NS}}}ID', f'{{{RDF_NS}}}nodeID'
+RDF_RESOURCE, RDF_DATATYPE, RDF_PARSE_TYPE = f'{{{RDF_NS}}}resource', f'{{{RDF_NS}}}datatype', f'{{{RDF_NS}}}parseType'
+RDF_TYPE = f'{{{RDF_NS}}}type'
+
+# attributes that are not property attributes
+SYNTAX_ATTRIBUTES = {RDF_ABOUT, RDF_ID, RDF_NODE_ID, RDF_RESOURCE, RDF_DATATYPE, RDF_PARSE_TYPE}
+
+# the document each graph loaded with keep_source was parsed from, by graph store
+source_documents = weakref.WeakKeyDictionary()
+
+
+class _Fallback(Exception):
+    """
+    Raised for constructs the streaming parser leaves to rdflib, e.g. parseType="Literal".
+    """
+
+
+def _name(tag):
+    return URIRef(tag[1:].replace('}', '', 1)) if tag.startswith('{') else URIRef(tag)
+
+
+def _scope(element, base, lang):
+    """
+    Return the xml:base and xml:lang in effect inside an element.
+    """
+    if XML_BASE in element.attrib:
+        base = urldefrag(urljoin(base or '', element.attrib[XML_BASE]))[0]
+    if XML_LANG in element.attrib:
+        lang = element.attrib[XML_LANG] or None
+    return base, lang
+
+
+def _digest(element):
+    """
+    Return a hash of the content of an element.
+    """
+    digest = hashlib.sha1()
+    for e in element.iter():
+        digest.update(repr((e.tag, sorted(e.attrib.items()), e.text)).encode())
+    return digest.hexdigest()
+
+
+class _DocumentParser:
+    """
+    Converts the top-level node elements of one RDF/XML document to triples.
+    Blank node ids (rdf:nodeID) are shared across the whole document.
+
+    Blank nodes are labelled by the content of the top-level element they appear in and
+    their position inside it, so the blank nodes of an element get the same labels whether
+    the element is parsed with the whole document, with an edited version of it or alone.
+    """
+
+    def __init__(self, base):
+        self.base = base
+        self.node_ids = {}
+        self.namespaces = {}
+        self.digests = {}
+        self.current = None
+        self.element = None
+        self.bnodes = 0
+
+    def triples(self, element, base, lang):
+        """
+        Return the triples of a top-level node element, parsing it with rdflib when it
+        uses a construct this parser does not handle.
+        :param element: node element
+        :param base: xml:base in effect
+        :param lang: xml:lang in effect
+        :return: list of triples
+        """
+        self.current, self.element = element, None
+        triples = []
+        try:
+            self.bnodes = 0
+            self._node(element, base, lang, triples)
+        except _Fallback:
+            self.bnodes = 0
+            return self._rdflib_triples(element, base, lang)
+        return triples
+
+    def _label(self, name):
+        return BNode('b' + hashlib.sha1(f'{self.base}|{name}'.encode()).hexdigest()[:32])
+
+    def _new_bnode(self):
+        if self.element is None:
+            # hashed on the first blank node only, most elements have none; equal elements are told apart by order
+            digest = _digest(self.current)
+            occurrence = self.digests[digest] = self.digests.get(digest, -1) + 1
+            self.element = f'{digest}|{occurrence}'
+        self.bnodes += 1
+        return self._label(f'{self.element}|{self.bnodes}')
+
+    def _bnode(self, node_id):
+        bnode = self.node_ids.get(node_id)
+        if bnode is None:
+            bnode = self.node_ids[node_id] = self._label(f'{RDF_NODE_ID}={node_id}')
+        return bnode
+
+    def _node(self, element, base, lang, triples):
+        base, lang = _scope(element, base, lang)
+        attrib = element.attrib
+        if RDF_ABOUT in attrib:
+            subject = URIRef(urljoin(base or '', attrib[RDF_ABOUT]))
+        elif RDF_ID in attrib:
+            subject = URIRef(urljoin(base or '', '#' + attrib[RDF_ID]))
+        elif RDF_NODE_ID in attrib:
+            subject = self._bnode(attrib[RDF_NODE_ID])
+        else:
+            subject = self._new_bnode()
+        if element.tag != RDF_DESCRIPTION:
+            triples.append((subject, RDF.type, _name(element.tag)))
+        self._property_attributes(subject, attrib, base, lang, triples)
+        self._property_elements(subject, element, base, lang, triples)
+        return subject
+
+    @staticmethod
+    def _property_attributes(subject, attrib, base, lang, triples):
+        for name, value in attrib.items():
+            if name in SYNTAX_ATTRIBUTES or name.startswith(f'{{{XML_NS}}}'):
+                continue
+            if name == RDF_TYPE:
+                triples.append((subject, RDF.type, URIRef(urljoin(base or '', value))))
+            else:
+                triples.append((subject, _name(name), Literal(value, lang=lang)))
+
+    def _property_elements(self, subject, element, base, lang, triples):
+        li = 0
+        for child in element:
+            child_base, child_lang = _scope(child, base, lang)
+            attrib = child.attrib
+            if child.tag == RDF_LI:
+                li += 1
+                predicate = URIRef(f'{RDF_NS}_{li}')
+            else:
+                predicate = _name(child.tag)
+            if RDF_ID in attrib:
+                # reified statement
+                raise _Fallback()
+
+            parse_type = attrib.get(RDF_PARSE_TYPE)
+            if parse_type == 'Resource':
+                obj = self._new_bnode()
+                self._property_elements(obj, child, child_base, child_lang, triples)
+            elif parse_type == 'Collection':
+                items = [self._node(item, child_base, child_lang, triples) for item in child]
+                obj = RDF.nil
+                for item in reversed(items):
+                    node = self._new_bnode()
+                    triples.append((node, RDF.first, item))
+                    triples.append((node, RDF.rest, obj))
+                    obj = node
+            elif parse_type is not None:
+                raise _Fallback()
+            elif len(child):
+                if len(child) != 1:
+                    raise _Fallback()
+                obj = self._node(child[0], child_base, child_lang, triples)
+            elif RDF_RESOURCE in attrib or RDF_NODE_ID in attrib or any(
+                    a not in SYNTAX_ATTRIBUTES and not a.startswith(f'{{{XML_NS}}}') for a in attrib):
+                if RDF_RESOURCE in attrib:
+                    obj = URIRef(urljoin(child_base or '', attrib[RDF_RESOURCE]))
+                elif RDF_NODE_ID in attrib:
+                    obj = self._bnode(attrib[RDF_NODE_ID])
+                else:
+                    obj = self._new_bnode()
+                self._property_attributes(obj, attrib, child_base, child_lang, triples)
+            elif RDF_DATATYPE in attrib:
+                obj = Literal(child.text or '', datatype=URIRef(urljoin(child_base or '', attrib[RDF_DATATYPE])))
+            else:
+                obj = Literal(child.text or '', lang=child_lang)
+            triples.append((subject, predicate, obj))
+
+    def _rdflib_triples(self, element, base, lang):
+        """
+        Parse one node element with rdflib, keeping its blank node ids consistent with the document.
+        """
+        wrapper = ET.Element(RDF_RDF)
+        if base:
+            wrapper.set(XML_BASE, base)
+        if lang:
+            wrapper.set(XML_LANG, lang)
+        wrapper.append(element)
+        node_ids = {e.attrib[RDF_NODE_ID] for e in element.iter() if RDF_NODE_ID in e.attrib}
+        graph = Graph()
+        graph.parse(data=ET.tostring(wrapper), format='xml', publicID=base, preserve_bnode_ids=True)
+
+        bnodes = {}
+
+        def term(t):
+            if not isinstance(t, BNode):
+                return t
+            if str(t) in node_ids:
+                return self._bnode(str(t))
+            if t not in bnodes:
+                bnodes[t] = self._new_bnode()
+            return bnodes[t]
+        return [(term(s), p, term(o)) for s, p, o in graph]
+
+
+def iter_rdfxml_batches(source, batch_size=DEFAULT_BATCH_SIZE, progress=None, namespaces=None, data=None):
+    """
+    Stream the triples of an RDF/XML file in batches, parsing one top-level node element
+    at a time so memory stays bounded by the largest element, not the file.
+    :param source: filename
+    :param batch_size: triples per batch
+    :param progress: callable(dictionary of statistics) called after every batch
+    :param namespaces: dictionary filled with the prefixes declared by the document
+    :param data: content of the file, already read, or of a part of it, parsed instead of the file
+    :return: generator of lists of triples
+    """
+    total_bytes = os.path.getsize(source) if data is None else len(data)
+    document = _DocumentParser(pathlib.Path(source).absolute().as_uri())
+    started = time.perf_counter()
+    count = 0
+    batch = []
+
+    def report(f):
+        if progress is not None:
+            seconds = time.perf_counter() - started
+            progress({
+                'source': str(source),
+                'triples': count,
+                'bytes': f.tell(),
+                'total_bytes': total_bytes,
+                'seconds': seconds,
+                'triples_per_second': count / seconds if seconds else 0.0,
+                'bytes_per_second': f.tell() / seconds if seconds else 0.0,
+            })
+
+    with open(source, 'rb') if data is None else io.BytesIO(data) as f:
+        depth = 0
+        root = None
+        scopes = []
+        for event, item in ET.iterparse(f, events=('start-ns', 'start', 'end')):
+            if event == 'start-ns':
+                if namespaces is not None:
+                    namespaces.setdefault(item[0], item[1])
+                continue
+            if event == 'start':
+                if depth == 0:
+                    root = item
+                    scopes.append(_scope(item, document.base, None))
+                depth += 1
+                continue
+
+            depth -= 1
+            if depth == 1 and root.tag == RDF_RDF or depth == 0 and root.tag != RDF_RDF:
+                batch.extend(document.triples(item, *scopes[0]))
+                if root.tag == RDF_RDF:
+                    root.remove(item)
+                if len(batch) >= batch_size:
+                    count += len(batch)
+                    yield batch
+                    batch = []
+                    report(f)
+        if batch:
+            count += len(batch)
+            yield batch
+        report(f)
+
+
+def ingest(source, graph=None, batch_size=DEFAULT_BATCH_SIZE, progress=None, keep_source=False):
+    """
+    Load an RDF/XML file into a graph in batches.
+    :param source: filename
+    :param graph: graph to add the triples to, a new Graph when None
+    :param batch_size: triples per batch
+    :param progress: callable(dictionary of statistics) called after every batch
+    :param keep_source: keep the file content in source_documents, so edits of the file can
+        be applied to the graph by parsing only the elements that changed
+    :return: graph
+    """
+    if graph is None:
+        graph = Graph()
+    namespaces = {}
+    data = pathlib.Path(source).read_bytes() if keep_source else None
+    count = 0
+    for batch in iter_rdfxml_batches(source, batch_size, progress, namespaces, data):
+        graph.addN((s, p, o, graph) for s, p, o in batch)
+        count += len(batch)
+    for prefix, namespace in namespaces.items():
+        graph.bind(prefix, namespace, override=False)
+    if keep_source:
+        source_documents[graph.store] = SourceDocument(source, data, count)
+    return graph
+
+
+class SourceDocument:
+    """
+    The content of an RDF/XML file a graph was parsed from, and the number of triples it
+    gave, duplicates included, so an edited version of the file can be compared with it
+    element by element.
+    """
+
+    def __init__(self, source, data, triples):
+        """
+        :param source: filename
+        :param data: file content
+        :param triples: number of triples parsed from the content, duplicates included
+        """
+        self.source = source
+        self.data = data
+        self.triples = triples
+        self._layout = None
+
+    def layout(self):
+        """
+        Return where the top-level elements of the document are, scanned on first use.
+        :return: (prolog end, epilogue start, list of (start, end) byte ranges of the top-level
+            elements, dictionary of the prefixes declared), None when the root is not rdf:RDF
+            or the document is not well-formed
+        """
+        if self._layout is None:
+            self._layout = _scan(self.data) or ()
+        return self._layout or None
+
+    def elements(self, ranges):
+        """
+        Parse some top-level elements of the document on their own, with the prolog and
+        epilogue of the document around them.
+        :param ranges: (start, end) byte ranges of top-level elements, in document order
+        :return: list of triples, duplicates included
+        """
+        prolog_end, epilogue_start, _, _ = self.layout()
+        data = b''.join([self.data[:prolog_end], *(self.data[a:b] for a, b in ranges), self.data[epilogue_start:]])
+        return [t for batch in iter_rdfxml_batches(self.source, data=data) for t in batch]
+
+
+def _scan(data):
+    """
+    Find the top-level elements of an RDF/XML document without building them. Each element
+    runs to the start of the next one, or to the end tag of the root for the last.
+    """
+    parser = xml.parsers.expat.ParserCreate(namespace_separator=' ')
+    starts, namespaces = [], {}
+    depth, root, epilogue_start = 0, None, None
+
+    def start(name, attrs):
+        nonlocal depth, root
+        if depth == 0:
+            root = name
+        elif depth == 1:
+            starts.append(parser.CurrentByteIndex)
+        depth += 1
+
+    def end(name):
+        nonlocal depth, epilogue_start
+        depth -= 1
+        if depth == 0:
+            epilogue_start = parser.CurrentByteIndex
+
+    def start_namespace(prefix, uri):
+        namespaces.setdefault(prefix or '', uri)
+
+    parser.StartElementHandler, parser.EndElementHandler = start, end
+    parser.StartNamespaceDeclHandler = start_namespace
+    try:
+        parser.Parse(data, True)
+    except xml.parsers.expat.ExpatError:
+        return None
+    if root != f'{RDF_NS} RDF' or not starts:
+        return None
+    ranges = list(zip(starts, starts[1:] + [epilogue_start]))
+    return starts[0], epilogue_start, ranges, namespaces
+
+
+def _ingest_to_snapshot(source, filename, batch_size):
+    started = time.perf_counter()
+    graph = ingest(source, batch_size=batch_size)
+    serialize(graph, filename, indexes=True)
+    return {'source': str(source), 'snapshot': filename, 'triples': len(graph),
+            'seconds': time.perf_counter() - started}
+
+
+def ingest_files(jobs, max_workers=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Parse independent RDF/XML files in parallel worker processes, each writing a snapshot.
+    :param jobs: list of (source filename, snapshot filename)
+    :param max_workers: number of processes, the number of cpus when None
+    :param batch_size: triples per batch
+    :return: list of dictionaries of statistics, in job order
+    """
+    if not jobs:
+        return []
+    if len(jobs) == 1:
+        return [_ingest_to_snapshot(*jobs[0], batch_size)]
+    with ProcessPoolExecutor(max_workers=min(max_workers or os.cpu_count() or 1, len(jobs))) as executor:
+        futures = [executor.submit(_ingest_to_snapshot, source, filename, batch_size) for source, filename in jobs]
+        return [future.result() for future in futures]
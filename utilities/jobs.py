@@ -0,0 +1,315 @@
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+import uuid
+
+from utilities.shared import SharedDirectory
+
+# wall-clock limit of a job, in seconds
+DEFAULT_TIMEOUT = 60
+
+# finished jobs are forgotten after this many seconds
+DEFAULT_RETENTION = 10 * 60
+
+# seconds between two checks of the running jobs by the monitor thread
+MONITOR_INTERVAL = 0.5
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED, TIMEOUT = 'queued', 'running', 'done', 'failed', 'cancelled', 'timeout'
+FINISHED = {DONE, FAILED, CANCELLED, TIMEOUT}
+
+def _run(connection, fn, args, kwargs):
+    """
+    Body of a job process: run fn and send its progress messages and result back to the parent.
+    """
+    def progress(message):
+        connection.send(('progress', message))
+
+    try:
+        connection.send(('done', fn(*args, progress=progress, **kwargs)))
+    except BaseException as e:
+        connection.send(('failed', f'{type(e).__name__}: {e}\n{traceback.format_exc(limit=5)}'))
+    finally:
+        connection.close()
+
+
+class Job:
+    """
+    A function running in its own process, so that it can be killed without harming the server.
+    """
+
+    def __init__(self, fn, args, kwargs, timeout):
+        self.id = uuid.uuid4().hex
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.timeout = timeout
+        self.status = QUEUED
+        self.progress = None
+        self.result = None
+        self.error = None
+        self.submitted = time.monotonic()
+        self.started = None
+        self.finished = None
+        self.process = None
+        self.connection = None
+        self.published = None
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+    def state(self):
+        """
+        Return what other processes may read of the job, the result once it is done.
+        :return: JobState
+        """
+        # wall-clock times, the monotonic clock of this process means nothing to the others
+        now = time.time()
+        started = None if self.started is None else now - self.elapsed
+        finished = None if self.finished is None else now - (time.monotonic() - self.finished)
+        return JobState(self.id, self.status, self.progress, self.result, self.error, started, finished)
+
+    def start(self, context):
+        parent, child = context.Pipe(duplex=False)
+        self.connection = parent
+        self.process = context.Process(target=_run, args=(child, self.fn, self.args, self.kwargs), daemon=True)
+        self.process.start()
+        child.close()
+        self.status = RUNNING
+        self.started = time.monotonic()
+
+    def update(self):
+        """
+        Read the messages of a running job and enforce its timeout.
+        :return: None
+        """
+        if self.status != RUNNING:
+            return
+        try:
+            while self.connection.poll():
+                kind, payload = self.connection.recv()
+                if kind == 'progress':
+                    self.progress = payload
+                elif kind == 'done':
+                    self.result = payload
+                    self._finish(DONE)
+                    return
+                else:
+                    self.error = payload
+                    self._finish(FAILED)
+                    return
+        except (EOFError, OSError):
+            self.error = f'job process exited with code {self.process.exitcode}'
+            self._finish(FAILED)
+            return
+        if self.timeout is not None and self.elapsed > self.timeout:
+            self.error = f'timed out after {self.timeout} s'
+            self._finish(TIMEOUT)
+
+    def stop(self, status=CANCELLED):
+        if self.status == QUEUED:
+            self.status = status
+            self.finished = time.monotonic()
+        elif self.status == RUNNING:
+            self._finish(status)
+
+    def _finish(self, status):
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.connection.close()
+        # other threads see the final status only once the process is gone
+        self.status = status
+        self.finished = time.monotonic()
+
+
+class JobState:
+    """
+    The state of a job run by another process, read from the directory shared by the runners.
+    """
+
+    def __init__(self, job_id, status, progress, result, error, started, finished):
+        self.id = job_id
+        self.status = status
+        self.progress = progress
+        self.result = result
+        self.error = error
+        self.started = started
+        self.finished = finished
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+
+class JobRunner:
+    """
+    Runs long functions in worker processes, at most max_workers at a time.
+
+    Each job gets a process of its own, which is killed when the job is cancelled or
+    exceeds its wall-clock timeout. Jobs are advanced whenever they are polled, and by
+    a monitor thread while any job is queued or running, so timeouts are enforced and
+    results read even when no client polls anymore.
+
+    Job processes are not forked from the server, whose other threads may hold locks
+    that a forked process would inherit held and never see released. They are forked
+    from a forkserver, a process without threads that imports the preloaded modules
+    once, or spawned where there is none, and only receive the pickled job arguments.
+
+    With a directory, the runners of several server processes, e.g. gunicorn workers,
+    share their jobs: the runner that started a job writes its state there whenever it
+    changes, and the others read it when the job is polled and ask for its cancellation
+    with a marker file that the owner's monitor thread acts on.
+    """
+
+    def __init__(self, max_workers=None, timeout=DEFAULT_TIMEOUT, retention=DEFAULT_RETENTION, start_method=None,
+                 preload=(), directory=None):
+        """
+        :param max_workers: maximum number of running jobs, the number of cpus when None
+        :param timeout: default wall-clock limit of a job, in seconds
+        :param retention: seconds a finished job is kept for polling
+        :param start_method: multiprocessing start method, 'forkserver' where available and 'spawn'
+            otherwise when None; 'fork' is unsafe once the server runs threads
+        :param preload: names of the modules the forkserver imports before forking job processes
+        :param directory: directory shared with the runners of the other server processes, None for none
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.retention = retention
+        if start_method is None:
+            start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        self._context = multiprocessing.get_context(start_method)
+        if start_method == 'forkserver' and preload:
+            # the main module is imported as well, job processes would import it again otherwise
+            self._context.set_forkserver_preload(['__main__', *preload])
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._monitor = None
+        # states of jobs whose owner exited are removed after the longest a job can be kept
+        self._shared = None
+        if directory is not None:
+            self._shared = SharedDirectory(directory, ttl=retention + (timeout or 0) + DEFAULT_TIMEOUT)
+
+    def submit(self, fn, *args, timeout=None, **kwargs):
+        """
+        Queue a function call. fn receives a progress(message) keyword argument, and its
+        arguments and result must be picklable.
+        :param fn: module-level function
+        :param timeout: wall-clock limit in seconds, the runner default when None
+        :return: job id
+        """
+        job = Job(fn, args, kwargs, self.timeout if timeout is None else timeout)
+        if self._shared is not None:
+            self._shared.expire()
+        with self._lock:
+            self._jobs[job.id] = job
+            self._advance()
+            # started on demand, a thread started before gunicorn forks its workers would not run in them
+            if self._monitor is None or not self._monitor.is_alive():
+                self._monitor = threading.Thread(target=self._watch, name='job-monitor', daemon=True)
+                self._monitor.start()
+        return job.id
+
+    def poll(self, job_id):
+        """
+        Return a job after reading its progress, enforcing timeouts and starting queued jobs.
+        :param job_id: job id
+        :return: Job, JobState of a job of another runner, None when unknown or forgotten
+        """
+        with self._lock:
+            self._advance()
+            job = self._jobs.get(job_id)
+        if job is None and self._shared is not None:
+            return self._shared.read(job_id)
+        return job
+
+    def cancel(self, job_id):
+        """
+        Cancel a job, killing its process when it is running. The job of another runner is
+        cancelled by that runner, soon after.
+        :param job_id: job id
+        :return: Job, JobState of a job of another runner, None when unknown or forgotten
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.stop(CANCELLED)
+            self._advance()
+        if job is None and self._shared is not None:
+            job = self._shared.read(job_id)
+            if job is not None and job.status not in FINISHED:
+                self._shared.write(_cancel_key(job_id), True)
+                job.status, job.finished = CANCELLED, time.time()
+        return job
+
+    def stats(self):
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {status: statuses.count(status) for status in (QUEUED, RUNNING, DONE, FAILED, CANCELLED, TIMEOUT)}
+
+    def shutdown(self):
+        with self._lock:
+            for job in self._jobs.values():
+                job.stop(CANCELLED)
+                self._forget(job)
+            self._jobs.clear()
+
+    def _watch(self):
+        """
+        Body of the monitor thread: advance the jobs until none is queued or running.
+        """
+        while True:
+            time.sleep(MONITOR_INTERVAL)
+            with self._lock:
+                self._advance()
+                if not any(job.status in (QUEUED, RUNNING) for job in self._jobs.values()):
+                    self._monitor = None
+                    return
+
+    def _advance(self):
+        now = time.monotonic()
+        running = 0
+        for job_id, job in list(self._jobs.items()):
+            if self._shared is not None and job.status not in FINISHED and self._shared.exists(_cancel_key(job_id)):
+                job.stop(CANCELLED)
+            job.update()
+            if job.status == RUNNING:
+                running += 1
+            elif job.status in FINISHED and now - job.finished > self.retention:
+                del self._jobs[job_id]
+                self._forget(job)
+        for job in sorted((j for j in self._jobs.values() if j.status == QUEUED), key=lambda j: j.submitted):
+            if running >= self.max_workers:
+                break
+            job.start(self._context)
+            running += 1
+        if self._shared is not None:
+            for job in self._jobs.values():
+                self._publish(job)
+
+    def _publish(self, job):
+        """
+        Write the state of a job to the shared directory when it changed since it was last written.
+        """
+        key = (job.status, job.progress)
+        if key != job.published:
+            self._shared.write(job.id, job.state())
+            job.published = key
+
+    def _forget(self, job):
+        if self._shared is not None:
+            self._shared.remove(job.id)
+            self._shared.remove(_cancel_key(job.id))
+
+
+def _cancel_key(job_id):
+    return f'{job_id}-cancel'
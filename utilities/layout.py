@@ -0,0 +1,169 @@
+import math
+from collections import deque
+
+import numpy as np
+
+# layouts computed on the server and sent to cytoscape as preset positions
+LAYOUTS = ['random', 'grid', 'circle', 'concentric', 'breadthfirst', 'force']
+
+# distance between neighboring nodes, in cytoscape pixels
+SPACING = 60
+
+# above this many nodes the force-directed layout samples the repulsion
+FORCE_EXACT_NODES = 800
+FORCE_SAMPLE = 256
+
+
+def graph_arrays(elements):
+    """
+    Return the node ids and the (source, target) index pairs of cytoscape elements.
+    :param elements: list of cytoscape elements
+    :return: (list of node ids, (m, 2) int array of edges)
+    """
+    node_ids = [e['data']['id'] for e in elements if 'source' not in e['data']]
+    index = {node_id: i for i, node_id in enumerate(node_ids)}
+    edges = [(index[e['data']['source']], index[e['data']['target']]) for e in elements
+             if 'source' in e['data'] and e['data']['source'] in index and e['data']['target'] in index]
+    return node_ids, np.array(edges, dtype=np.int64).reshape(-1, 2)
+
+
+def _degrees(n, edges):
+    return np.bincount(edges.ravel(), minlength=n) if len(edges) else np.zeros(n, dtype=np.int64)
+
+
+def random_positions(n, edges, seed=0):
+    size = SPACING * max(math.sqrt(n), 1) * 2
+    return np.random.default_rng(seed).uniform(0, size, (n, 2))
+
+
+def grid_positions(n, edges, seed=0):
+    cols = max(math.ceil(math.sqrt(n)), 1)
+    i = np.arange(n)
+    return np.column_stack((i % cols, i // cols)).astype(float) * SPACING
+
+
+def circle_positions(n, edges, seed=0):
+    radius = max(n * SPACING / (2 * math.pi), SPACING)
+    angles = 2 * math.pi * np.arange(n) / max(n, 1)
+    return radius * np.column_stack((np.cos(angles), np.sin(angles)))
+
+
+def concentric_positions(n, edges, seed=0):
+    """
+    Place nodes on rings, highest degree in the center.
+    """
+    order = np.argsort(-_degrees(n, edges), kind='stable')
+    positions = np.zeros((n, 2))
+    start, ring = 0, 0
+    while start < n:
+        capacity = 1 if ring == 0 else int(2 * math.pi * ring)
+        members = order[start:start + capacity]
+        angles = 2 * math.pi * np.arange(len(members)) / len(members)
+        positions[members] = ring * SPACING * np.column_stack((np.cos(angles), np.sin(angles)))
+        start += capacity
+        ring += 1
+    return positions
+
+
+def breadthfirst_positions(n, edges, seed=0):
+    """
+    Place nodes in rows by breadth-first depth from the highest-degree node of each component.
+    """
+    adjacency = [[] for _ in range(n)]
+    for s, t in edges.tolist():
+        adjacency[s].append(t)
+        adjacency[t].append(s)
+    depth = np.full(n, -1)
+    offset = 0
+    positions = np.zeros((n, 2))
+    for root in np.argsort(-_degrees(n, edges), kind='stable').tolist():
+        if depth[root] >= 0:
+            continue
+        depth[root] = 0
+        component = [root]
+        queue = deque([root])
+        while queue:
+            node = queue.popleft()
+            for neighbor in adjacency[node]:
+                if depth[neighbor] < 0:
+                    depth[neighbor] = depth[node] + 1
+                    component.append(neighbor)
+                    queue.append(neighbor)
+        component = np.array(component)
+        levels = depth[component]
+        # rank of each node within its level
+        ranks = np.zeros(len(component), dtype=np.int64)
+        for level in np.unique(levels):
+            at_level = levels == level
+            ranks[at_level] = np.arange(at_level.sum())
+        positions[component, 0] = (offset + ranks) * SPACING
+        positions[component, 1] = levels * SPACING * 2
+        offset += int(np.bincount(levels).max()) + 1
+    return positions
+
+
+def force_positions(n, edges, seed=0, iterations=60):
+    """
+    Fruchterman-Reingold force-directed layout, vectorized with NumPy. Above
+    FORCE_EXACT_NODES nodes, repulsion is estimated each iteration from a random
+    sample of FORCE_SAMPLE nodes, so an iteration costs O(n * sample) instead of O(n^2).
+    """
+    if n == 0:
+        return np.zeros((0, 2))
+    rng = np.random.default_rng(seed)
+    positions = rng.uniform(0, 1, (n, 2))
+    k2 = 1.0 / n
+    k = math.sqrt(k2)
+    temperature = 0.1
+    cooling = temperature / (iterations + 1)
+    for _ in range(iterations):
+        if n > FORCE_EXACT_NODES:
+            sample = rng.choice(n, FORCE_SAMPLE, replace=False)
+            others, weight = positions[sample], n / FORCE_SAMPLE
+        else:
+            others, weight = positions, 1.0
+        dx = positions[:, 0, None] - others[None, :, 0]
+        dy = positions[:, 1, None] - others[None, :, 1]
+        force = weight * k2 / np.maximum(dx * dx + dy * dy, 1e-4)
+        displacement = np.column_stack(((dx * force).sum(axis=1), (dy * force).sum(axis=1)))
+        if len(edges):
+            delta = positions[edges[:, 0]] - positions[edges[:, 1]]
+            distance = np.maximum(np.linalg.norm(delta, axis=1), 0.01)
+            attraction = delta * (distance / k)[:, None]
+            np.subtract.at(displacement, edges[:, 0], attraction)
+            np.add.at(displacement, edges[:, 1], attraction)
+        length = np.maximum(np.linalg.norm(displacement, axis=1), 0.01)
+        positions += displacement * (np.minimum(length, temperature) / length)[:, None]
+        temperature -= cooling
+    positions -= positions.min(axis=0)
+    scale = SPACING * math.sqrt(n) / max(positions.max(), 1e-9)
+    return positions * scale
+
+
+LAYOUT_FUNCTIONS = {
+    'random': random_positions,
+    'grid': grid_positions,
+    'circle': circle_positions,
+    'concentric': concentric_positions,
+    'breadthfirst': breadthfirst_positions,
+    'force': force_positions,
+}
+
+
+def compute_layout(elements, name, seed=0):
+    """
+    Return a cytoscape preset layout with node positions computed on the server.
+    :param elements: list of cytoscape elements
+    :param name: layout name, one of LAYOUTS
+    :param seed: random seed of the random and force layouts
+    :return: cytoscape layout dictionary
+    """
+    node_ids, edges = graph_arrays(elements)
+    positions = LAYOUT_FUNCTIONS[name](len(node_ids), edges, seed=seed)
+    return {
+        'name': 'preset',
+        'fit': True,
+        'animate': False,
+        'positions': {node_id: {'x': round(float(x), 1), 'y': round(float(y), 1)}
+                      for node_id, (x, y) in zip(node_ids, positions)},
+    }
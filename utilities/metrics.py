@@ -0,0 +1,285 @@
+import contextlib
+import contextvars
+import functools
+import threading
+import time
+import uuid
+
+from utilities.cache import LRUCache
+from utilities.shared import SharedDirectory
+
+# upper bounds of the stage duration histogram buckets, in seconds
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# the trace of the request being handled, a list of finished spans
+_trace = contextvars.ContextVar('trace', default=None)
+
+
+class Span:
+    """
+    The timing of one stage of the hot path, with the number of items it handled,
+    e.g. rows, triples, elements or bytes.
+    """
+
+    def __init__(self, stage, **counts):
+        self.stage = stage
+        self.counts = dict(counts)
+        self.seconds = None
+
+    def count(self, **counts):
+        """
+        Record the items handled by the stage, once they are known.
+        :param counts: item name to number, e.g. rows=10
+        :return: None
+        """
+        self.counts.update(counts)
+
+    def to_dict(self):
+        return {'stage': self.stage, 'seconds': self.seconds, 'counts': self.counts}
+
+
+class Metrics:
+    """
+    Process-wide duration histograms and item counters per stage, exported in the
+    Prometheus text format. Every worker process keeps its own metrics.
+    """
+
+    def __init__(self, buckets=DURATION_BUCKETS, namespace='semantic_web'):
+        self.buckets = tuple(buckets)
+        self.namespace = namespace
+        self._durations = {}
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds, counts=None):
+        """
+        Record one run of a stage.
+        :param stage: stage name
+        :param seconds: duration
+        :param counts: dictionary of item name to number handled
+        :return: None
+        """
+        with self._lock:
+            histogram = self._durations.get(stage)
+            if histogram is None:
+                histogram = self._durations[stage] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+            for unit, n in (counts or {}).items():
+                self._items[stage, unit] = self._items.get((stage, unit), 0) + n
+
+    def prometheus(self):
+        """
+        Return the metrics in the Prometheus text exposition format.
+        :return: text
+        """
+        name = f'{self.namespace}_stage_seconds'
+        lines = [f'# HELP {name} Time spent in each stage of the query hot path.', f'# TYPE {name} histogram']
+        with self._lock:
+            for stage, (buckets, total, count) in sorted(self._durations.items()):
+                for bound, n in zip(self.buckets, buckets):
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {n}')
+                lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {total}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+            items = sorted(self._items.items())
+        name = f'{self.namespace}_stage_items_total'
+        lines += [f'# HELP {name} Items handled by each stage: rows, triples, elements or bytes.',
+                  f'# TYPE {name} counter']
+        lines += [f'{name}{{stage="{stage}",unit="{unit}"}} {n}' for (stage, unit), n in items]
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+# finished request traces by id, for the timing breakdown panel
+traces = LRUCache(max_entries=256)
+
+# seconds a trace handed to the browser is kept in the shared directory
+SHARED_TRACE_TTL = 30 * 60
+
+# directory the traces handed to the browser are written to, so that any server process can show them
+_shared_traces = None
+
+
+def share_traces(directory):
+    """
+    Write the traces whose id is handed to the browser to a directory shared by the server
+    processes, so the timing panel finds them whichever process serves it.
+    :param directory: directory, None to keep traces in this process
+    :return: None
+    """
+    global _shared_traces
+    _shared_traces = None if directory is None else SharedDirectory(directory, ttl=SHARED_TRACE_TTL)
+
+
+def get_trace(trace_id):
+    """
+    Return a finished trace, from this process or from the shared directory.
+    :param trace_id: trace id
+    :return: trace dictionary, None when it is unknown or expired
+    """
+    trace = traces.peek(trace_id)
+    if trace is None and _shared_traces is not None:
+        trace = _shared_traces.read(trace_id)
+    return trace
+
+
+@contextlib.contextmanager
+def span(stage, **counts):
+    """
+    Time a stage of the hot path; the span is recorded in the metrics and, while a
+    request is traced, in its trace.
+
+        with span('sparql') as s:
+            ...
+            s.count(rows=len(dataframe))
+
+    :param stage: stage name
+    :param counts: item name to number handled, when known up front
+    :return: context manager yielding the Span
+    """
+    s = Span(stage, **counts)
+    started = time.perf_counter()
+    try:
+        yield s
+    finally:
+        s.seconds = time.perf_counter() - started
+        record(s)
+
+
+def traced_callback(stage):
+    """
+    Decorator timing a Dash callback as a stage and marking the end of the callback, so
+    the rest of the request is recorded as the response stage. Put it below @app.callback.
+    :param stage: stage name
+    :return: decorator
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            try:
+                with span(stage):
+                    return fn(*args, **kwargs)
+            finally:
+                mark_callback_finished(stage)
+        return wrapper
+    return decorator
+
+
+def record(s):
+    """
+    Record a finished span in the metrics and in the current trace.
+    :param s: Span
+    :return: None
+    """
+    metrics.observe(s.stage, s.seconds, s.counts)
+    trace = _trace.get()
+    if trace is not None:
+        trace['spans'].append(s.to_dict())
+
+
+def record_spans(spans):
+    """
+    Record spans finished elsewhere, e.g. in a query job process.
+    :param spans: list of Span.to_dict() dictionaries
+    :return: None
+    """
+    for d in spans:
+        s = Span(d['stage'], **d['counts'])
+        s.seconds = d['seconds']
+        record(s)
+
+
+@contextlib.contextmanager
+def collect_spans():
+    """
+    Collect the spans finished inside the block, e.g. to send them back from a job process.
+    :return: context manager yielding the list the span dictionaries are appended to
+    """
+    trace = {'id': None, 'spans': []}
+    token = _trace.set(trace)
+    try:
+        yield trace['spans']
+    finally:
+        _trace.reset(token)
+
+
+def start_trace():
+    """
+    Start tracing the request being handled.
+    :return: trace id
+    """
+    trace = {'id': uuid.uuid4().hex, 'started': time.perf_counter(), 'spans': []}
+    _trace.set(trace)
+    return trace['id']
+
+
+def current_trace_id():
+    """
+    Return the id of the trace of the request being handled, None when it is not traced.
+    The trace is shared with the other server processes once it is finished.
+    :return: trace id
+    """
+    trace = _trace.get()
+    if trace is None:
+        return None
+    trace['shared'] = True
+    return trace['id']
+
+
+def finish_trace(**counts):
+    """
+    Finish the trace of the request being handled and keep it for the timing panel.
+    The whole request is recorded as the 'request' stage. After a traced callback, the time
+    from its end to now is recorded as the 'response' stage: serializing the callback
+    outputs to JSON and building the response. It is recorded per callback as well, e.g.
+    'submit_response', with the payload sizes.
+    :param counts: items of the request, e.g. bytes=1024
+    :return: finished trace dictionary, or None when the request is not traced
+    """
+    trace = _trace.get()
+    if trace is None:
+        return None
+    _trace.set(None)
+    now = time.perf_counter()
+    if 'callback_finished' in trace:
+        response = Span('response', **counts)
+        response.seconds = trace.get('response_encoded', now) - trace['callback_finished']
+        metrics.observe(response.stage, response.seconds, response.counts)
+        if trace.get('callback'):
+            metrics.observe(f"{trace['callback']}_response", response.seconds, response.counts)
+        trace['spans'].append(response.to_dict())
+    trace['seconds'] = now - trace['started']
+    metrics.observe('request', trace['seconds'], counts)
+    traces.put(trace['id'], trace)
+    if trace.get('shared') and _shared_traces is not None:
+        _shared_traces.expire()
+        _shared_traces.write(trace['id'], trace)
+    return trace
+
+
+def mark_callback_finished(callback=None):
+    """
+    Mark the end of the callback of the request being handled; what follows is the response stage.
+    :param callback: stage name of the callback, the response is also recorded under it
+    :return: None
+    """
+    trace = _trace.get()
+    if trace is not None:
+        trace['callback_finished'] = time.perf_counter()
+        trace['callback'] = callback
+
+
+def mark_response_encoded():
+    """
+    Mark the end of the response stage of the request being handled, when what follows,
+    e.g. compressing the response, is timed as a stage of its own.
+    :return: None
+    """
+    trace = _trace.get()
+    if trace is not None:
+        trace['response_encoded'] = time.perf_counter()
@@ -1,31 +1,102 @@
-import pandas as pd
-import networkx as nx
-import ontospy
+import contextlib
+import glob
+import hashlib
+import os
+import tempfile
 
-from rdflib import Graph
-from rdflib.extras.external_graph_libs import rdflib_to_networkx_graph
-from ontospy.gendocs.viz.viz_html_single import HTMLVisualizer
+from rdflib import Graph, plugin
+from rdflib.store import Store
 
+from utilities.cache import LRUCache
+from utilities.delta import update_graph
+from utilities.hierarchy import ClassHierarchy
+from utilities.ingest import RDFXML_FORMATS, ingest, ingest_files
+from utilities.layout import compute_layout
+from utilities.metrics import collect_spans, span
+from utilities.optimizer import CardinalityStats, optimized_query, optimizing
+from utilities.profile import QueryProfile
+from utilities.query_cache import QueryResultCache
+from utilities.registry import GraphRegistry, source_fingerprint
+from utilities.search import DEFAULT_LIMIT, SearchIndex
+from utilities.serialization import serialize
+from utilities.statistics import OntologyStatistics, statistics_query
+from utilities.templates import get_query_template
+from utilities.results import dataframe_to_table, query_results_to_dataframe, table_columns
+from utilities.timeseries import TimeSeriesIndex, series_dataframe, series_parameters
+from utilities.view import GraphView
 
-def get_sparql_query_results(endpoint, query_text):
+plugin.register('NumPy', Store, 'utilities.store', 'NumpyStore')
+plugin.register('Snapshot', Store, 'utilities.store', 'SnapshotStore')
+
+# rdflib store plugin used for shared graphs: 'default' (Memory), 'NumPy' or 'Snapshot',
+# the read-only memory-mapped store shared by every worker process
+DEFAULT_STORE = os.environ.get('SEMANTIC_WEB_STORE', 'default')
+
+# directory of the snapshot files opened by the 'Snapshot' store
+SNAPSHOT_DIR = os.environ.get('SEMANTIC_WEB_SNAPSHOT_DIR', os.path.join(tempfile.gettempdir(), 'semantic_web'))
+
+# store of the graphs of job processes, which start without the graphs of the server: 'Snapshot' maps
+# the shared snapshot files instead of parsing the ontologies again, see utilities.jobs
+JOB_STORE = os.environ.get('SEMANTIC_WEB_JOB_STORE', 'Snapshot')
+
+# reorder basic graph patterns by cardinality and push filters down, see utilities.optimizer
+OPTIMIZE_QUERIES = os.environ.get('SEMANTIC_WEB_OPTIMIZE_QUERIES', '1') != '0'
+
+
+def get_sparql_query_results(endpoint, query_text, init_bindings=None, column_names=None, cache_key=None,
+                             with_records=True, profile=None):
     """
     Return a sparql query result as a dictionary.
+    Results are cached per graph version, query and bindings.
     :param endpoint: endpoint
-    :param query_text: sparql query
+    :param query_text: sparql query text or prepared query
+    :param init_bindings: initial variable bindings of a prepared query
+    :param column_names: dictionary renaming result variables to column names
+    :param cache_key: identifies a prepared query in the result cache, defaults to the query text
+    :param with_records: build the DataTable records, otherwise records is None
+    :param profile: QueryProfile recording the time and solutions of every operator of the
+        query, see utilities.profile; the query is run even when its result is cached
     :return: query result as a dictionary
     """
-    g = build_ontology_as_rdflib_graph(endpoint)
-    query_results = g.query(query_text)
-    results_list_df = pd.DataFrame(query_results.bindings)
+    entry = get_ontology_entry(endpoint)
+    if cache_key is None and isinstance(query_text, str):
+        cache_key = query_text
+    key = None
+    if cache_key is not None and profile is None:
+        key = query_cache.key(endpoint, entry.version, cache_key, init_bindings, column_names)
+        result = query_cache.get(key)
+        if result is not None:
+            if with_records and result[0] is None:
+                result = (dataframe_to_table(result[2])[0],) + result[1:]
+                query_cache.put(key, result)
+            return result
 
-    records = results_list_df.to_dict('records')
-    columns = [{'name': index, 'id': index} for index in results_list_df.columns]
-    dataframe = pd.DataFrame(
-        data=([None if x is None else x.toPython() for x in row] for row in query_results),
-        columns=[str(x) for x in query_results.vars],
-    )
+    g = entry.graph
+    optimizer = contextlib.nullcontext()
+    if OPTIMIZE_QUERIES:
+        optimizer = optimizing(get_cardinality_stats(endpoint), get_class_hierarchy(endpoint),
+                               get_search_index(endpoint))
+        if not isinstance(query_text, str):
+            query_text = optimized_query(query_text)
+    recording = contextlib.nullcontext() if profile is None else profile.recording()
+    with span('sparql') as s, optimizer, recording:
+        query_results = g.query(query_text, initBindings=init_bindings or {})
+        # solutions are produced lazily, evaluate them inside the span
+        s.count(rows=len(query_results.bindings))
+    if profile is not None:
+        profile.rows = len(query_results.bindings)
+    with span('dataframe', rows=len(query_results.bindings)):
+        dataframe = query_results_to_dataframe(query_results, column_names)
+    if with_records:
+        with span('table', rows=len(dataframe)):
+            records, columns = dataframe_to_table(dataframe)
+    else:
+        records, columns = None, table_columns(dataframe)
 
-    return records, columns, dataframe
+    result = records, columns, dataframe
+    if key is not None:
+        query_cache.put(key, result)
+    return result
 
 
 def build_html_visualizer(endpoint):
@@ -34,24 +105,223 @@ def build_html_visualizer(endpoint):
     :param endpoint: ontology endpoint
     :return: None
     """
+    # ontospy is slow to import and only needed here
+    import ontospy
+    from ontospy.gendocs.viz.viz_html_single import HTMLVisualizer
     g = ontospy.Ontospy(endpoint)
     v = HTMLVisualizer(g)
     v.build()
     v.preview()
 
 
-def build_ontology_as_rdflib_graph(endpoint, fmt='application/rdf+xml'):
+def build_ontology_as_rdflib_graph(endpoint, fmt='application/rdf+xml', store='default', progress=None):
     """
-    Return a rdf graph of an ontology.
+    Return a rdf graph of an ontology. Local RDF/XML files are streamed into the store in batches.
     :param endpoint: ontology endpoint
     :param fmt: ontology format
+    :param store: rdflib store plugin name, e.g. 'default', 'NumPy' or 'Snapshot'
+    :param progress: callable(dictionary of statistics) reporting the progress of streamed files
     :return: rdf graph
     """
-    g = Graph()
-    g.parse(endpoint, format=fmt)
+    if store == 'Snapshot':
+        with span('open_snapshot') as s:
+            g = Graph(store=store)
+            g.open(get_shared_snapshot(endpoint, fmt))
+            s.count(triples=len(g))
+        return g
+    with span('parse') as s:
+        g = Graph(store=store)
+        if fmt in RDFXML_FORMATS and os.path.isfile(endpoint):
+            ingest(endpoint, g, progress=progress, keep_source=True)
+        else:
+            g.parse(endpoint, format=fmt)
+        s.count(triples=len(g))
     return g
 
 
+def shared_snapshot_filename(endpoint, fmt='application/rdf+xml'):
+    """
+    Return the snapshot filename of the current version of an ontology. The name includes
+    the source fingerprint, so a changed source gets a new file.
+    :param endpoint: ontology endpoint
+    :param fmt: ontology format
+    :return: (filename, filename pattern of every version)
+    """
+    source = os.path.abspath(endpoint) if os.path.exists(endpoint) else str(endpoint)
+    stem = hashlib.sha1(f'{source}|{fmt}'.encode('utf-8')).hexdigest()[:16]
+    version = hashlib.sha1(repr(source_fingerprint(endpoint)).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(SNAPSHOT_DIR, f'{stem}-{version}.swsnap'), os.path.join(SNAPSHOT_DIR, f'{stem}-*.swsnap')
+
+
+def get_shared_snapshot(endpoint, fmt='application/rdf+xml'):
+    """
+    Return the snapshot file of the current version of an ontology, parsing and writing it
+    when no process has yet. The file is moved into place whole, so processes switch
+    versions atomically, and processes still using an older file keep it mapped after it is removed.
+    :param endpoint: ontology endpoint
+    :param fmt: ontology format
+    :return: snapshot filename
+    """
+    filename, pattern = shared_snapshot_filename(endpoint, fmt)
+    if not os.path.exists(filename):
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        serialize(build_ontology_as_rdflib_graph(endpoint, fmt), filename, indexes=True)
+        _remove_old_snapshots(filename, pattern)
+    return filename
+
+
+def prepare_shared_snapshots(endpoints, fmt='application/rdf+xml', max_workers=None):
+    """
+    Write the missing snapshots of several ontologies, parsing the files in parallel processes.
+    :param endpoints: ontology endpoints
+    :param fmt: ontology format
+    :param max_workers: number of processes, the number of cpus when None
+    :return: list of dictionaries of ingestion statistics
+    """
+    jobs, patterns = [], {}
+    for endpoint in endpoints:
+        filename, pattern = shared_snapshot_filename(endpoint, fmt)
+        if not os.path.exists(filename) and fmt in RDFXML_FORMATS and os.path.isfile(endpoint):
+            jobs.append((endpoint, filename))
+            patterns[filename] = pattern
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    stats = ingest_files(jobs, max_workers)
+    for filename, pattern in patterns.items():
+        _remove_old_snapshots(filename, pattern)
+    return stats
+
+
+def _remove_old_snapshots(filename, pattern):
+    for old_filename in glob.glob(pattern):
+        if old_filename != filename:
+            try:
+                os.remove(old_filename)
+            except OSError:
+                pass
+
+
+# parsed ontologies shared by every callback and thread; changed sources are applied as triple deltas
+graph_registry = GraphRegistry(build_ontology_as_rdflib_graph, updater=update_graph)
+
+# query results, dropped whenever a new version of their ontology is loaded
+query_cache = QueryResultCache()
+graph_registry.add_listener(query_cache.on_new_version)
+
+# cytoscape views, one per loaded ontology version
+graph_views = LRUCache(max_entries=16)
+graph_registry.add_listener(lambda endpoint, version: graph_views.invalidate(
+    lambda k: k[0] == str(endpoint) and k[1] != version))
+
+# columnar date/price series, one index per loaded ontology version
+time_series_indexes = LRUCache(max_entries=16)
+
+
+def _update_time_series_index(endpoint, old_version, entry, added, removed):
+    index = time_series_indexes.peek((str(endpoint), old_version))
+    if index is not None:
+        time_series_indexes.put((str(endpoint), entry.version), index.updated(entry.graph, added, removed), size=0)
+
+
+graph_registry.add_delta_listener(_update_time_series_index)
+graph_registry.add_listener(lambda endpoint, version: time_series_indexes.invalidate(
+    lambda k: k[0] == str(endpoint) and k[1] != version))
+
+# triple, property and class counts answering aggregate queries, one per loaded ontology version
+ontology_statistics = LRUCache(max_entries=16)
+
+
+def _update_ontology_statistics(endpoint, old_version, entry, added, removed):
+    stats = ontology_statistics.peek((str(endpoint), old_version))
+    if stats is not None:
+        ontology_statistics.put((str(endpoint), entry.version), stats.updated(added, removed), size=0)
+
+
+graph_registry.add_delta_listener(_update_ontology_statistics)
+graph_registry.add_listener(lambda endpoint, version: ontology_statistics.invalidate(
+    lambda k: k[0] == str(endpoint) and k[1] != version))
+
+# rdfs:subClassOf closures answering hierarchy paths and the tree view, one per loaded ontology version
+class_hierarchies = LRUCache(max_entries=16)
+
+
+def _update_class_hierarchy(endpoint, old_version, entry, added, removed):
+    hierarchy = class_hierarchies.peek((str(endpoint), old_version))
+    if hierarchy is not None:
+        class_hierarchies.put((str(endpoint), entry.version), hierarchy.updated(entry.graph, added, removed), size=0)
+
+
+graph_registry.add_delta_listener(_update_class_hierarchy)
+graph_registry.add_listener(lambda endpoint, version: class_hierarchies.invalidate(
+    lambda k: k[0] == str(endpoint) and k[1] != version))
+
+# label and local name full-text indexes of the node search and label filters, one per loaded ontology version
+search_indexes = LRUCache(max_entries=16)
+
+
+def _update_search_index(endpoint, old_version, entry, added, removed):
+    index = search_indexes.peek((str(endpoint), old_version))
+    if index is not None:
+        search_indexes.put((str(endpoint), entry.version), index.updated(entry.graph, added, removed), size=0)
+
+
+graph_registry.add_delta_listener(_update_search_index)
+graph_registry.add_listener(lambda endpoint, version: search_indexes.invalidate(
+    lambda k: k[0] == str(endpoint) and k[1] != version))
+
+# triple counts per predicate and (predicate, object) for the query optimizer, one per loaded ontology version
+cardinality_stats = LRUCache(max_entries=16)
+
+
+def _update_cardinality_stats(endpoint, old_version, entry, added, removed):
+    stats = cardinality_stats.peek((str(endpoint), old_version))
+    if stats is not None:
+        cardinality_stats.put((str(endpoint), entry.version), stats.updated(added, removed), size=0)
+
+
+graph_registry.add_delta_listener(_update_cardinality_stats)
+graph_registry.add_listener(lambda endpoint, version: cardinality_stats.invalidate(
+    lambda k: k[0] == str(endpoint) and k[1] != version))
+
+# server-side node positions of cytoscape views
+BYTES_PER_POSITION = 200
+view_layouts = LRUCache(max_bytes=64 * 1024 * 1024)
+graph_registry.add_listener(lambda endpoint, version: view_layouts.invalidate(
+    lambda k: k[0] == str(endpoint) and k[1] != version))
+
+
+def get_ontology_entry(endpoint, fmt='application/rdf+xml', store=None):
+    """
+    Return the registry entry (graph and version) of an ontology.
+    :param endpoint: ontology endpoint
+    :param fmt: ontology format
+    :param store: rdflib store plugin name, DEFAULT_STORE when None
+    :return: GraphEntry
+    """
+    return graph_registry.entry(endpoint, fmt, store=store or DEFAULT_STORE)
+
+
+def get_ontology_graph(endpoint, fmt='application/rdf+xml', store=None):
+    """
+    Return the shared rdf graph of an ontology, parsing it only when it is not cached or has changed.
+    :param endpoint: ontology endpoint
+    :param fmt: ontology format
+    :param store: rdflib store plugin name, DEFAULT_STORE when None
+    :return: rdf graph
+    """
+    return get_ontology_entry(endpoint, fmt, store).graph
+
+
+def get_ontology_version(endpoint, fmt='application/rdf+xml', store=None):
+    """
+    Return the version of the shared rdf graph of an ontology.
+    :param endpoint: ontology endpoint
+    :param fmt: ontology format
+    :param store: rdflib store plugin name, DEFAULT_STORE when None
+    :return: version number
+    """
+    return get_ontology_entry(endpoint, fmt, store).version
+
+
 def build_ontology_as_networkx(endpoint, fmt='application/rdf+xml'):
     """
     Return a networkx graph from an ontology,
@@ -59,31 +329,344 @@ def build_ontology_as_networkx(endpoint, fmt='application/rdf+xml'):
     :param fmt: ontology format
     :return: networkx graph
     """
-    g = build_ontology_as_rdflib_graph(endpoint, fmt)
-    g = rdflib_to_networkx_graph(g)
+    from rdflib.extras.external_graph_libs import rdflib_to_networkx_graph
+    g = get_ontology_graph(endpoint, fmt)
+    with span('networkx', triples=len(g)) as s:
+        g = rdflib_to_networkx_graph(g)
+        s.count(nodes=g.number_of_nodes(), edges=g.number_of_edges())
     return g
 
 
-def get_cytoscape_elements(endpoint):
+def get_graph_view(endpoint):
     """
-    Return a javascript-based cytoscape of a rdf ontology which requires nodes and edges.
+    Return the level-of-detail view of an ontology, built once per ontology version.
     :param endpoint: ontology endpoint
-    :return: list of dictionaries specifying nodes and edges
+    :return: GraphView
     """
-    g = build_ontology_as_networkx(endpoint)
-    cy = nx.readwrite.json_graph.cytoscape_data(g)
+    entry = get_ontology_entry(endpoint)
+    key = (str(endpoint), entry.version)
+    view = graph_views.get(key)
+    if view is None:
+        view = GraphView(entry.graph)
+        graph_views.put(key, view, size=0)
+    return view
 
-    for n in cy['elements']['nodes']:
-        for k, v in n.items():
-            v['label'] = v.pop('value')
-            v['label'] = str(v['label'])
-            del v['name']
 
-    for n in cy['elements']['edges']:
-        for k, v in n.items():
-            v['source'] = str(v['source'])
-            v['target'] = str(v['target'])
-            del v['weight']
+def get_time_series_index(endpoint):
+    """
+    Return the time-series index of an ontology, built once per ontology version.
+    :param endpoint: ontology endpoint
+    :return: TimeSeriesIndex
+    """
+    entry = get_ontology_entry(endpoint)
+    key = (str(endpoint), entry.version)
+    index = time_series_indexes.get(key)
+    if index is None:
+        with span('timeseries_index') as s:
+            index = TimeSeriesIndex(entry.graph)
+            s.count(series=len(index.series))
+        time_series_indexes.put(key, index, size=0)
+    return index
 
-    elements = cy['elements']['nodes'] + cy['elements']['edges']
+
+def get_ontology_statistics(endpoint):
+    """
+    Return the aggregate statistics of an ontology, counted once per ontology version.
+    :param endpoint: ontology endpoint
+    :return: OntologyStatistics
+    """
+    entry = get_ontology_entry(endpoint)
+    key = (str(endpoint), entry.version)
+    stats = ontology_statistics.get(key)
+    if stats is None:
+        with span('statistics') as s:
+            stats = OntologyStatistics(entry.graph)
+            s.count(triples=stats.triples)
+        ontology_statistics.put(key, stats, size=0)
+    return stats
+
+
+def get_statistics_results(endpoint, template, values, with_records=True, stats=None):
+    """
+    Return the result of an aggregate query template from the ontology statistics, skipping sparql.
+    :param endpoint: ontology endpoint
+    :param template: QueryTemplate
+    :param values: dictionary of control name to value
+    :param with_records: build the DataTable records, otherwise records is None
+    :param stats: OntologyStatistics, those of the current ontology version when None
+    :return: (records, columns, dataframe), or None when the query must run as sparql
+    """
+    query = statistics_query(template.query, template.slots)
+    if query is None:
+        return None
+    if stats is None:
+        stats = get_ontology_statistics(endpoint)
+    with span('statistics_query') as s:
+        dataframe = query_results_to_dataframe(query.result(stats), template.column_names(values))
+        s.count(rows=len(dataframe))
+    if with_records:
+        with span('table', rows=len(dataframe)):
+            return dataframe_to_table(dataframe) + (dataframe,)
+    return None, table_columns(dataframe), dataframe
+
+
+def get_class_hierarchy(endpoint):
+    """
+    Return the class hierarchy of an ontology, built once per ontology version.
+    :param endpoint: ontology endpoint
+    :return: ClassHierarchy
+    """
+    entry = get_ontology_entry(endpoint)
+    key = (str(endpoint), entry.version)
+    hierarchy = class_hierarchies.get(key)
+    if hierarchy is None:
+        with span('hierarchy') as s:
+            hierarchy = ClassHierarchy(entry.graph)
+            s.count(classes=len(hierarchy))
+        class_hierarchies.put(key, hierarchy, size=0)
+    return hierarchy
+
+
+def get_search_index(endpoint):
+    """
+    Return the full-text search index of an ontology, built once per ontology version.
+    :param endpoint: ontology endpoint
+    :return: SearchIndex
+    """
+    entry = get_ontology_entry(endpoint)
+    key = (str(endpoint), entry.version)
+    index = search_indexes.get(key)
+    if index is None:
+        with span('search_index') as s:
+            index = SearchIndex(entry.graph)
+            s.count(terms=len(index), tokens=len(index.vocabulary))
+        search_indexes.put(key, index, size=0)
+    return index
+
+
+def search_ontology(endpoint, text, limit=DEFAULT_LIMIT):
+    """
+    Return the IRIs of an ontology whose labels or local names match a search text.
+    :param endpoint: ontology endpoint
+    :param text: search text
+    :param limit: maximum number of results
+    :return: list of (IRI, display name), best first
+    """
+    index = get_search_index(endpoint)
+    with span('search') as s:
+        results = index.search(text, limit)
+        s.count(results=len(results))
+    return results
+
+
+def get_cardinality_stats(endpoint):
+    """
+    Return the cardinality statistics of an ontology, counted once per ontology version.
+    :param endpoint: ontology endpoint
+    :return: CardinalityStats
+    """
+    entry = get_ontology_entry(endpoint)
+    key = (str(endpoint), entry.version)
+    stats = cardinality_stats.get(key)
+    if stats is None:
+        with span('cardinality_stats') as s:
+            stats = CardinalityStats(entry.graph)
+            s.count(triples=stats.triples, predicates=len(stats.predicates))
+        cardinality_stats.put(key, stats, size=0)
+    return stats
+
+
+def get_time_series_results(endpoint, template, values, with_records=True):
+    """
+    Return the result of a time-series query template from the time-series index, skipping sparql.
+    :param endpoint: ontology endpoint
+    :param template: QueryTemplate declaring its series parameters
+    :param values: dictionary of control name to value
+    :param with_records: build the DataTable records, otherwise records is None
+    :return: (records, columns, dataframe), or None when the query must run as sparql
+    """
+    if not series_parameters(template):
+        return None
+    index = get_time_series_index(endpoint)
+    with span('timeseries') as s:
+        dataframe = series_dataframe(index, template, values)
+        s.count(rows=0 if dataframe is None else len(dataframe))
+    if dataframe is None:
+        return None
+    if with_records:
+        with span('table', rows=len(dataframe)):
+            return dataframe_to_table(dataframe) + (dataframe,)
+    return None, table_columns(dataframe), dataframe
+
+
+def get_template_results(endpoint, template, values, with_records=True):
+    """
+    Return the result of a query template, from the time-series index when the template
+    declares series, from the ontology statistics when it is a recognized aggregate and
+    from sparql otherwise.
+    :param endpoint: ontology endpoint
+    :param template: QueryTemplate
+    :param values: dictionary of control name to value
+    :param with_records: build the DataTable records, otherwise records is None
+    :return: (records, columns, dataframe)
+    """
+    results = get_time_series_results(endpoint, template, values, with_records)
+    if results is None:
+        results = get_statistics_results(endpoint, template, values, with_records)
+    if results is None:
+        results = get_sparql_query_results(
+            endpoint, template.query, template.bindings(values), template.column_names(values),
+            cache_key=template.id, with_records=with_records)
+    return results
+
+
+def get_ready_template_results(endpoint, template, values):
+    """
+    Return the result of a query template when it is answered without running sparql:
+    the ontology is loaded and the query is cached or served by the time-series index
+    or the ontology statistics.
+    :param endpoint: ontology endpoint
+    :param template: QueryTemplate
+    :param values: dictionary of control name to value
+    :return: (None, columns, dataframe), or None when the query has to run
+    """
+    entry = graph_registry.peek(endpoint, 'application/rdf+xml', store=DEFAULT_STORE)
+    if entry is None:
+        return None
+    results = get_time_series_results(endpoint, template, values, with_records=False)
+    if results is not None:
+        return results
+    stats = ontology_statistics.peek((str(endpoint), entry.version))
+    if stats is not None:
+        results = get_statistics_results(endpoint, template, values, with_records=False, stats=stats)
+        if results is not None:
+            return results
+    key = query_cache.key(endpoint, entry.version, template.id, template.bindings(values), template.column_names(values))
+    return query_cache.get(key)
+
+
+def _use_job_store():
+    """
+    Open the graphs of a job process with JOB_STORE, the process only runs the job.
+    """
+    global DEFAULT_STORE
+    DEFAULT_STORE = JOB_STORE
+
+
+def run_query_job(endpoint, template_text, values, progress):
+    """
+    Run a query template in a job process, see utilities.jobs.
+    :param endpoint: ontology endpoint
+    :param template_text: query template text
+    :param values: dictionary of control name to value
+    :param progress: callable(message) reporting the job status
+    :return: (source fingerprint of the graph queried, columns, dataframe, list of the spans timed in the job,
+        see utilities.metrics)
+    """
+    _use_job_store()
+    with collect_spans() as spans:
+        progress('loading ontology')
+        fingerprint = get_ontology_entry(endpoint).fingerprint
+        progress('running query')
+        template = get_query_template(template_text)
+        _, columns, dataframe = get_template_results(endpoint, template, values, with_records=False)
+    progress(f'sending {len(dataframe)} rows')
+    return fingerprint, columns, dataframe, spans
+
+
+def run_profile_job(endpoint, template_text, values, progress):
+    """
+    Profile the sparql query of a query template in a job process, see utilities.jobs.
+    Templates answered by the time-series index are profiled as sparql as well.
+    :param endpoint: ontology endpoint
+    :param template_text: query template text
+    :param values: dictionary of control name to value
+    :param progress: callable(message) reporting the job status
+    :return: dictionary with the operator tree, see QueryProfile.tree, the seconds and rows of the query
+    """
+    _use_job_store()
+    progress('loading ontology')
+    get_ontology_version(endpoint)
+    progress('profiling query')
+    template = get_query_template(template_text)
+    profile = QueryProfile(template.query)
+    get_sparql_query_results(endpoint, template.query, template.bindings(values), template.column_names(values),
+                             with_records=False, profile=profile)
+    return {'tree': profile.tree(), 'seconds': profile.seconds, 'rows': profile.rows}
+
+
+def cache_template_results(endpoint, fingerprint, template, values, results):
+    """
+    Keep the result of a query template computed by a job process, so that it is not run again.
+    Versions are numbered per process, the job and the loaded graph are compared by source fingerprint.
+    :param endpoint: ontology endpoint
+    :param fingerprint: source fingerprint of the graph the job queried
+    :param template: QueryTemplate
+    :param values: dictionary of control name to value
+    :param results: (records, columns, dataframe)
+    :return: None
+    """
+    entry = graph_registry.peek(endpoint, 'application/rdf+xml', store=DEFAULT_STORE)
+    if entry is None or entry.fingerprint != fingerprint:
+        return
+    key = query_cache.key(endpoint, entry.version, template.id, template.bindings(values),
+                          template.column_names(values))
+    query_cache.put(key, results)
+
+
+def get_view_layout(endpoint, name, detail='summary', expanded=()):
+    """
+    Return a preset cytoscape layout of an ontology view, computed on the server and
+    cached per ontology version, layout and displayed elements.
+    :param endpoint: ontology endpoint
+    :param name: layout name, one of utilities.layout.LAYOUTS
+    :param detail: 'summary' or 'full'
+    :param expanded: ids of nodes expanded in the summary
+    :return: cytoscape layout dictionary
+    """
+    view = get_graph_view(endpoint)
+    expanded = tuple(expanded or ()) if detail == 'summary' else ()
+    key = (str(endpoint), get_ontology_version(endpoint), name, detail, expanded)
+    layout = view_layouts.get(key)
+    if layout is None:
+        elements = view.elements() if detail == 'full' else view.visible(expanded)
+        with span('layout', elements=len(elements)):
+            layout = compute_layout(elements, name)
+        view_layouts.put(key, layout, size=len(layout['positions']) * BYTES_PER_POSITION)
+    return layout
+
+
+def warm_up_ontology(endpoint, layout='grid'):
+    """
+    Load an ontology and build everything its first query and view need: the graph, the
+    snapshot job processes open, the time-series index, the statistics, the class hierarchy,
+    the search index, the summarized view and its layout.
+    :param endpoint: ontology endpoint
+    :param layout: layout name
+    :return: None
+    """
+    get_ontology_entry(endpoint)
+    if JOB_STORE == 'Snapshot':
+        # the first query job maps it instead of parsing the ontology
+        get_shared_snapshot(endpoint)
+    get_time_series_index(endpoint)
+    get_ontology_statistics(endpoint)
+    get_class_hierarchy(endpoint)
+    get_search_index(endpoint)
+    if OPTIMIZE_QUERIES:
+        get_cardinality_stats(endpoint)
+    get_view_layout(endpoint, layout)
+
+
+def get_cytoscape_elements(endpoint):
+    """
+    Return a javascript-based cytoscape of a rdf ontology which requires nodes and edges.
+    The element list is computed once per ontology version.
+    :param endpoint: ontology endpoint
+    :return: list of dictionaries specifying nodes and edges
+    """
+    view = get_graph_view(endpoint)
+    with span('cytoscape') as s:
+        elements = view.elements()
+        s.count(elements=len(elements))
     return elements
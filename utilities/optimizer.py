@@ -0,0 +1,377 @@
+import contextlib
+import contextvars
+import threading
+import weakref
+
+from rdflib import BNode, Literal, Variable
+from rdflib.paths import Path
+from rdflib.plugins.sparql import CUSTOM_EVALS
+from rdflib.plugins.sparql.evalutils import _ebv
+from rdflib.plugins.sparql.parserutils import CompValue
+from rdflib.plugins.sparql.sparql import AlreadyBound, Query
+
+from utilities.hierarchy import hierarchy_paths, using_hierarchy
+from utilities.search import label_values, using_search
+
+# the cardinality statistics of the graph being queried, None when optimization is off
+_active = contextvars.ContextVar('optimizer', default=None)
+
+# queries with their filters pushed down, per prepared query
+_optimized_queries = weakref.WeakKeyDictionary()
+_optimized_lock = threading.Lock()
+
+# a variable bound by an earlier pattern, whose value is not known when the patterns are ordered
+_BOUND = object()
+
+
+class CardinalityStats:
+    """
+    Triple counts of a graph per predicate and per (predicate, object), used to estimate
+    how many solutions a triple pattern produces. Objects are counted per IRI and blank
+    node only: literals are mostly distinct and would make the statistics as large as the graph.
+    """
+
+    def __init__(self, graph=None):
+        """
+        :param graph: rdflib graph to count, empty statistics when None
+        """
+        self.triples = 0
+        self.subjects = 0
+        self.objects = 0
+        # predicate to [triples, distinct subjects, distinct objects]
+        self.predicates = {}
+        # (predicate, object) to triples
+        self.predicate_objects = {}
+        if graph is not None:
+            self._count(graph)
+
+    def _count(self, graph):
+        subjects, objects, by_predicate = set(), set(), {}
+        predicate_objects = self.predicate_objects
+        for s, p, o in graph.triples((None, None, None)):
+            subjects.add(s)
+            objects.add(o)
+            counts = by_predicate.get(p)
+            if counts is None:
+                counts = by_predicate[p] = [0, set(), set()]
+            counts[0] += 1
+            counts[1].add(s)
+            counts[2].add(o)
+            if not isinstance(o, Literal):
+                predicate_objects[p, o] = predicate_objects.get((p, o), 0) + 1
+        self.triples = sum(counts[0] for counts in by_predicate.values())
+        self.subjects = len(subjects)
+        self.objects = len(objects)
+        self.predicates = {p: [n, len(p_subjects), len(p_objects)]
+                           for p, (n, p_subjects, p_objects) in by_predicate.items()}
+
+    def updated(self, added, removed):
+        """
+        Return the statistics after a delta. Triple counts are exact; distinct subject and
+        object counts are kept from before the delta, which is good enough for estimates.
+        :param added: set of triples added
+        :param removed: set of triples removed
+        :return: CardinalityStats
+        """
+        stats = CardinalityStats()
+        stats.subjects, stats.objects = self.subjects, self.objects
+        stats.predicates = {p: list(counts) for p, counts in self.predicates.items()}
+        stats.predicate_objects = dict(self.predicate_objects)
+        stats.triples = self.triples + len(added) - len(removed)
+        for triples, sign in ((added, 1), (removed, -1)):
+            for _, p, o in triples:
+                counts = stats.predicates.setdefault(p, [0, 1, 1])
+                counts[0] = max(counts[0] + sign, 0)
+                if not isinstance(o, Literal):
+                    stats.predicate_objects[p, o] = max(stats.predicate_objects.get((p, o), 0) + sign, 0)
+        return stats
+
+    def estimate(self, s, p, o):
+        """
+        Estimate the number of triples matching a pattern.
+        :param s: subject value, _BOUND when bound to an unknown value, None when unbound
+        :param p: predicate value, _BOUND or None
+        :param o: object value, _BOUND or None
+        :return: estimated number of triples
+        """
+        if p is None or p is _BOUND or isinstance(p, Path):
+            # a property path is estimated as any predicate
+            n, subjects, objects = self.triples, self.subjects, self.objects
+            if p is _BOUND:
+                n /= max(len(self.predicates), 1)
+        else:
+            counts = self.predicates.get(p)
+            if counts is None:
+                return 0
+            n, subjects, objects = counts
+            if o is not None and o is not _BOUND and not isinstance(o, Literal):
+                n = self.predicate_objects.get((p, o), 0)
+                o = None
+        if o is not None:
+            n /= max(objects, 1)
+        if s is not None:
+            n /= max(subjects, 1)
+        return n
+
+
+def reorder_triples(triples, stats, ctx):
+    """
+    Order the patterns of a basic graph pattern greedily: the pattern estimated to produce the
+    fewest solutions, given the variables bound so far, runs first.
+    :param triples: list of (s, p, o) patterns
+    :param stats: CardinalityStats of the queried graph
+    :param ctx: rdflib QueryContext with the bindings the pattern is evaluated with
+    :return: list of patterns
+    """
+    bound = set()
+
+    # blank nodes of a query pattern are variables
+    def value(term):
+        if not isinstance(term, (Variable, BNode)):
+            return term
+        if term in bound:
+            return _BOUND
+        return ctx[term]
+
+    remaining = list(triples)
+    ordered = []
+    while remaining:
+        best = min(range(len(remaining)), key=lambda i: stats.estimate(*(value(t) for t in remaining[i])))
+        pattern = remaining.pop(best)
+        ordered.append(pattern)
+        bound.update(t for t in pattern if isinstance(t, (Variable, BNode)))
+    return ordered
+
+
+def expression_variables(expr):
+    """
+    Return the variables an expression refers to.
+    :param expr: rdflib algebra expression
+    :return: set of Variable
+    """
+    if isinstance(expr, Variable):
+        return {expr}
+    if isinstance(expr, (CompValue, dict)):
+        return set().union(*(expression_variables(v) for k, v in expr.items() if k != '_vars'))
+    if isinstance(expr, (list, tuple)):
+        return set().union(*(expression_variables(v) for v in expr))
+    return set()
+
+
+def conjuncts(expr):
+    """
+    Split a filter expression on its top-level &&.
+    :param expr: rdflib algebra expression
+    :return: list of expressions, all true exactly when the expression is
+    """
+    if isinstance(expr, CompValue) and expr.name == 'ConditionalAndExpression':
+        return [c for e in [expr['expr']] + list(expr['other'] or []) for c in conjuncts(e)]
+    return [expr]
+
+
+def _conjunction(exprs):
+    if len(exprs) == 1:
+        return exprs[0]
+    return CompValue('ConditionalAndExpression', expr=exprs[0], other=list(exprs[1:]),
+                     _vars=expression_variables(exprs))
+
+
+def certain_variables(part):
+    """
+    Return the variables bound in every solution of a graph pattern.
+    :param part: algebra operator
+    :return: set of Variable
+    """
+    if part.name == 'BGP':
+        return {t for triple in part.triples for t in triple if isinstance(t, Variable)}
+    if part.name == 'Join':
+        return certain_variables(part.p1) | certain_variables(part.p2)
+    if part.name in ('LeftJoin', 'Minus'):
+        return certain_variables(part.p1)
+    if part.name == 'Union':
+        return certain_variables(part.p1) & certain_variables(part.p2)
+    if part.name in ('Filter', 'Extend', 'Distinct', 'Reduced', 'OrderBy'):
+        return certain_variables(part.p)
+    return set()
+
+
+def _filter(exprs, part, template):
+    filtered = template.clone()
+    filtered['expr'] = _conjunction(exprs)
+    filtered['p'] = part
+    return filtered
+
+
+def _place(exprs, part, template):
+    """
+    Apply filter conjuncts to a graph pattern, as deep into it as their variables allow.
+    :param exprs: conjuncts
+    :param part: algebra operator the conjuncts filter
+    :param template: the Filter operator the conjuncts come from
+    :return: algebra operator
+    """
+    if part.name == 'BGP':
+        bgp = part.clone()
+        bgp['filters'] = list(part.filters or []) + list(exprs)
+        return bgp
+    if part.name == 'Filter':
+        return _place(list(exprs) + conjuncts(part.expr), part.p, part)
+    if part.name == 'Union':
+        # every solution comes from one branch, filtering both branches is the same
+        union = part.clone()
+        union['p1'] = _place(exprs, part.p1, template)
+        union['p2'] = _place(exprs, part.p2, template)
+        return union
+    if part.name in ('Join', 'LeftJoin'):
+        branches = ('p1', 'p2') if part.name == 'Join' else ('p1',)
+        pushed = {k: [] for k in branches}
+        kept = []
+        for expr in exprs:
+            variables = expression_variables(expr)
+            k = next((k for k in branches if variables <= certain_variables(part[k])), None)
+            (kept if k is None else pushed[k]).append(expr)
+        join = push_filters(part)
+        for k, k_exprs in pushed.items():
+            if k_exprs:
+                join[k] = _place(k_exprs, join[k], template)
+        return _filter(kept, join, template) if kept else join
+    return _filter(exprs, push_filters(part), template)
+
+
+def push_filters(part):
+    """
+    Return an algebra tree with every FILTER moved down to the earliest graph pattern binding
+    its variables: into both branches of a UNION, into the side of a join binding them and into
+    basic graph patterns, where it is checked as soon as the patterns bind its variables.
+    :param part: algebra operator
+    :return: algebra operator, the operator itself when nothing moved
+    """
+    if not isinstance(part, CompValue):
+        return part
+    if part.name == 'Filter' and isinstance(part.p, CompValue):
+        return _place(conjuncts(part.expr), part.p, part)
+    changed = None
+    for k, v in part.items():
+        if isinstance(v, CompValue) and k != 'expr':
+            pushed = push_filters(v)
+            if pushed is not v:
+                if changed is None:
+                    changed = part.clone()
+                changed[k] = pushed
+    return part if changed is None else changed
+
+
+def optimized_query(query):
+    """
+    Return a prepared query with its filters pushed down and its rdfs:subClassOf paths
+    answered from the class hierarchy, rewritten once per query.
+    :param query: prepared query
+    :return: prepared query
+    """
+    with _optimized_lock:
+        optimized = _optimized_queries.get(query)
+        if optimized is None:
+            optimized = Query(query.prologue, hierarchy_paths(push_filters(query.algebra)))
+            _optimized_queries[query] = optimized
+    return optimized
+
+
+def _eval_bgp(ctx, triples, checks, i=0):
+    """
+    rdflib's evalBGP, checking filter conjuncts as soon as the patterns bind their variables.
+    :param checks: list, per number of patterns matched, of the conjuncts to check then
+    """
+    if checks[i] and not all(_ebv(expr, ctx.solution()) for expr in checks[i]):
+        return
+    if i == len(triples):
+        yield ctx.solution()
+        return
+
+    s, p, o = triples[i]
+    _s, _p, _o = ctx[s], ctx[p], ctx[o]
+    for ss, sp, so in ctx.graph.triples((_s, _p, _o)):
+        c = ctx.push() if None in (_s, _p, _o) else ctx
+        try:
+            if _s is None:
+                c[s] = ss
+            if _p is None:
+                c[p] = sp
+            if _o is None:
+                c[o] = so
+        except AlreadyBound:
+            continue
+        yield from _eval_bgp(c, triples, checks, i + 1)
+
+
+def _plan(ctx, triples, filters, stats):
+    """
+    Return the order of the patterns of a basic graph pattern and the filter conjuncts checked
+    after each, see _eval_bgp.
+    """
+    if stats is not None and len(triples) > 1:
+        triples = reorder_triples(triples, stats, ctx)
+
+    # a conjunct is checked after the first patterns binding all its variables, or at the end
+    bound = {v for v in set().union(*(expression_variables(e) for e in filters)) if ctx[v] is not None}
+    checks = [[] for _ in range(len(triples) + 1)]
+    for expr in filters:
+        variables = expression_variables(expr) - bound
+        i = 0
+        while variables and i < len(triples):
+            variables -= set(triples[i])
+            i += 1
+        checks[len(triples) if variables else i].append(expr)
+    return triples, checks
+
+
+def _eval_values(ctx, triples, filters, stats, variable, values):
+    """
+    Evaluate a basic graph pattern once per value of a variable, as joined with a VALUES block.
+    """
+    plan = None
+    for value in values:
+        c = ctx.push()
+        c[variable] = value
+        if plan is None:
+            plan = _plan(c, triples, filters, stats)
+        yield from _eval_bgp(c, *plan)
+
+
+def _optimize_eval(ctx, part):
+    """
+    rdflib custom evaluation hook: orders the patterns of basic graph patterns by their
+    estimated cardinality and checks the filters pushed into them. Labels filtered with
+    STRSTARTS or CONTAINS are looked up in the search index instead of being scanned.
+    """
+    if part.name != 'BGP':
+        raise NotImplementedError()
+    stats = _active.get()
+    triples = part.triples
+    filters = part.filters or []
+    values = label_values(triples, filters, ctx)
+    if values is not None:
+        return _eval_values(ctx, triples, filters, stats, *values)
+    if not filters and (stats is None or len(triples) < 2):
+        raise NotImplementedError()
+    return _eval_bgp(ctx, *_plan(ctx, triples, filters, stats))
+
+
+@contextlib.contextmanager
+def optimizing(stats, hierarchy=None, search=None):
+    """
+    Order the basic graph patterns of the queries evaluated inside the block by the
+    cardinalities of the queried graph.
+    :param stats: CardinalityStats of the queried graph
+    :param hierarchy: ClassHierarchy of the queried graph answering rdfs:subClassOf paths
+    :param search: SearchIndex of the queried graph answering STRSTARTS and CONTAINS on labels
+    :return: context manager
+    """
+    token = _active.set(stats)
+    try:
+        with using_hierarchy(hierarchy), using_search(search):
+            yield stats
+    finally:
+        _active.reset(token)
+
+
+CUSTOM_EVALS['semantic_web_optimizer'] = _optimize_eval
@@ -0,0 +1,163 @@
+import base64
+import functools
+import gzip
+import importlib.util
+import os
+import re
+
+import numpy as np
+
+from utilities.cache import LRUCache
+from utilities.metrics import span
+
+try:
+    # brotli compresses better than gzip in the same time, gzip is used without it
+    import brotli
+except ImportError:
+    brotli = None
+
+# responses smaller than this are sent as they are
+MIN_COMPRESS_BYTES = 1024
+
+# compression levels trading a little size for speed, the largest callback responses are megabytes
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+# mimetypes of the responses compressed
+COMPRESSED_MIMETYPES = ('application/json', 'text/html', 'text/plain', 'text/css', 'text/javascript',
+                        'application/javascript')
+
+# compressed bodies of the immutable Dash component bundles, by path and encoding
+compressed_bundles = LRUCache(max_bytes=64 * 1024 * 1024, sizeof=len)
+
+# plotly.js decodes typed arrays from this version on, older bundles get plain lists
+TYPED_ARRAYS_SINCE = (2, 28)
+
+# plotly.js bundles served by Dash: its own up to Dash 2.16, the plotly package's after
+PLOTLY_JS_BUNDLES = (('dash', 'dcc/plotly.min.js'), ('plotly', 'package_data/plotly.min.js'))
+
+_PLOTLY_JS_VERSION = re.compile(rb'plotly\.js v(\d+)\.(\d+)\.(\d+)')
+
+# numpy dtypes plotly.js decodes from typed arrays, by numpy kind and item size
+_TYPED_ARRAY_DTYPES = {
+    ('f', 8): 'f8', ('f', 4): 'f4',
+    ('i', 4): 'i4', ('i', 2): 'i2', ('i', 1): 'i1',
+    ('u', 4): 'u4', ('u', 2): 'u2', ('u', 1): 'u1',
+}
+
+
+@functools.lru_cache(maxsize=1)
+def plotly_js_version():
+    """
+    Return the version of the plotly.js bundle Dash serves, read from its header.
+    :return: (major, minor, patch), None when no bundle is found
+    """
+    for package, path in PLOTLY_JS_BUNDLES:
+        spec = importlib.util.find_spec(package)
+        if spec is None or not spec.submodule_search_locations:
+            continue
+        filename = os.path.join(spec.submodule_search_locations[0], path)
+        if os.path.exists(filename):
+            with open(filename, 'rb') as f:
+                m = _PLOTLY_JS_VERSION.search(f.read(512))
+            return tuple(int(n) for n in m.groups()) if m else None
+    return None
+
+
+def typed_arrays_supported():
+    """
+    Return whether the plotly.js bundle Dash serves decodes typed arrays.
+    :return: bool
+    """
+    version = plotly_js_version()
+    return version is not None and version >= TYPED_ARRAYS_SINCE
+
+
+def typed_array(values):
+    """
+    Return a numeric array as a plotly.js typed array, its bytes in base64 with their dtype.
+    It is about half the size of a JSON list of floats and decoded by the browser without
+    parsing. Datetimes are sent as milliseconds since the epoch, 64-bit integers as floats.
+    :param values: numpy array of numbers, booleans or datetime64
+    :return: dictionary {'dtype', 'bdata'}
+    """
+    values = np.asarray(values)
+    if values.dtype.kind == 'M':
+        values = values.astype('datetime64[ms]').astype(np.int64).astype(np.float64)
+    elif values.dtype.kind == 'b':
+        values = values.astype(np.uint8)
+    dtype = _TYPED_ARRAY_DTYPES.get((values.dtype.kind, values.dtype.itemsize))
+    if dtype is None:
+        values, dtype = values.astype(np.float64), 'f8'
+    data = np.ascontiguousarray(values, dtype=values.dtype.newbyteorder('<'))
+    return {'dtype': dtype, 'bdata': base64.b64encode(data.tobytes()).decode('ascii')}
+
+
+def compact_figure(figure, typed_arrays=None):
+    """
+    Encode the numpy arrays of the traces of a figure dictionary as typed arrays, a date x
+    axis being declared as such. Other arrays are turned into lists, which the JSON encoder
+    serializes without converting the whole response first, and so are all arrays when the
+    plotly.js bundle served is too old to decode typed arrays.
+    :param figure: plotly figure dictionary, e.g. from utilities.charts.build_figure
+    :param typed_arrays: send typed arrays, typed_arrays_supported() when None
+    :return: the figure, changed in place
+    """
+    if typed_arrays is None:
+        typed_arrays = typed_arrays_supported()
+    with span('compact_figure') as s:
+        points = 0
+        for trace in figure['data']:
+            for key in ('x', 'y'):
+                values = trace.get(key)
+                if not isinstance(values, np.ndarray):
+                    continue
+                points += len(values)
+                if values.dtype.kind == 'M':
+                    figure['layout'].setdefault(f'{key}axis', {})['type'] = 'date'
+                if typed_arrays and values.dtype.kind in 'iufbM':
+                    trace[key] = typed_array(values)
+                elif values.dtype.kind == 'M':
+                    # datetime64[ns] lists hold integers, milliseconds hold datetimes
+                    trace[key] = values.astype('datetime64[ms]').tolist()
+                else:
+                    trace[key] = values.tolist()
+        s.count(points=points)
+    return figure
+
+
+def compress_response(response, accept_encodings, cache_key=None):
+    """
+    Compress the body of a Flask response with brotli or gzip, the best one the client accepts.
+    Streamed responses, unless cached, already encoded, small and binary responses are left as they are.
+    :param response: Flask response
+    :param accept_encodings: werkzeug Accept of the request, flask.request.accept_encodings
+    :param cache_key: key of a response whose body never changes, compressed once, e.g. a file
+        streamed by Dash
+    :return: (uncompressed bytes, sent bytes)
+    """
+    if (response.direct_passthrough or (response.is_streamed and cache_key is None) or response.status_code != 200
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSED_MIMETYPES):
+        size = response.calculate_content_length() or 0
+        return size, size
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_BYTES:
+        return len(data), len(data)
+    encoding = accept_encodings.best_match(('br', 'gzip') if brotli is not None else ('gzip',))
+    if encoding is None:
+        return len(data), len(data)
+
+    compressed = None if cache_key is None else compressed_bundles.get((cache_key, encoding))
+    if compressed is None:
+        with span('compress', bytes=len(data)) as s:
+            if encoding == 'br':
+                compressed = brotli.compress(data, quality=BROTLI_QUALITY)
+            else:
+                compressed = gzip.compress(data, GZIP_LEVEL)
+            s.count(wire_bytes=len(compressed))
+        if cache_key is not None:
+            compressed_bundles.put((cache_key, encoding), compressed)
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return len(data), len(compressed)
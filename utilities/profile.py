@@ -0,0 +1,221 @@
+import contextlib
+import contextvars
+import time
+
+from rdflib.plugins.sparql import CUSTOM_EVALS
+from rdflib.plugins.sparql.evaluate import evalPart
+from rdflib.plugins.sparql.parserutils import CompValue
+
+from utilities.optimizer import expression_variables
+
+# operands of an algebra operator that are themselves operators
+CHILD_KEYS = ('p', 'p1', 'p2')
+
+# the profile being recorded by this thread or task, None when profiling is off
+_active = contextvars.ContextVar('profile', default=None)
+
+
+class OperatorStats:
+    """
+    Wall time and solutions of one operator of a query's algebra tree, accumulated over
+    every time it is evaluated, e.g. once per solution of the left side of an OPTIONAL.
+    """
+
+    def __init__(self, part):
+        self.part = part
+        self.calls = 0
+        self.solutions = 0
+        self.seconds = 0.0
+        self.child_seconds = 0.0
+
+    @property
+    def self_seconds(self):
+        return max(self.seconds - self.child_seconds, 0.0)
+
+
+class QueryProfile:
+    """
+    Per-operator statistics of one query evaluation, recorded while recording() is active.
+    Time is wall time spent producing solutions, including the operators below; the self
+    time excludes them.
+    """
+
+    def __init__(self, query=None):
+        """
+        :param query: prepared query, whose prefixes shorten the IRIs of the tree and whose
+            algebra is the tree when no operator was evaluated
+        """
+        self.stats = {}
+        self.stack = []
+        self.seconds = 0.0
+        self.rows = None
+        self.algebra = None
+        self.namespace_manager = None
+        if query is not None:
+            self.algebra = query.algebra
+            self.namespace_manager = query.prologue.namespace_manager
+        self.root = None
+        # the operator handed back to rdflib's own evaluation
+        self._skip = None
+
+    @contextlib.contextmanager
+    def recording(self):
+        """
+        Record the operators of the queries evaluated inside the block.
+        :return: context manager yielding this profile
+        """
+        token = _active.set(self)
+        started = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.seconds += time.perf_counter() - started
+            _active.reset(token)
+
+    def _stats(self, part):
+        stats = self.stats.get(id(part))
+        if stats is None:
+            stats = self.stats[id(part)] = OperatorStats(part)
+            if self.root is None:
+                self.root = part
+        return stats
+
+    @contextlib.contextmanager
+    def _timing(self, stats):
+        """
+        Time a section of an operator, charging it to the operator evaluating it.
+        """
+        self.stack.append(stats)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stack.pop()
+            stats.seconds += elapsed
+            if self.stack:
+                self.stack[-1].child_seconds += elapsed
+
+    def evaluate(self, ctx, part):
+        """
+        Evaluate an operator with rdflib's own evaluation, timing it and counting its solutions.
+        :param ctx: rdflib QueryContext
+        :param part: algebra operator
+        :return: iterator of solutions
+        """
+        stats = self._stats(part)
+        stats.calls += 1
+        with self._timing(stats):
+            # some operators, e.g. OrderBy, do their work before returning
+            self._skip = part
+            solutions = iter(evalPart(ctx, part))
+        return self._count(stats, solutions)
+
+    def _count(self, stats, solutions):
+        while True:
+            with self._timing(stats):
+                try:
+                    solution = next(solutions)
+                except StopIteration:
+                    return
+            stats.solutions += 1
+            yield solution
+
+    def tree(self, part=None):
+        """
+        Return the algebra tree with the statistics of every operator.
+        :param part: operator, the root of the query when None
+        :return: dictionary with name, label, calls, solutions, seconds, self_seconds and children
+        """
+        if part is None:
+            # the operators evaluated, which differ from the prepared query's once it is optimized
+            part = self.root if self.root is not None else self.algebra
+            if part is None:
+                return None
+            if part.name.endswith('Query'):
+                part = part.p
+        stats = self.stats.get(id(part))
+        return {
+            'name': part.name,
+            'label': operator_label(part, self.namespace_manager),
+            'calls': stats.calls if stats else 0,
+            'solutions': stats.solutions if stats else 0,
+            'seconds': stats.seconds if stats else 0.0,
+            'self_seconds': stats.self_seconds if stats else 0.0,
+            'children': [self.tree(child) for child in operator_children(part)],
+        }
+
+
+def operator_children(part):
+    """
+    Return the operators an algebra operator evaluates.
+    :param part: algebra operator
+    :return: list of CompValue
+    """
+    return [part[k] for k in CHILD_KEYS if isinstance(part.get(k), CompValue)]
+
+
+def operator_label(part, namespace_manager=None):
+    """
+    Return a short description of an operator's own arguments, e.g. the patterns of a BGP.
+    :param part: algebra operator
+    :param namespace_manager: prefixes used to shorten IRIs
+    :return: text
+    """
+    def n3(term):
+        return term.n3(namespace_manager) if hasattr(term, 'n3') else str(term)
+
+    if part.name == 'BGP':
+        label = ' . '.join(' '.join(n3(t) for t in triple) for triple in part.triples)
+        variables = sorted({n3(v) for e in part.filters or () for v in expression_variables(e)})
+        return label + (' filter on ' + ' '.join(variables) if variables else '')
+    if part.name == 'Project':
+        return ' '.join(n3(v) for v in part.PV or ())
+    if part.name == 'Extend':
+        return n3(part.var)
+    if part.name == 'Group':
+        return ' '.join(n3(e) for e in part.expr or ())
+    if part.name == 'Slice':
+        return f'offset {part.start} limit {part.length}'
+    if part.name == 'OrderBy':
+        return ' '.join(f"{e.order or 'ASC'}" for e in part.expr)
+    if part.name in ('Filter', 'LeftJoin') and getattr(part.expr, '_vars', None):
+        return 'on ' + ' '.join(sorted(n3(v) for v in part.expr._vars))
+    return ''
+
+
+def _profile_eval(ctx, part):
+    """
+    rdflib custom evaluation hook: times the operators of queries run inside profile().
+    """
+    profile = _active.get()
+    if profile is None or part.name.endswith('Query'):
+        # query forms return a result dictionary, their pattern below is what is profiled
+        raise NotImplementedError()
+    if profile._skip is part:
+        # the operator is being evaluated by rdflib now; its operands are profiled again
+        profile._skip = None
+        raise NotImplementedError()
+    return profile.evaluate(ctx, part)
+
+
+def profile(query=None):
+    """
+    Record the per-operator statistics of the queries evaluated inside the block.
+
+        with profile(prepared_query) as p:
+            rows = len(graph.query(prepared_query).bindings)
+        p.tree()
+
+    :param query: prepared query, whose algebra and prefixes the tree is built from
+    :return: context manager yielding the QueryProfile
+    """
+    return QueryProfile(query).recording()
+
+
+# rdflib tries the hooks in order: the profile hook goes first, so the operators the other
+# hooks evaluate, e.g. the optimizer's basic graph patterns, are timed as well
+_hooks = dict(CUSTOM_EVALS)
+CUSTOM_EVALS.clear()
+CUSTOM_EVALS['semantic_web_profile'] = _profile_eval
+CUSTOM_EVALS.update(_hooks)
@@ -0,0 +1,93 @@
+import re
+
+from utilities.cache import LRUCache
+
+# default budget and lifetime of cached query results
+DEFAULT_MAX_BYTES = 128 * 1024 * 1024
+DEFAULT_TTL = 15 * 60
+
+# rough footprint of one cell of the records list
+BYTES_PER_RECORD_CELL = 120
+
+
+def normalize_query(query_text):
+    """
+    Return a query text with comments dropped and whitespace collapsed, so that
+    formatting differences do not produce distinct cache keys.
+    :param query_text: sparql query text
+    :return: normalized text
+    """
+    lines = [line for line in query_text.splitlines() if not line.lstrip().startswith('#')]
+    return re.sub(r'\s+', ' ', ' '.join(lines)).strip()
+
+
+def result_nbytes(result):
+    """
+    Return the approximate memory footprint of a (records, columns, dataframe) result.
+    :param result: query result
+    :return: size in bytes
+    """
+    records, columns, dataframe = result
+    nbytes = int(dataframe.memory_usage(deep=True).sum())
+    if records is not None:
+        nbytes += len(records) * max(len(columns), 1) * BYTES_PER_RECORD_CELL
+    return nbytes
+
+
+class QueryResultCache:
+    """
+    Cache of query results keyed by endpoint, graph version, query and bindings.
+
+    Results of an older graph version are never returned, and are dropped as soon
+    as the registry loads a new version of the same endpoint.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL):
+        self._cache = LRUCache(max_bytes=max_bytes, ttl=ttl, sizeof=result_nbytes)
+
+    @staticmethod
+    def key(endpoint, version, query, bindings=None, column_names=None):
+        """
+        Return the cache key of a query.
+        :param endpoint: ontology endpoint
+        :param version: graph version
+        :param query: template id or query text
+        :param bindings: initial variable bindings
+        :param column_names: column renaming
+        :return: hashable key
+        """
+        return (
+            str(endpoint),
+            version,
+            normalize_query(query),
+            tuple(sorted((str(k), v) for k, v in (bindings or {}).items())),
+            tuple(sorted((column_names or {}).items())),
+        )
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def put(self, key, result):
+        self._cache.put(key, result)
+
+    def invalidate(self, endpoint=None, keep_version=None):
+        """
+        Drop cached results of an endpoint.
+        :param endpoint: ontology endpoint, None for all
+        :param keep_version: graph version whose results are kept
+        :return: number of results dropped
+        """
+        return self._cache.invalidate(
+            lambda k: (endpoint is None or k[0] == str(endpoint)) and k[1] != keep_version)
+
+    def on_new_version(self, endpoint, version):
+        """
+        Registry listener dropping the results of superseded graph versions.
+        :param endpoint: ontology endpoint
+        :param version: new graph version
+        :return: None
+        """
+        self.invalidate(endpoint, keep_version=version)
+
+    def stats(self):
+        return self._cache.stats()
@@ -0,0 +1,233 @@
+import hashlib
+import itertools
+import os
+import threading
+
+from utilities.cache import LRUCache
+
+# default memory budget for parsed graphs
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# approximate footprint of one triple in rdflib's default Memory store
+BYTES_PER_TRIPLE = 2048
+
+# versions are unique across every graph the process has loaded
+_versions = itertools.count(1)
+
+
+class GraphEntry:
+    """
+    A parsed graph together with the source fingerprint and version it was loaded with.
+    """
+
+    def __init__(self, graph, fingerprint, version):
+        self.graph = graph
+        self.fingerprint = fingerprint
+        self.version = version
+
+
+def source_fingerprint(endpoint, use_hash=False):
+    """
+    Return a fingerprint identifying the current content of an endpoint.
+    :param endpoint: ontology endpoint
+    :param use_hash: hash the file content instead of using mtime and size
+    :return: fingerprint, or None when the endpoint is not a local file
+    """
+    try:
+        st = os.stat(endpoint)
+    except (OSError, TypeError, ValueError):
+        return None
+    if not use_hash:
+        return st.st_mtime_ns, st.st_size
+    digest = hashlib.sha1()
+    with open(endpoint, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def graph_nbytes(graph):
+    """
+    Return the estimated memory footprint of a graph.
+    :param graph: rdflib graph
+    :return: size in bytes
+    """
+    nbytes = getattr(graph.store, 'nbytes', None)
+    if nbytes is not None:
+        return nbytes
+    return len(graph) * BYTES_PER_TRIPLE
+
+
+class GraphRegistry:
+    """
+    Process-wide cache of parsed ontologies shared by callbacks and threads.
+
+    Graphs are keyed by endpoint, format and load options, and are re-parsed only
+    when the source fingerprint changes. When an updater is given, a changed source
+    is applied to the loaded graph as a triple delta instead. Each load or update
+    gets a new version number that downstream caches can key on.
+    """
+
+    def __init__(self, loader, max_bytes=DEFAULT_MAX_BYTES, use_hash=False, updater=None):
+        """
+        :param loader: callable(endpoint, fmt, **kwargs) returning a graph
+        :param max_bytes: memory budget for cached graphs
+        :param use_hash: fingerprint sources by content hash instead of mtime
+        :param updater: callable(graph, endpoint, fmt, **kwargs) returning (graph, added, removed),
+            or None when the graph must be reloaded; an empty delta keeps the current version
+        """
+        self.loader = loader
+        self.updater = updater
+        self.use_hash = use_hash
+        self.loads = 0
+        self.updates = 0
+        self._cache = LRUCache(max_bytes=max_bytes, sizeof=lambda e: graph_nbytes(e.graph))
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self._listeners = []
+        self._delta_listeners = []
+
+    def get(self, endpoint, fmt='application/rdf+xml', **kwargs):
+        """
+        Return the parsed graph of an ontology, parsing it on first use or after it changed.
+        :param endpoint: ontology endpoint
+        :param fmt: ontology format
+        :return: rdf graph
+        """
+        return self.entry(endpoint, fmt, **kwargs).graph
+
+    def version(self, endpoint, fmt='application/rdf+xml', **kwargs):
+        """
+        Return the version of the currently loaded graph of an ontology.
+        :param endpoint: ontology endpoint
+        :param fmt: ontology format
+        :return: version number
+        """
+        return self.entry(endpoint, fmt, **kwargs).version
+
+    def entry(self, endpoint, fmt='application/rdf+xml', **kwargs):
+        """
+        Return the registry entry of an ontology, loading it if needed.
+        :param endpoint: ontology endpoint
+        :param fmt: ontology format
+        :return: GraphEntry
+        """
+        key = self._key(endpoint, fmt, kwargs)
+        fingerprint = source_fingerprint(endpoint, self.use_hash)
+        entry = self._cache.get(key)
+        if entry is not None and entry.fingerprint == fingerprint:
+            return entry
+
+        with self._lock_for(key):
+            # another thread may have loaded it while we waited
+            entry = self._cache.peek(key)
+            if entry is not None and entry.fingerprint == fingerprint:
+                return entry
+            return self._load(key, entry, fingerprint, endpoint, fmt, kwargs)
+
+    def refresh(self, endpoint=None):
+        """
+        Bring loaded graphs whose source changed up to date, without loading new ones.
+        :param endpoint: ontology endpoint, None for all
+        :return: list of updated GraphEntry
+        """
+        refreshed = []
+        for key in self._cache.keys():
+            if endpoint is not None and key[0] != str(endpoint):
+                continue
+            _, fmt, *options = key
+            fingerprint = source_fingerprint(key[0], self.use_hash)
+            with self._lock_for(key):
+                entry = self._cache.peek(key)
+                if entry is None or entry.fingerprint == fingerprint:
+                    continue
+                refreshed.append(self._load(key, entry, fingerprint, key[0], fmt, dict(options)))
+        return refreshed
+
+    def peek(self, endpoint, fmt='application/rdf+xml', **kwargs):
+        """
+        Return the registry entry of an ontology when it is loaded and up to date, without loading it.
+        :param endpoint: ontology endpoint
+        :param fmt: ontology format
+        :return: GraphEntry or None
+        """
+        entry = self._cache.peek(self._key(endpoint, fmt, kwargs))
+        if entry is not None and entry.fingerprint == source_fingerprint(endpoint, self.use_hash):
+            return entry
+        return None
+
+    def invalidate(self, endpoint=None):
+        """
+        Drop cached graphs so they are re-parsed on next use.
+        :param endpoint: ontology endpoint, None for all
+        :return: number of graphs dropped
+        """
+        endpoint = None if endpoint is None else str(endpoint)
+        return self._cache.invalidate(lambda k: endpoint is None or k[0] == endpoint)
+
+    def add_listener(self, listener):
+        """
+        Register a callable(endpoint, version) invoked whenever a new graph version is loaded.
+        :param listener: callable
+        :return: None
+        """
+        self._listeners.append(listener)
+
+    def add_delta_listener(self, listener):
+        """
+        Register a callable(endpoint, old_version, entry, added, removed) invoked with the new
+        GraphEntry whenever a graph is updated by a triple delta, before the version listeners.
+        :param listener: callable
+        :return: None
+        """
+        self._delta_listeners.append(listener)
+
+    def stats(self):
+        """
+        Return cache statistics.
+        :return: dictionary of statistics
+        """
+        stats = self._cache.stats()
+        stats['loads'] = self.loads
+        stats['updates'] = self.updates
+        return stats
+
+    def _load(self, key, entry, fingerprint, endpoint, fmt, kwargs):
+        """
+        Load or update the graph of a key; the caller holds the key lock.
+        :param entry: currently loaded GraphEntry, or None
+        :return: new GraphEntry, with the version of entry when the triples did not change
+        """
+        update = None
+        if entry is not None and self.updater is not None:
+            update = self.updater(entry.graph, endpoint, fmt, **kwargs)
+        if update is None:
+            graph = self.loader(endpoint, fmt, **kwargs)
+            new_entry = GraphEntry(graph, fingerprint, next(_versions))
+            self.loads += 1
+        elif not update[1] and not update[2]:
+            # the source was rewritten with the same triples, the loaded version stays current
+            new_entry = GraphEntry(entry.graph, fingerprint, entry.version)
+            self._cache.put(key, new_entry)
+            return new_entry
+        else:
+            graph, added, removed = update
+            new_entry = GraphEntry(graph, fingerprint, next(_versions))
+            self.updates += 1
+            for listener in self._delta_listeners:
+                listener(endpoint, entry.version, new_entry, added, removed)
+        self._cache.put(key, new_entry)
+        self._notify(endpoint, new_entry.version)
+        return new_entry
+
+    def _notify(self, endpoint, version):
+        for listener in self._listeners:
+            listener(endpoint, version)
+
+    def _lock_for(self, key):
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    @staticmethod
+    def _key(endpoint, fmt, kwargs):
+        return (str(endpoint), fmt) + tuple(sorted(kwargs.items()))
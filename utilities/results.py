@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+from rdflib import Literal, URIRef, XSD
+
+INTEGER_DATATYPES = {
+    XSD.integer, XSD.int, XSD.long, XSD.short, XSD.byte,
+    XSD.nonNegativeInteger, XSD.nonPositiveInteger, XSD.positiveInteger, XSD.negativeInteger,
+    XSD.unsignedLong, XSD.unsignedInt, XSD.unsignedShort, XSD.unsignedByte,
+}
+FLOAT_DATATYPES = {XSD.decimal, XSD.double, XSD.float}
+DATE_DATATYPES = {XSD.date}
+DATETIME_DATATYPES = {XSD.dateTime, XSD.dateTimeStamp}
+
+# pandas 2 infers the format of a datetime column from its first value unless told the values are ISO 8601,
+# pandas 1.5 parses ISO 8601 values of mixed precision without a format and rejects this one
+_DATETIME_FORMAT = {'format': 'ISO8601'} if int(pd.__version__.split('.')[0]) >= 2 else {}
+
+# DataTable column types by dataframe column kind
+TABLE_TYPES = {'i': 'numeric', 'f': 'numeric', 'M': 'datetime'}
+
+
+def _column_kind(terms):
+    """
+    Return the kind of array a column of rdflib terms converts to.
+    :param terms: list of rdflib terms or None
+    :return: 'integer', 'float', 'date', 'datetime', 'iri' or 'text'
+    """
+    kind = None
+    for term in terms:
+        if term is None:
+            continue
+        if isinstance(term, URIRef):
+            term_kind = 'iri'
+        elif isinstance(term, Literal) and term.datatype in INTEGER_DATATYPES:
+            term_kind = 'integer'
+        elif isinstance(term, Literal) and term.datatype in FLOAT_DATATYPES:
+            term_kind = 'float'
+        elif isinstance(term, Literal) and term.datatype in DATE_DATATYPES:
+            term_kind = 'date'
+        elif isinstance(term, Literal) and term.datatype in DATETIME_DATATYPES:
+            term_kind = 'datetime'
+        else:
+            return 'text'
+        if kind is None or kind == term_kind:
+            kind = term_kind
+        elif {kind, term_kind} == {'integer', 'float'}:
+            kind = 'float'
+        else:
+            return 'text'
+    return kind or 'text'
+
+
+def _to_array(terms, kind):
+    """
+    Convert a column of rdflib terms to a typed array: dates become datetime64,
+    numbers float64 (int64 when integral and complete) and IRIs categoricals. Columns
+    whose values do not convert are text.
+    :param terms: list of rdflib terms or None
+    :param kind: column kind
+    :return: numpy array or pandas array
+    """
+    missing = any(term is None for term in terms)
+    try:
+        if kind == 'integer' and not missing:
+            return np.array([int(term) for term in terms], dtype=np.int64)
+        if kind in ('integer', 'float'):
+            return np.array([np.nan if term is None else float(term) for term in terms], dtype=np.float64)
+        if kind == 'date':
+            return np.array(['NaT' if term is None else str(term) for term in terms], dtype='datetime64[D]')
+        if kind == 'datetime':
+            strings = [None if term is None else str(term) for term in terms]
+            # times with an offset are converted to UTC, times without one are taken as UTC
+            return pd.to_datetime(strings, utc=True, errors='raise', **_DATETIME_FORMAT).tz_localize(None).values
+    except (ValueError, TypeError, OverflowError):
+        # ill-typed literals, e.g. "abc"^^xsd:integer, and integers beyond int64 are kept as text
+        kind = 'text'
+    strings = [None if term is None else str(term) for term in terms]
+    if kind == 'iri':
+        return pd.Categorical(strings)
+    return np.array(strings, dtype=object)
+
+
+def query_results_to_dataframe(query_results, column_names=None):
+    """
+    Convert a sparql result set to a dataframe of typed columns in a single pass over the rows.
+    :param query_results: rdflib query result
+    :param column_names: dictionary renaming result variables to column names
+    :return: dataframe
+    """
+    column_names = column_names or {}
+    variables = list(query_results.vars or [])
+    columns = [[] for _ in variables]
+    appends = [c.append for c in columns]
+    for row in query_results:
+        for append, term in zip(appends, row):
+            append(term)
+
+    names = [column_names.get(str(v), str(v)) for v in variables]
+    kinds = [_column_kind(terms) for terms in columns]
+    # variables renamed to the same column, e.g. one ticker selected twice, keep a single column
+    arrays = {name: _to_array(terms, kind) for name, terms, kind in zip(names, columns, kinds)}
+    dataframe = pd.DataFrame(arrays, columns=list(arrays), copy=False)
+    # xsd:date columns are shown without a time of day
+    dataframe.attrs['date_columns'] = [name for name, kind in zip(names, kinds) if kind == 'date']
+    return dataframe
+
+
+def table_columns(dataframe):
+    """
+    Return DataTable column specifications of a dataframe of typed columns.
+    :param dataframe: dataframe
+    :return: list of column specifications
+    """
+    return [{'name': c, 'id': c, 'type': TABLE_TYPES.get(dataframe[c].dtype.kind, 'text')}
+            for c in dataframe.columns]
+
+
+def dataframe_to_table(dataframe):
+    """
+    Return DataTable records and column specifications of a dataframe of typed columns.
+    :param dataframe: dataframe
+    :return: (records, columns)
+    """
+    columns = table_columns(dataframe)
+    dates = {c: dataframe[c].dt.strftime('%Y-%m-%d') for c in dataframe.attrs.get('date_columns', [])}
+    table = dataframe.assign(**dates) if dates else dataframe
+    return table.to_dict('records'), columns
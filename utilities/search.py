@@ -0,0 +1,275 @@
+import bisect
+import contextlib
+import contextvars
+import heapq
+import re
+from collections import defaultdict
+
+from rdflib import Literal, RDFS, URIRef, Variable
+from rdflib.plugins.sparql.parserutils import CompValue
+
+from utilities.view import local_name
+
+# predicate whose literals are indexed as labels
+LABEL = RDFS.label
+
+# number of search results returned by default
+DEFAULT_LIMIT = 20
+
+# words shorter than this only match by prefix, longer ones also within one edit
+FUZZY_MIN_LENGTH = 4
+
+# a label filter is answered from the index when it keeps at most this fraction of the labels,
+# binding a label per value costs more than scanning the labels otherwise
+MAX_VALUES_FRACTION = 0.5
+
+# score of a query word matching a token exactly, by prefix and within one edit
+EXACT, PREFIX, FUZZY = 3, 2, 1
+
+# the search index of the graph being queried, None when label filters are evaluated by rdflib
+_active = contextvars.ContextVar('search', default=None)
+
+_WORD = re.compile(r'[^\W_]+')
+_CAMEL = re.compile(r'(?<=[a-z0-9])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])')
+
+
+def tokens(text):
+    """
+    Split a label or local name into lowercase words, at punctuation and camelCase boundaries.
+    :param text: string
+    :return: list of words
+    """
+    return [t.casefold() for word in _WORD.findall(text) for t in _CAMEL.split(word) if t]
+
+
+def _deletions(token):
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    """
+    Full-text index of the IRIs of a graph by their rdfs:label literals and local names.
+
+    Words of a query match tokens by prefix, through a binary search of the sorted token
+    vocabulary, and within one edit through an index of every token with one character
+    deleted. Labels are also kept sorted and indexed by trigram, which answers STRSTARTS
+    and CONTAINS filters on labels without scanning them.
+    """
+
+    def __init__(self, graph):
+        self.terms = []
+        self.names = []
+        # display names as space separated tokens, ranking names that start with the search text
+        self.phrases = []
+        self.position = {}
+        # label literal to the IRIs it labels
+        self.labels = defaultdict(set)
+        postings = defaultdict(set)
+        keys = defaultdict(set)
+
+        names = {}
+        iris = set()
+        for s, p, o in graph.triples((None, None, None)):
+            iris.add(s)
+            if not isinstance(o, Literal):
+                iris.add(o)
+            elif p == LABEL:
+                self.labels[o].add(s)
+                if isinstance(s, URIRef):
+                    keys[s].add(str(o))
+                    # an english or untagged label is preferred as display name
+                    name = (o.language not in (None, 'en'), str(o))
+                    names[s] = min(names.get(s, name), name)
+        for term in iris:
+            if isinstance(term, URIRef):
+                keys[term].add(local_name(term))
+
+        for term in sorted(keys):
+            i = len(self.terms)
+            self.position[term] = i
+            self.terms.append(term)
+            self.names.append(names[term][1] if term in names else local_name(term))
+            self.phrases.append(' '.join(tokens(self.names[-1])))
+            for key in keys[term]:
+                for token in tokens(key):
+                    postings[token].add(i)
+        self.postings = {token: frozenset(positions) for token, positions in postings.items()}
+        self.vocabulary = sorted(self.postings)
+        self.deletions = defaultdict(set)
+        for token in self.vocabulary:
+            if len(token) >= FUZZY_MIN_LENGTH:
+                for deleted in _deletions(token):
+                    self.deletions[deleted].add(token)
+
+        self.sorted_labels = sorted(((str(label).casefold(), label) for label in self.labels), key=lambda kv: kv[0])
+        self.label_trigrams = defaultdict(set)
+        for folded, label in self.sorted_labels:
+            for trigram in _trigrams(folded):
+                self.label_trigrams[trigram].add(label)
+
+    def __len__(self):
+        return len(self.terms)
+
+    def _matches(self, word):
+        """
+        Return the positions of the terms a query word matches, with the score of the match.
+        """
+        scores = {}
+        for i in self.postings.get(word, ()):
+            scores[i] = EXACT
+        vocabulary = self.vocabulary
+        j = bisect.bisect_right(vocabulary, word)
+        while j < len(vocabulary) and vocabulary[j].startswith(word):
+            for i in self.postings[vocabulary[j]]:
+                scores.setdefault(i, PREFIX)
+            j += 1
+        if not scores and len(word) >= FUZZY_MIN_LENGTH:
+            # a token within one edit shares a deletion with the word, or is one
+            similar = set(self.deletions.get(word, ()))
+            for deleted in _deletions(word):
+                similar.update(self.deletions.get(deleted, ()))
+                if deleted in self.postings:
+                    similar.add(deleted)
+            for token in similar:
+                for i in self.postings[token]:
+                    scores[i] = FUZZY
+        return scores
+
+    def search(self, text, limit=DEFAULT_LIMIT):
+        """
+        Return the IRIs whose labels or local names match every word of a text, best first:
+        exact words before prefixes before words within one edit, then names starting
+        with the text, then shorter names.
+        :param text: search text
+        :param limit: maximum number of results
+        :return: list of (IRI, display name)
+        """
+        words = tokens(text)
+        if not words:
+            return []
+        scores = None
+        for word in words:
+            matches = self._matches(word)
+            if scores is None:
+                scores = matches
+            else:
+                scores = {i: score + matches[i] for i, score in scores.items() if i in matches}
+            if not scores:
+                return []
+        phrase = ' '.join(words)
+
+        def rank(i):
+            name = self.names[i]
+            return -scores[i], not self.phrases[i].startswith(phrase), len(name), name
+
+        return [(self.terms[i], self.names[i]) for i in heapq.nsmallest(limit, scores, key=rank)]
+
+    def labels_starting(self, prefix):
+        """
+        Return the labels starting with a text, ignoring case.
+        :param prefix: string
+        :return: set of label literals, a superset of those STRSTARTS(label, prefix) holds for
+        """
+        folded = prefix.casefold()
+        sorted_labels = self.sorted_labels
+        # (folded,) sorts before every label whose folded text is or starts with it
+        j = bisect.bisect_left(sorted_labels, (folded,))
+        labels = set()
+        while j < len(sorted_labels) and sorted_labels[j][0].startswith(folded):
+            labels.add(sorted_labels[j][1])
+            j += 1
+        return labels
+
+    def labels_containing(self, text):
+        """
+        Return the labels containing a text, ignoring case.
+        :param text: string
+        :return: set of label literals, a superset of those CONTAINS(label, text) holds for
+        """
+        folded = text.casefold()
+        trigrams = _trigrams(folded)
+        if not trigrams:
+            return {label for key, label in self.sorted_labels if folded in key}
+        candidates = set.intersection(*(self.label_trigrams.get(t, set()) for t in trigrams))
+        return {label for label in candidates if folded in str(label).casefold()}
+
+    def updated(self, graph, added, removed):
+        """
+        Return the index after a delta, the same one unless the delta changes labels or
+        adds or removes IRIs.
+        :param graph: rdflib graph after the delta
+        :param added: set of triples added
+        :param removed: set of triples removed
+        :return: SearchIndex
+        """
+        if any(p == LABEL for triples in (added, removed) for _, p, _ in triples):
+            return SearchIndex(graph)
+        if any(isinstance(t, URIRef) and t not in self.position for s, _, o in added for t in (s, o)):
+            return SearchIndex(graph)
+        for s, _, o in removed:
+            for t in (s, o):
+                if isinstance(t, URIRef) and (t, None, None) not in graph and (None, None, t) not in graph:
+                    return SearchIndex(graph)
+        return self
+
+
+def _label_argument(expr):
+    """
+    Return the variable of a STRSTARTS or CONTAINS argument: ?label, STR(?label) or LCASE(?label).
+    """
+    while isinstance(expr, CompValue) and expr.name in ('Builtin_STR', 'Builtin_LCASE'):
+        expr = expr.arg
+    return expr if isinstance(expr, Variable) else None
+
+
+def label_values(triples, filters, ctx):
+    """
+    Return the labels a label variable of a basic graph pattern can take, when its filters
+    constrain it with STRSTARTS or CONTAINS on a constant. The pattern is then evaluated once
+    per label, as if joined with a VALUES block, and the filters are still checked.
+    :param triples: list of (s, p, o) patterns
+    :param filters: filter conjuncts pushed into the pattern, see utilities.optimizer
+    :param ctx: rdflib QueryContext with the bindings the pattern is evaluated with
+    :return: (Variable, set of label literals), or None when no index is active or the filters
+        are not selective enough
+    """
+    index = _active.get()
+    if index is None or not filters:
+        return None
+    label_variables = {o for _, p, o in triples if p == LABEL and isinstance(o, Variable) and ctx[o] is None}
+    values = {}
+    for expr in filters:
+        if not isinstance(expr, CompValue) or expr.name not in ('Builtin_STRSTARTS', 'Builtin_CONTAINS'):
+            continue
+        variable = _label_argument(expr.arg1)
+        if variable not in label_variables or not isinstance(expr.arg2, Literal):
+            continue
+        if expr.name == 'Builtin_STRSTARTS':
+            labels = index.labels_starting(str(expr.arg2))
+        else:
+            labels = index.labels_containing(str(expr.arg2))
+        values[variable] = labels if variable not in values else values[variable] & labels
+    if not values:
+        return None
+    variable, labels = min(values.items(), key=lambda kv: len(kv[1]))
+    if len(labels) > MAX_VALUES_FRACTION * len(index.labels):
+        return None
+    return variable, labels
+
+
+@contextlib.contextmanager
+def using_search(index):
+    """
+    Answer the label filters of the queries evaluated inside the block from a search index.
+    :param index: SearchIndex of the queried graph, None to let rdflib scan the labels
+    :return: context manager
+    """
+    token = _active.set(index)
+    try:
+        yield index
+    finally:
+        _active.reset(token)
@@ -1,25 +1,344 @@
-import pickle
+import json
+import os
+import struct
+import zlib
 
+import numpy as np
+from rdflib import BNode, Graph, Literal, URIRef
 
-def serialize(graph, filename):
+from utilities.store import OSP, POS, SPO, index_arrays
+
+# on-disk snapshot layout:
+#   magic (8 bytes) | format version (uint32) | header length (uint32) | json header | arrays
+# every array starts on an 8-byte boundary so it can be memory-mapped in place
+SNAPSHOT_MAGIC = b'SWSNAP\x00\x00'
+SNAPSHOT_VERSION = 1
+_PREAMBLE = struct.Struct('<8sII')
+_ALIGN = 8
+
+# term kinds stored in the 'kinds' array
+URIREF, BNODE, LITERAL = 0, 1, 2
+
+# names of the optional sorted index arrays, e.g. 'pos_1' is the second column of the POS index
+INDEX_NAMES = {SPO: 'spo', POS: 'pos', OSP: 'osp'}
+
+
+def term_hash(kind, lexical, datatype, language):
+    """
+    Return the hash of a term in the snapshot term table, stable across processes.
+    :param kind: URIREF, BNODE or LITERAL
+    :param lexical: utf-8 encoded lexical form
+    :param datatype: datatype id, -1 for none
+    :param language: language id, -1 for none
+    :return: unsigned 32-bit hash
+    """
+    return zlib.crc32(lexical, zlib.crc32(struct.pack('<Bii', kind, datatype, language)))
+
+
+def term_table(kinds, datatypes, languages, chunks):
+    """
+    Return an open-addressing hash table from terms to term ids, stored as an array
+    of term id + 1 (0 for an empty slot) so it can be memory-mapped.
+    :param kinds: term kinds
+    :param datatypes: datatype ids
+    :param languages: language ids
+    :param chunks: utf-8 encoded lexical forms
+    :return: numpy array, its length a power of two
+    """
+    size = 1 << max(len(chunks) * 2, 1).bit_length()
+    table = np.zeros(size, dtype=np.int64)
+    mask = size - 1
+    for term_id, key in enumerate(zip(kinds, chunks, datatypes, languages)):
+        slot = term_hash(*key) & mask
+        while table[slot]:
+            slot = (slot + 1) & mask
+        table[slot] = term_id + 1
+    return table
+
+
+class Snapshot:
+    """
+    Read-only view of a graph snapshot: a dictionary-encoded term table plus an
+    integer triple array whose rows are (subject, predicate, object) term ids.
+    """
+
+    def __init__(self, header, arrays):
+        self.header = header
+        self.arrays = arrays
+        self.kinds = arrays['kinds']
+        self.datatypes = arrays['datatypes']
+        self.languages = arrays['languages']
+        self.offsets = arrays['offsets']
+        self.blob = arrays['blob']
+        self.triples = arrays['triples']
+        self._datatype_terms = [URIRef(d) for d in header['datatypes']]
+        self._datatype_ids = {d: i for i, d in enumerate(header['datatypes'])}
+        self._language_ids = {lang: i for i, lang in enumerate(header['languages'])}
+        self._text = None
+        self._term_ids = None
+
+    def __len__(self):
+        return len(self.triples)
+
+    @property
+    def namespaces(self):
+        return [tuple(ns) for ns in self.header['namespaces']]
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in self.arrays.values())
+
+    def lexical(self, term_id):
+        """
+        Return the lexical form of a term.
+        :param term_id: term id
+        :return: string
+        """
+        if self._text is None:
+            self._text = self.blob.tobytes()
+        return self._text[self.offsets[term_id]:self.offsets[term_id + 1]].decode('utf-8')
+
+    def term(self, term_id):
+        """
+        Return the rdflib term stored under an id.
+        :param term_id: term id
+        :return: rdflib term
+        """
+        value = self.lexical(term_id)
+        kind = self.kinds[term_id]
+        if kind == URIREF:
+            return URIRef(value)
+        if kind == BNODE:
+            return BNode(value)
+        dt, lang = self.datatypes[term_id], self.languages[term_id]
+        return Literal(value,
+                       datatype=self._datatype_terms[dt] if dt >= 0 else None,
+                       lang=self.header['languages'][lang] if lang >= 0 else None)
+
+    def term_id(self, term):
+        """
+        Return the id of a term, looked up in the term table, or None when the snapshot
+        does not contain it.
+        :param term: rdflib term
+        :return: term id
+        """
+        table = self.arrays.get('term_table')
+        if table is None:
+            if self._term_ids is None:
+                self._term_ids = {t: i for i, t in enumerate(self.terms())}
+            return self._term_ids.get(term)
+
+        if isinstance(term, Literal):
+            kind = LITERAL
+            datatype = -1 if term.datatype is None else self._datatype_ids.get(str(term.datatype))
+            language = -1 if term.language is None else self._language_ids.get(term.language)
+            if datatype is None or language is None:
+                return None
+        elif isinstance(term, BNode):
+            kind, datatype, language = BNODE, -1, -1
+        elif isinstance(term, URIRef):
+            kind, datatype, language = URIREF, -1, -1
+        else:
+            return None
+        lexical = str(term).encode('utf-8')
+        mask = len(table) - 1
+        slot = term_hash(kind, lexical, datatype, language) & mask
+        while table[slot]:
+            term_id = int(table[slot]) - 1
+            if (self.kinds[term_id] == kind and self.datatypes[term_id] == datatype
+                    and self.languages[term_id] == language
+                    and self.blob[self.offsets[term_id]:self.offsets[term_id + 1]].tobytes() == lexical):
+                return term_id
+            slot = (slot + 1) & mask
+        return None
+
+    def indexes(self):
+        """
+        Return the sorted SPO, POS and OSP indexes, used in place when the snapshot
+        contains them and computed otherwise.
+        :return: dictionary of column order to tuple of sorted column arrays
+        """
+        if all(f'{name}_0' in self.arrays for name in INDEX_NAMES.values()):
+            return {order: tuple(self.arrays[f'{name}_{i}'] for i in range(3)) for order, name in INDEX_NAMES.items()}
+        return index_arrays(self.triples)
+
+    def terms(self):
+        """
+        Return every term in id order.
+        :return: list of rdflib terms
+        """
+        text = self.blob.tobytes()
+        offsets = self.offsets.tolist()
+        languages = self.header['languages']
+        terms = []
+        for i, (kind, dt, lang) in enumerate(zip(self.kinds.tolist(), self.datatypes.tolist(),
+                                                 self.languages.tolist())):
+            value = text[offsets[i]:offsets[i + 1]].decode('utf-8')
+            if kind == URIREF:
+                terms.append(URIRef(value))
+            elif kind == BNODE:
+                terms.append(BNode(value))
+            else:
+                terms.append(Literal(value,
+                                     datatype=self._datatype_terms[dt] if dt >= 0 else None,
+                                     lang=languages[lang] if lang >= 0 else None))
+        return terms
+
+    def to_graph(self, graph=None):
+        """
+        Rebuild an rdflib graph from the snapshot.
+        :param graph: graph to add the triples to, a new Graph when None
+        :return: rdf graph
+        """
+        if graph is None:
+            graph = Graph()
+        for prefix, namespace in self.namespaces:
+            graph.bind(prefix, namespace, override=True, replace=True)
+        terms = self.terms()
+        graph.addN((terms[s], terms[p], terms[o], graph) for s, p, o in self.triples.tolist())
+        return graph
+
+
+def encode_graph(graph, indexes=False):
+    """
+    Dictionary-encode a graph into a snapshot header and arrays.
+    :param graph: rdf graph
+    :param indexes: also store the sorted triple indexes and the term table, so the
+        snapshot can be queried in place by a SnapshotStore
+    :return: (header, arrays)
+    """
+    term_ids = {}
+    kinds, datatypes, languages, chunks = [], [], [], []
+    datatype_ids, language_ids = {}, {}
+
+    def intern(term):
+        term_id = term_ids.get(term)
+        if term_id is not None:
+            return term_id
+        if isinstance(term, Literal):
+            kinds.append(LITERAL)
+            datatypes.append(-1 if term.datatype is None else
+                             datatype_ids.setdefault(str(term.datatype), len(datatype_ids)))
+            languages.append(-1 if term.language is None else
+                             language_ids.setdefault(term.language, len(language_ids)))
+        elif isinstance(term, BNode):
+            kinds.append(BNODE)
+            datatypes.append(-1)
+            languages.append(-1)
+        elif isinstance(term, URIRef):
+            kinds.append(URIREF)
+            datatypes.append(-1)
+            languages.append(-1)
+        else:
+            raise TypeError(f'cannot snapshot term {term!r}')
+        chunks.append(str(term).encode('utf-8'))
+        term_id = term_ids[term] = len(term_ids)
+        return term_id
+
+    triples = [(intern(s), intern(p), intern(o)) for s, p, o in graph]
+    id_dtype = np.int32 if len(term_ids) < 2 ** 31 else np.int64
+
+    offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    np.cumsum([len(c) for c in chunks], out=offsets[1:])
+    arrays = {
+        'kinds': np.array(kinds, dtype=np.uint8),
+        'datatypes': np.array(datatypes, dtype=np.int32),
+        'languages': np.array(languages, dtype=np.int32),
+        'offsets': offsets,
+        'blob': np.frombuffer(b''.join(chunks), dtype=np.uint8),
+        'triples': np.array(triples, dtype=id_dtype).reshape(-1, 3),
+    }
+    if indexes:
+        for order, columns in index_arrays(arrays['triples']).items():
+            for i, column in enumerate(columns):
+                arrays[f'{INDEX_NAMES[order]}_{i}'] = column
+        arrays['term_table'] = term_table(kinds, datatypes, languages, chunks)
+    header = {
+        'triples': len(triples),
+        'terms': len(term_ids),
+        'namespaces': [[prefix, str(ns)] for prefix, ns in graph.namespaces()],
+        'datatypes': list(datatype_ids),
+        'languages': list(language_ids),
+    }
+    return header, arrays
+
+
+def write_snapshot(header, arrays, filename):
+    """
+    Write a snapshot to a file. The file is written under a temporary name and
+    moved into place so readers never observe a partial snapshot.
+    :param header: snapshot header
+    :param arrays: dictionary of numpy arrays
+    :param filename: filename
+    :return: None
     """
-    Serialize a graph to a file via pickle.
+    header = dict(header, version=SNAPSHOT_VERSION, arrays={})
+    offset = 0
+    for name, array in arrays.items():
+        header['arrays'][name] = {'offset': offset, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+        offset += _padded(array.nbytes)
+    header_bytes = json.dumps(header).encode('utf-8')
+    header_bytes += b' ' * (_padded(_PREAMBLE.size + len(header_bytes)) - _PREAMBLE.size - len(header_bytes))
+
+    tmp_filename = f'{filename}.{os.getpid()}.tmp'
+    with open(tmp_filename, 'wb') as f:
+        f.write(_PREAMBLE.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for array in arrays.values():
+            data = np.ascontiguousarray(array).tobytes()
+            f.write(data)
+            f.write(b'\x00' * (_padded(len(data)) - len(data)))
+    os.replace(tmp_filename, filename)
+
+
+def load_snapshot(filename, mmap=True):
+    """
+    Load a snapshot, memory-mapping its arrays by default.
+    :param filename: filename
+    :param mmap: memory-map the file instead of reading it into memory
+    :return: Snapshot
+    """
+    if mmap:
+        buffer = np.memmap(filename, dtype=np.uint8, mode='r')
+    else:
+        buffer = np.fromfile(filename, dtype=np.uint8)
+    magic, version, header_length = _PREAMBLE.unpack(buffer[:_PREAMBLE.size].tobytes())
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError(f'{filename} is not a graph snapshot')
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f'{filename} has snapshot version {version}, expected {SNAPSHOT_VERSION}')
+    start = _PREAMBLE.size + header_length
+    header = json.loads(buffer[_PREAMBLE.size:start].tobytes())
+
+    arrays = {}
+    for name, spec in header['arrays'].items():
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape'], dtype=np.int64))
+        offset = start + spec['offset']
+        arrays[name] = buffer[offset:offset + count * dtype.itemsize].view(dtype).reshape(spec['shape'])
+    return Snapshot(header, arrays)
+
+
+def serialize(graph, filename, indexes=False):
+    """
+    Serialize a graph to a snapshot file.
     :param graph: graph
     :param filename: filename
+    :param indexes: also store the indexes used by a SnapshotStore
     :return: None
     """
-    output_file = open(filename, 'wb')
-    pickle.dump(graph, output_file)
-    output_file.close()
+    header, arrays = encode_graph(graph, indexes)
+    write_snapshot(header, arrays, filename)
 
 
 def deserialize(filename):
     """
-    Deserialize a file to a graph via pickle.
+    Deserialize a snapshot file to a graph.
     :param filename: filename
     :return: graph
     """
-    input_file = open(filename, 'rb')
-    graph = pickle.load(input_file)
-    input_file.close()
-    return graph
+    return load_snapshot(filename).to_graph()
+
+
+def _padded(n):
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
@@ -0,0 +1,270 @@
+import math
+import re
+import uuid
+
+import pandas as pd
+
+from utilities.cache import LRUCache
+from utilities.results import dataframe_to_table
+from utilities.shared import SharedDirectory
+
+# default budget of result sessions and idle time after which a session is dropped
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_IDLE_TTL = 30 * 60
+
+# one part of a DataTable filter_query, e.g. {BTCPrice} >= 20000 or {date} datestartswith 2023-02
+FILTER_PART_PATTERN = re.compile(
+    r'^\s*\{(?P<column>[^}]*)\}\s+'
+    r'(?P<operator>s?(?:>=|<=|!=|=|<|>)|eq|ne|lt|le|gt|ge|[si]?contains|datestartswith|is blank)'
+    r'\s*(?P<value>.*?)\s*$'
+)
+OPERATOR_ALIASES = {'eq': '=', 'ne': '!=', 'lt': '<', 'le': '<=', 'gt': '>', 'ge': '>='}
+
+
+class ResultSession:
+    """
+    A query result kept on the server, plus the row order of the last filter/sort applied to it.
+    """
+
+    def __init__(self, dataframe):
+        self.dataframe = dataframe
+        self.view_key = None
+        self.view_index = None
+
+    def view(self, sort_by=None, filter_query=None):
+        """
+        Return the positions of the rows that pass a filter, in sort order.
+        :param sort_by: DataTable sort_by
+        :param filter_query: DataTable filter_query
+        :return: numpy array of row positions
+        """
+        key = (repr(sort_by or []), filter_query or '')
+        if key != self.view_key:
+            df = filter_dataframe(self.dataframe, filter_query)
+            df = sort_dataframe(df, sort_by)
+            self.view_index = df.index.to_numpy()
+            self.view_key = key
+        return self.view_index
+
+    def csv(self, sort_by=None, filter_query=None):
+        """
+        Return every row that passes a filter, in sort order, as CSV with the values the DataTable shows.
+        :param sort_by: DataTable sort_by
+        :param filter_query: DataTable filter_query
+        :return: CSV text
+        """
+        return export_dataframe(self.dataframe, self.view(sort_by, filter_query)).to_csv(index=False)
+
+
+class ResultSessionStore:
+    """
+    Server-side store of query results shown in a DataTable, so the browser only
+    receives the rows of the visible page. Sessions are evicted least-recently-used
+    beyond a byte budget and after an idle time.
+
+    With a directory, sessions are also written there, so every worker process of the
+    server can page a result, whichever ran the query; a worker reads a session it
+    does not hold from its file and keeps it.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, idle_ttl=DEFAULT_IDLE_TTL, directory=None):
+        """
+        :param max_bytes: memory budget of the sessions held by this process
+        :param idle_ttl: seconds after which an unused session is dropped
+        :param directory: directory shared by the worker processes, None to keep sessions in this process
+        """
+        self._cache = LRUCache(max_bytes=max_bytes, ttl=idle_ttl, sliding=True,
+                               sizeof=lambda s: int(s.dataframe.memory_usage(deep=True).sum()))
+        self._shared = None if directory is None else SharedDirectory(directory, ttl=idle_ttl)
+
+    def create(self, dataframe):
+        """
+        Store a result and return its session id.
+        :param dataframe: query result
+        :return: session id
+        """
+        self._cache.expire()
+        session_id = uuid.uuid4().hex
+        dataframe = dataframe.reset_index(drop=True)
+        if self._shared is not None:
+            self._shared.expire()
+            # attrs, e.g. the date columns, are not pickled by every pandas version
+            self._shared.write(session_id, (dataframe, dataframe.attrs))
+        self._cache.put(session_id, ResultSession(dataframe))
+        return session_id
+
+    def get(self, session_id):
+        """
+        Return a session, or None when it does not exist or was evicted.
+        :param session_id: session id
+        :return: ResultSession
+        """
+        if not session_id:
+            return None
+        session = self._cache.get(session_id)
+        if self._shared is None:
+            return session
+        # the file is touched on every read, so the processes that do not page the session keep it too
+        if session is not None:
+            self._shared.touch(session_id)
+            return session
+        stored = self._shared.read(session_id, touch=True)
+        if stored is None:
+            return None
+        dataframe, attrs = stored
+        dataframe.attrs.update(attrs)
+        session = ResultSession(dataframe)
+        self._cache.put(session_id, session)
+        return session
+
+    def dataframe(self, session_id):
+        session = self.get(session_id)
+        return None if session is None else session.dataframe
+
+    def page(self, session_id, page_current=0, page_size=25, sort_by=None, filter_query=None):
+        """
+        Return one page of a session's rows after filtering and sorting.
+        :param session_id: session id
+        :param page_current: zero-based page number
+        :param page_size: rows per page
+        :param sort_by: DataTable sort_by
+        :param filter_query: DataTable filter_query
+        :return: (records, page_count), ([], 0) when the session is gone
+        """
+        session = self.get(session_id)
+        if session is None:
+            return [], 0
+        return page_dataframe(session.dataframe, page_current, page_size, session.view(sort_by, filter_query))
+
+    def csv(self, session_id, sort_by=None, filter_query=None):
+        """
+        Return every row of a session after filtering and sorting as CSV, not only the page shown.
+        :param session_id: session id
+        :param sort_by: DataTable sort_by
+        :param filter_query: DataTable filter_query
+        :return: CSV text, None when the session is gone
+        """
+        session = self.get(session_id)
+        return None if session is None else session.csv(sort_by, filter_query)
+
+    def stats(self):
+        return self._cache.stats()
+
+
+def export_dataframe(dataframe, index=None):
+    """
+    Return the rows of a dataframe with xsd:date columns formatted without a time of day, as the
+    DataTable shows them.
+    :param dataframe: dataframe
+    :param index: row positions to export, all rows when None
+    :return: dataframe
+    """
+    rows = dataframe if index is None else dataframe.iloc[index]
+    dates = {c: rows[c].dt.strftime('%Y-%m-%d') for c in dataframe.attrs.get('date_columns', [])}
+    return rows.assign(**dates) if dates else rows
+
+
+def page_dataframe(dataframe, page_current=0, page_size=25, index=None):
+    """
+    Return one page of DataTable records of a dataframe.
+    :param dataframe: dataframe
+    :param page_current: zero-based page number
+    :param page_size: rows per page
+    :param index: row positions to page through, all rows when None
+    :return: (records, page_count)
+    """
+    rows = len(dataframe) if index is None else len(index)
+    page_size = page_size or 25
+    page_count = max(math.ceil(rows / page_size), 1)
+    start = min(page_current or 0, page_count - 1) * page_size
+    if index is None:
+        page = dataframe.iloc[start:start + page_size]
+    else:
+        page = dataframe.iloc[index[start:start + page_size]]
+    records, _ = dataframe_to_table(page)
+    return records, page_count
+
+
+def sort_dataframe(dataframe, sort_by):
+    """
+    Sort a dataframe by DataTable sort_by specifications.
+    :param dataframe: dataframe
+    :param sort_by: list of {'column_id': ..., 'direction': 'asc'|'desc'}
+    :return: sorted dataframe
+    """
+    sort_by = [s for s in sort_by or [] if s['column_id'] in dataframe.columns]
+    if not sort_by:
+        return dataframe
+    return dataframe.sort_values(
+        [s['column_id'] for s in sort_by],
+        ascending=[s['direction'] == 'asc' for s in sort_by],
+        kind='stable',
+        na_position='last',
+    )
+
+
+def filter_dataframe(dataframe, filter_query):
+    """
+    Filter a dataframe by a DataTable filter_query using vectorized comparisons.
+    Parts joined with && must all hold; unrecognized parts are ignored.
+    :param dataframe: dataframe
+    :param filter_query: DataTable filter_query
+    :return: filtered dataframe
+    """
+    if not filter_query:
+        return dataframe
+    mask = pd.Series(True, index=dataframe.index)
+    for part in filter_query.split(' && '):
+        m = FILTER_PART_PATTERN.match(part)
+        if m is None or m['column'] not in dataframe.columns:
+            continue
+        mask &= _filter_mask(dataframe[m['column']], m['operator'], _unquote(m['value']))
+    return dataframe[mask]
+
+
+def _unquote(value):
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'`':
+        return value[1:-1]
+    return value
+
+
+def _filter_mask(column, operator, value):
+    operator = OPERATOR_ALIASES.get(operator, operator)
+    if operator == 'is blank':
+        return column.isna() | (column.astype(str) == '')
+    if operator == 'datestartswith':
+        if column.dtype.kind == 'M':
+            return column.dt.strftime('%Y-%m-%d').str.startswith(value).fillna(False)
+        return column.astype(str).str.startswith(value)
+    if operator.endswith('contains'):
+        text = column.astype(str)
+        return text.str.contains(value, case=operator != 'icontains', regex=False).fillna(False)
+
+    # s-prefixed operators compare as strings
+    if operator.startswith('s'):
+        column, operator = column.astype(str), operator[1:]
+    else:
+        value = _coerce(column, value)
+        if value is None:
+            return pd.Series(False, index=column.index)
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            column = column.astype(str)
+    comparisons = {
+        '=': column.__eq__, '!=': column.__ne__,
+        '<': column.__lt__, '<=': column.__le__, '>': column.__gt__, '>=': column.__ge__,
+    }
+    return comparisons[operator](value).fillna(False)
+
+
+def _coerce(column, value):
+    """
+    Convert a filter value to the type of a column, None when it cannot be compared.
+    """
+    try:
+        if column.dtype.kind in 'iuf':
+            return float(value)
+        if column.dtype.kind == 'M':
+            return pd.Timestamp(value)
+    except ValueError:
+        return None
+    return value
@@ -0,0 +1,127 @@
+import os
+import pickle
+import re
+import stat
+import tempfile
+import time
+
+# keys are ids made by the server, e.g. uuid4 hex, and never paths
+KEY_PATTERN = re.compile(r'[0-9A-Za-z_-]{1,128}')
+
+
+class SharedDirectory:
+    """
+    Values shared by the processes of the server, e.g. gunicorn workers, as one pickle
+    file per key in a directory they can all reach.
+
+    A value is written to a temporary file and moved into place, so readers see the whole
+    old value or the whole new one. Files not written or read for ttl seconds are removed
+    by expire. The directory holds pickles, so it must belong to the user of the server
+    and nobody else may write to it.
+    """
+
+    def __init__(self, path, ttl=None):
+        """
+        :param path: directory, created when missing
+        :param ttl: seconds after which an unused file expires, None for never
+        """
+        self.path = path
+        self.ttl = ttl
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        st = os.stat(path)
+        if st.st_uid != os.getuid() or st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            raise PermissionError(f'{path} must belong to this user and not be writable by others')
+
+    def filename(self, key):
+        """
+        Return the file of a key.
+        :param key: key
+        :return: filename, None when the key is not a valid id
+        """
+        if not isinstance(key, str) or KEY_PATTERN.fullmatch(key) is None:
+            return None
+        return os.path.join(self.path, f'{key}.pkl')
+
+    def write(self, key, value):
+        """
+        Store a value under a key, replacing the previous one.
+        :param key: key
+        :param value: picklable value
+        :return: None
+        """
+        filename = self.filename(key)
+        if filename is None:
+            raise ValueError(f'invalid key {key!r}')
+        fd, tmp_filename = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_filename, filename)
+        except BaseException:
+            os.unlink(tmp_filename)
+            raise
+
+    def read(self, key, touch=False):
+        """
+        Return the value stored under a key.
+        :param key: key
+        :param touch: restart the ttl of the file
+        :return: value, None when there is none
+        """
+        filename = self.filename(key)
+        if filename is None:
+            return None
+        try:
+            with open(filename, 'rb') as f:
+                value = pickle.load(f)
+            if touch:
+                os.utime(filename)
+        except (FileNotFoundError, EOFError):
+            return None
+        return value
+
+    def touch(self, key):
+        """
+        Restart the ttl of the file of a key.
+        :param key: key
+        :return: True when the file exists
+        """
+        filename = self.filename(key)
+        if filename is None:
+            return False
+        try:
+            os.utime(filename)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def exists(self, key):
+        filename = self.filename(key)
+        return filename is not None and os.path.exists(filename)
+
+    def remove(self, key):
+        filename = self.filename(key)
+        if filename is not None:
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+
+    def expire(self):
+        """
+        Remove the files not written or read for ttl seconds, e.g. left by a worker that exited.
+        :return: number of files removed
+        """
+        if self.ttl is None:
+            return 0
+        removed = 0
+        deadline = time.time() - self.ttl
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                try:
+                    if entry.stat().st_mtime < deadline:
+                        os.remove(entry.path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
@@ -0,0 +1,212 @@
+from rdflib import Literal, RDF, Variable
+from rdflib.plugins.sparql.evalutils import _val
+from rdflib.plugins.sparql.parserutils import CompValue
+from rdflib.query import Result
+
+# tables of OntologyStatistics a recognized query is answered from
+TRIPLES = 'triples'
+TYPES = 'types'
+
+
+class OntologyStatistics:
+    """
+    Aggregate statistics of an rdf graph: the triple count, the usage count of every
+    property and the instance count of every type, i.e. the rdf:type triples per object.
+    """
+
+    def __init__(self, graph=None):
+        """
+        :param graph: rdflib graph to count, empty statistics when None
+        """
+        self.triples = 0
+        self.properties = {}
+        self.classes = {}
+        if graph is not None:
+            self._add(graph.triples((None, None, None)), 1)
+
+    def _add(self, triples, sign):
+        properties, classes = self.properties, self.classes
+        for _, p, o in triples:
+            self.triples += sign
+            properties[p] = properties.get(p, 0) + sign
+            if p == RDF.type:
+                classes[o] = classes.get(o, 0) + sign
+        for counts in (properties, classes):
+            for k in [k for k, n in counts.items() if n <= 0]:
+                del counts[k]
+
+    def updated(self, added, removed):
+        """
+        Return the statistics after a delta.
+        :param added: set of triples added
+        :param removed: set of triples removed
+        :return: OntologyStatistics
+        """
+        stats = OntologyStatistics()
+        stats.triples = self.triples
+        stats.properties = dict(self.properties)
+        stats.classes = dict(self.classes)
+        stats._add(added, 1)
+        stats._add(removed, -1)
+        return stats
+
+    def to_dict(self, top=None):
+        """
+        Return the statistics as plain data, properties and classes by descending count.
+        :param top: number of properties and classes to keep, all when None
+        :return: dictionary
+        """
+        def ranked(counts):
+            return [{'iri': str(k), 'count': n}
+                    for k, n in sorted(counts.items(), key=lambda kv: (-kv[1], str(kv[0])))[:top]]
+
+        return {
+            'triples': self.triples,
+            'typed': sum(self.classes.values()),
+            'property_count': len(self.properties),
+            'class_count': len(self.classes),
+            'properties': ranked(self.properties),
+            'classes': ranked(self.classes),
+        }
+
+
+class StatisticsQuery:
+    """
+    A SELECT query recognized as an aggregate over one triple pattern, answered from
+    OntologyStatistics instead of being evaluated:
+
+    - COUNT over { ?s ?p ?o }, optionally grouped by ?p, or DISTINCT ?p
+    - COUNT over { ?x a ?class }, optionally grouped by ?class, or DISTINCT ?class
+    """
+
+    def __init__(self, table, key, columns, order=(), start=0, length=None):
+        """
+        :param table: TRIPLES or TYPES
+        :param key: the grouped variable, None for a single count
+        :param columns: list of (variable, 'key' or 'count'), the projection
+        :param order: list of (variable, descending)
+        :param start: OFFSET
+        :param length: LIMIT, None for all
+        """
+        self.table = table
+        self.key = key
+        self.columns = columns
+        self.order = order
+        self.start = start
+        self.length = length
+
+    def result(self, stats):
+        """
+        Return the query result from the statistics.
+        :param stats: OntologyStatistics
+        :return: rdflib Result
+        """
+        counts = stats.properties if self.table == TRIPLES else stats.classes
+        if self.key is None:
+            rows = [(None, stats.triples if self.table == TRIPLES else sum(counts.values()))]
+        else:
+            rows = list(counts.items())
+        solutions = [{v: key if kind == 'key' else Literal(n) for v, kind in self.columns} for key, n in rows]
+        # the sort is stable, sorting by the last condition first orders by all of them
+        for variable, descending in reversed(self.order):
+            solutions.sort(key=lambda s: _val(s[variable]), reverse=descending)
+        end = None if self.length is None else self.start + self.length
+        result = Result('SELECT')
+        result.vars = [v for v, _ in self.columns]
+        result.bindings = solutions[self.start:end]
+        return result
+
+
+def _pattern_table(bgp):
+    """
+    Return the table a one-pattern BGP is counted in, with the variables of the pattern.
+    :return: (table, {'s', 'p', 'o' or 'class' to Variable}), or None
+    """
+    if bgp.name != 'BGP' or len(bgp.triples) != 1:
+        return None
+    s, p, o = bgp.triples[0]
+    if not isinstance(s, Variable) or not isinstance(o, Variable) or s == o:
+        return None
+    if isinstance(p, Variable) and p not in (s, o):
+        return TRIPLES, {'s': s, 'p': p, 'o': o}
+    if p == RDF.type:
+        return TYPES, {'s': s, 'class': o}
+    return None
+
+
+def statistics_query(query, bound=()):
+    """
+    Recognize an aggregate query answered by the ontology statistics.
+    :param query: prepared query
+    :param bound: variables bound by initBindings, which a recognized query must not use
+    :return: StatisticsQuery, or None when the query has to be evaluated
+    """
+    part = query.algebra
+    if part.name != 'SelectQuery':
+        return None
+    p = part.p
+    start, length = 0, None
+    if p.name == 'Slice':
+        start, length, p = p.start or 0, p.length, p.p
+    distinct = p.name == 'Distinct'
+    if distinct:
+        p = p.p
+    if p.name != 'Project':
+        return None
+    projection, p = p.PV, p.p
+    order = []
+    if p.name == 'OrderBy':
+        for condition in p.expr:
+            if not isinstance(condition.expr, Variable):
+                return None
+            order.append((condition.expr, condition.order == 'DESC'))
+        p = p.p
+    aliases = {}
+    while p.name == 'Extend':
+        if not isinstance(p.expr, Variable):
+            return None
+        aliases[p.var] = p.expr
+        p = p.p
+
+    sources = {}
+    if p.name == 'AggregateJoin':
+        group = p.p
+        if group.name != 'Group' or not isinstance(group.p, CompValue):
+            return None
+        matched = _pattern_table(group.p)
+        if matched is None:
+            return None
+        table, variables = matched
+        keys = group.expr or []
+        key_name = 'p' if table == TRIPLES else 'class'
+        if len(keys) > 1 or (keys and keys[0] != variables[key_name]):
+            return None
+        key = keys[0] if keys else None
+        for aggregate in p.A:
+            if aggregate.name == 'Aggregate_Count' and not aggregate.distinct and (
+                    aggregate.vars == '*' or aggregate.vars in variables.values()):
+                sources[aggregate.res] = 'count'
+            elif aggregate.name == 'Aggregate_Sample' and key is not None and aggregate.vars == key:
+                sources[aggregate.res] = 'key'
+            else:
+                return None
+    else:
+        # DISTINCT ?p over { ?s ?p ?o } or DISTINCT ?class over { ?x a ?class }
+        matched = _pattern_table(p)
+        if matched is None or not distinct or aliases or len(projection) != 1:
+            return None
+        table, variables = matched
+        key = variables['p' if table == TRIPLES else 'class']
+        sources[key] = 'key'
+
+    if set(variables.values()) & set(bound):
+        return None
+    columns = []
+    for variable in projection:
+        kind = sources.get(aliases.get(variable, variable))
+        if kind is None:
+            return None
+        columns.append((variable, kind))
+    if any(variable not in projection for variable, _ in order):
+        return None
+    return StatisticsQuery(table, key, columns, order, start, length)
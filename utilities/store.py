@@ -0,0 +1,419 @@
+import threading
+from collections import defaultdict
+
+import numpy as np
+from rdflib import URIRef
+from rdflib.store import Store
+
+# column order of each index, as positions in a (subject, predicate, object) triple
+SPO, POS, OSP = (0, 1, 2), (1, 2, 0), (2, 0, 1)
+
+# approximate footprint of one interned term (python object plus dictionary slot)
+BYTES_PER_TERM = 160
+
+# decoded terms kept per SnapshotStore
+TERM_CACHE_SIZE = 1 << 16
+
+
+def _empty_index(dtype):
+    return tuple(np.empty(0, dtype=dtype) for _ in range(3))
+
+
+def _sorted_index(rows, order):
+    """
+    Return the columns of a triple array sorted lexicographically in a column order.
+    :param rows: (n, 3) array of term ids
+    :param order: column order
+    :return: tuple of three contiguous column arrays
+    """
+    keys = rows[:, order]
+    perm = np.lexsort((keys[:, 2], keys[:, 1], keys[:, 0]))
+    return tuple(np.ascontiguousarray(keys[perm, i]) for i in range(3))
+
+
+def index_arrays(triples):
+    """
+    Return the SPO, POS and OSP indexes of a triple array.
+    :param triples: (n, 3) array of term ids, without duplicate rows
+    :return: dictionary of column order to tuple of sorted column arrays
+    """
+    return {order: _sorted_index(triples, order) for order in (SPO, POS, OSP)}
+
+
+def _prefix_range(index, prefix):
+    """
+    Return the [lo, hi) row range of a sorted index whose leading columns equal a prefix.
+    :param index: tuple of sorted column arrays
+    :param prefix: leading term ids
+    :return: (lo, hi)
+    """
+    lo, hi = 0, len(index[0])
+    for column, value in zip(index, prefix):
+        window = column[lo:hi]
+        lo, hi = lo + int(np.searchsorted(window, value, 'left')), lo + int(np.searchsorted(window, value, 'right'))
+        if lo == hi:
+            break
+    return lo, hi
+
+
+class NamespaceBindings:
+    """
+    Prefix to namespace bindings of a store, kept in the _namespace and _prefix dictionaries.
+    """
+
+    def bind(self, prefix, namespace, override=True):
+        bound_namespace = self._namespace.get(prefix)
+        bound_prefix = self._prefix.get(namespace)
+        if bound_prefix is None and bound_namespace is not None:
+            bound_prefix = self._prefix.get(bound_namespace)
+        if override:
+            if bound_prefix is not None:
+                del self._namespace[bound_prefix]
+            if bound_namespace is not None:
+                del self._prefix[bound_namespace]
+            self._prefix[namespace] = prefix
+            self._namespace[prefix] = namespace
+        else:
+            namespace = bound_namespace if bound_namespace is not None else namespace
+            prefix = bound_prefix if bound_prefix is not None else prefix
+            self._prefix[namespace] = prefix
+            self._namespace[prefix] = namespace
+
+    def namespace(self, prefix):
+        return self._namespace.get(prefix)
+
+    def prefix(self, namespace):
+        return self._prefix.get(namespace)
+
+    def namespaces(self):
+        yield from list(self._namespace.items())
+
+
+class NumpyStore(NamespaceBindings, Store):
+    """
+    In-memory triple store that interns terms to integer ids and keeps sorted
+    SPO, POS and OSP indexes as NumPy arrays, so triple-pattern lookups are
+    binary searches.
+
+    Additions and removals are buffered and merged into the indexes on the next
+    read. Index arrays are never modified in place, so readers holding a
+    reference keep a consistent view while a merge runs.
+    """
+
+    context_aware = False
+    formula_aware = False
+    graph_aware = False
+    transaction_aware = False
+
+    def __init__(self, configuration=None, identifier=None):
+        super().__init__(configuration)
+        self.identifier = identifier
+        self._term_ids = {}
+        self._terms = []
+        self._dtype = np.int32
+        self._indexes = {order: _empty_index(self._dtype) for order in (SPO, POS, OSP)}
+        self._pending = []
+        self._removals = set()
+        self._lock = threading.RLock()
+        self._namespace = {}
+        self._prefix = {}
+
+    @property
+    def nbytes(self):
+        index_bytes = sum(c.nbytes for index in self._indexes.values() for c in index)
+        return index_bytes + len(self._terms) * BYTES_PER_TERM
+
+    def term_id(self, term):
+        """
+        Return the integer id of a term, or None if the store has never seen it.
+        :param term: rdflib term
+        :return: term id
+        """
+        return self._term_ids.get(term)
+
+    def copy(self):
+        """
+        Return a store with the same triples and namespaces that changes independently of this one.
+        The index arrays are shared, since they are never modified in place, and the term tables copied.
+        :return: NumpyStore
+        """
+        self._flush()
+        with self._lock:
+            store = NumpyStore(identifier=self.identifier)
+            store._term_ids = dict(self._term_ids)
+            store._terms = list(self._terms)
+            store._dtype = self._dtype
+            store._indexes = self._indexes
+            store._namespace = dict(self._namespace)
+            store._prefix = dict(self._prefix)
+        return store
+
+    def add(self, triple, context, quoted=False):
+        ids = tuple(self._intern(t) for t in triple)
+        with self._lock:
+            self._pending.append(ids)
+            self._removals.discard(ids)
+
+    def addN(self, quads):
+        intern = self._intern
+        rows = [(intern(s), intern(p), intern(o)) for s, p, o, _ in quads]
+        with self._lock:
+            self._pending.extend(rows)
+            self._removals.difference_update(rows)
+
+    def remove(self, triple, context=None):
+        if all(t is not None for t in triple):
+            ids = tuple(self._term_ids.get(t) for t in triple)
+            if None not in ids:
+                with self._lock:
+                    self._removals.add(ids)
+            return
+        with self._lock:
+            rows = [ids for ids in self._match(triple)]
+            self._removals.update(rows)
+            self._flush()
+
+    def triples(self, triple_pattern, context=None):
+        terms = self._terms
+        for s, p, o in self._match(triple_pattern):
+            yield (terms[s], terms[p], terms[o]), iter(())
+
+    def __len__(self, context=None):
+        self._flush()
+        return len(self._indexes[SPO][0])
+
+    def contexts(self, triple=None):
+        return iter(())
+
+    def _intern(self, term):
+        term_id = self._term_ids.get(term)
+        if term_id is None:
+            with self._lock:
+                term_id = self._term_ids.get(term)
+                if term_id is None:
+                    term_id = self._term_ids[term] = len(self._terms)
+                    self._terms.append(term)
+        return term_id
+
+    def _match(self, triple_pattern):
+        """
+        Yield the (s, p, o) id tuples matching a triple pattern.
+        :param triple_pattern: (subject, predicate, object) with None for unbound positions
+        :return: generator of id tuples
+        """
+        self._flush()
+        bound = []
+        for term in triple_pattern:
+            if term is None:
+                bound.append(None)
+                continue
+            term_id = self.term_id(term)
+            if term_id is None:
+                return
+            bound.append(term_id)
+        s, p, o = bound
+
+        if s is not None:
+            order, prefix = (OSP, (o, s)) if p is None and o is not None else (SPO, [x for x in (s, p, o)])
+        elif p is not None:
+            order, prefix = POS, (p, o)
+        elif o is not None:
+            order, prefix = OSP, (o,)
+        else:
+            order, prefix = SPO, ()
+        prefix = tuple(x for x in prefix if x is not None)
+
+        index = self._indexes[order]
+        lo, hi = _prefix_range(index, prefix)
+        if lo == hi:
+            return
+        columns = [c[lo:hi].tolist() for c in index]
+        # put the columns back into subject, predicate, object order
+        spo = [columns[order.index(i)] for i in range(3)]
+        yield from zip(*spo)
+
+    def _flush(self):
+        if not self._pending and not self._removals:
+            return
+        with self._lock:
+            if not self._pending and not self._removals:
+                return
+            if len(self._terms) >= np.iinfo(self._dtype).max:
+                self._dtype = np.int64
+            spo = self._indexes[SPO]
+            rows = np.column_stack(spo).astype(self._dtype, copy=False)
+            if self._pending:
+                pending = np.array(self._pending, dtype=self._dtype).reshape(-1, 3)
+                rows = np.concatenate([rows, pending])
+            rows = np.ascontiguousarray(rows)
+            if self._removals:
+                removed = np.array(list(self._removals), dtype=self._dtype).reshape(-1, 3)
+                row_dtype = np.dtype([('s', self._dtype), ('p', self._dtype), ('o', self._dtype)])
+                keep = ~np.isin(rows.view(row_dtype).ravel(), np.ascontiguousarray(removed).view(row_dtype).ravel())
+                rows = rows[keep]
+
+            spo = _sorted_index(rows, SPO)
+            if len(spo[0]):
+                # drop duplicate triples, which are adjacent once sorted
+                distinct = np.ones(len(spo[0]), dtype=bool)
+                distinct[1:] = (np.diff(spo[0]) != 0) | (np.diff(spo[1]) != 0) | (np.diff(spo[2]) != 0)
+                spo = tuple(c[distinct] for c in spo)
+            self._indexes = index_arrays(np.column_stack(spo))
+            self._pending = []
+            self._removals = set()
+
+
+class SnapshotStore(NumpyStore):
+    """
+    Read-only NumpyStore over a memory-mapped graph snapshot.
+
+    The indexes and the term table are used in place from the snapshot file, so every
+    process opening the same snapshot shares one copy in the page cache. Only the
+    terms a process actually reads are decoded, and at most TERM_CACHE_SIZE are kept.
+    """
+
+    def __init__(self, configuration=None, identifier=None, snapshot=None):
+        """
+        :param configuration: snapshot filename, when snapshot is None
+        :param identifier: store identifier
+        :param snapshot: utilities.serialization.Snapshot
+        """
+        super().__init__(None, identifier)
+        self.snapshot = None
+        if snapshot is not None:
+            self._attach(snapshot)
+        elif configuration:
+            self.open(configuration)
+
+    def open(self, configuration, create=False):
+        from utilities.serialization import load_snapshot
+        self._attach(load_snapshot(configuration))
+
+    def _attach(self, snapshot):
+        self.snapshot = snapshot
+        self._indexes = snapshot.indexes()
+        self._term_cache = {}
+        for prefix, namespace in snapshot.namespaces:
+            self.bind(prefix, URIRef(namespace))
+
+    @property
+    def nbytes(self):
+        return self.snapshot.nbytes + len(self._term_cache) * BYTES_PER_TERM
+
+    def term_id(self, term):
+        return self.snapshot.term_id(term)
+
+    def add(self, triple, context, quoted=False):
+        raise TypeError('SnapshotStore is read-only')
+
+    def addN(self, quads):
+        raise TypeError('SnapshotStore is read-only')
+
+    def remove(self, triple, context=None):
+        raise TypeError('SnapshotStore is read-only')
+
+    def triples(self, triple_pattern, context=None):
+        term = self._term
+        for s, p, o in self._match(triple_pattern):
+            yield (term(s), term(p), term(o)), iter(())
+
+    def _term(self, term_id):
+        term = self._term_cache.get(term_id)
+        if term is None:
+            if len(self._term_cache) >= TERM_CACHE_SIZE:
+                self._term_cache = {}
+            term = self._term_cache[term_id] = self.snapshot.term(term_id)
+        return term
+
+
+class OverlayStore(NamespaceBindings, Store):
+    """
+    Read-only view of a graph with a triple delta applied on top, so a new version of
+    a graph shares its unchanged triples with the old one instead of copying them.
+    The base graph must not change while overlays use it; updating an overlay gives
+    an overlay of the same base with the deltas combined, never an overlay of an overlay.
+    """
+
+    context_aware = False
+    formula_aware = False
+    graph_aware = False
+    transaction_aware = False
+
+    def __init__(self, base, added=(), removed=(), identifier=None):
+        """
+        :param base: rdflib graph
+        :param added: triples not in base
+        :param removed: triples of base hidden by the overlay
+        """
+        super().__init__()
+        self.identifier = identifier
+        self.base = base
+        self.added = frozenset(added)
+        self.removed = frozenset(removed)
+        self._namespace = {}
+        self._prefix = {}
+        for prefix, namespace in base.namespaces():
+            self.bind(prefix, namespace)
+        # removed triples by subject, so most base triples are checked with a single lookup
+        self._removed = defaultdict(set)
+        for s, p, o in self.removed:
+            self._removed[s].add((p, o))
+        self._added = [defaultdict(list) for _ in range(3)]
+        for triple in self.added:
+            for position, term in enumerate(triple):
+                self._added[position][term].append(triple)
+
+    def updated(self, added, removed):
+        """
+        Return an overlay of the same base showing this one with another delta applied.
+        :param added: triples not in this overlay
+        :param removed: triples of this overlay
+        :return: OverlayStore
+        """
+        overlay_added, overlay_removed = set(self.added), set(self.removed)
+        for triple in removed:
+            if triple in overlay_added:
+                overlay_added.discard(triple)
+            else:
+                overlay_removed.add(triple)
+        for triple in added:
+            if triple in overlay_removed:
+                overlay_removed.discard(triple)
+            else:
+                overlay_added.add(triple)
+        store = OverlayStore(self.base, overlay_added, overlay_removed, self.identifier)
+        store._namespace, store._prefix = dict(self._namespace), dict(self._prefix)
+        return store
+
+    def add(self, triple, context, quoted=False):
+        raise TypeError('OverlayStore is read-only')
+
+    def addN(self, quads):
+        raise TypeError('OverlayStore is read-only')
+
+    def remove(self, triple, context=None):
+        raise TypeError('OverlayStore is read-only')
+
+    def triples(self, triple_pattern, context=None):
+        removed = self._removed
+        for triple in self.base.triples(triple_pattern):
+            hidden = removed.get(triple[0]) if removed else None
+            if hidden is None or (triple[1], triple[2]) not in hidden:
+                yield triple, iter(())
+        if not self.added:
+            return
+        bound = [(position, term) for position, term in enumerate(triple_pattern) if term is not None]
+        if not bound:
+            candidates = self.added
+        else:
+            position, term = bound[0]
+            candidates = self._added[position].get(term, ())
+        for triple in candidates:
+            if all(triple[position] == term for position, term in bound):
+                yield triple, iter(())
+
+    def __len__(self, context=None):
+        return len(self.base) - len(self.removed) + len(self.added)
+
+    def contexts(self, triple=None):
+        return iter(())
@@ -0,0 +1,165 @@
+import functools
+import hashlib
+import math
+import re
+import threading
+
+from rdflib import Literal, URIRef, Variable, XSD
+from rdflib.plugins.sparql import prepareQuery
+
+# a template parameter is declared with a <<name: control>> tag
+TAG_PATTERN = re.compile(r'<<\s*([\w-]+)\s*:\s*([\w-]+)\s*>>')
+PREFIX_PATTERN = re.compile(r'PREFIX\s+([\w-]*):\s*<([^>]*)>', re.IGNORECASE)
+
+NUMERIC_DATATYPES = (XSD.integer, XSD.decimal, XSD.double)
+
+# prefix of the variables that stand in for template parameters
+SLOT_PREFIX = '_param_'
+
+# rdflib's pyparsing grammar is not thread-safe, concurrent callbacks compile one query at a time
+_parse_lock = threading.Lock()
+
+
+class QueryTemplate:
+    """
+    A SPARQL query template compiled once into a prepared query.
+
+    Every occurrence of a template parameter is replaced by a variable, so a
+    submit only has to bind values instead of re-parsing the query text:
+
+    - prefixed names containing the parameter, e.g. ns1:ticker1_date, are bound to IRIs
+    - typed literals of the parameter, e.g. "start_date"^^xsd:date, are bound to typed literals
+    - the bare parameter, e.g. precision, is bound to a literal
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.id = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        # longest names first, so ticker10 is substituted before ticker1
+        self.parameters = dict(sorted(TAG_PATTERN.findall(text), key=lambda tag: -len(tag[0])))
+        self.namespaces = dict(PREFIX_PATTERN.findall(text))
+        self.slots = {}
+        with _parse_lock:
+            self.query = prepareQuery(self._rewrite(self._slot_variable))
+
+    def bindings(self, values):
+        """
+        Return the initBindings for a set of control values.
+        :param values: dictionary of control name to value
+        :return: dictionary of variable to rdflib term
+        """
+        bindings = {}
+        for variable, (name, kind, arg) in self.slots.items():
+            value = self._value(name, values)
+            if kind == 'iri':
+                namespace, local = arg
+                bindings[variable] = URIRef(namespace + local.replace(name, value))
+            elif kind == 'typed':
+                bindings[variable] = Literal(value, datatype=URIRef(arg))
+            else:
+                bindings[variable] = value if isinstance(value, Literal) else Literal(value)
+        return bindings
+
+    def render(self, values):
+        """
+        Return the query text with the control values written in, for display.
+        :param values: dictionary of control name to value
+        :return: query text
+        """
+        def substitute(name, kind, arg, token):
+            value = self._value(name, values)
+            if kind == 'iri':
+                return token.replace(name, value)
+            if kind == 'typed':
+                return token.replace(f'"{name}"', f'"{value}"')
+            if isinstance(value, Literal) and value.datatype not in NUMERIC_DATATYPES:
+                return value.n3()
+            return str(value)
+        return self._rewrite(substitute)
+
+    def column_names(self, values):
+        """
+        Return result column names with parameter names replaced by their values,
+        e.g. ticker1Price becomes BTCPrice.
+        :param values: dictionary of control name to value
+        :return: dictionary of result variable name to column name
+        """
+        names = {}
+        for column in self.query.algebra.get('PV', []):
+            name = str(column)
+            for parameter, control in self.parameters.items():
+                value = values.get(control)
+                if isinstance(value, str):
+                    name = name.replace(parameter, value)
+            names[str(column)] = name
+        return names
+
+    def _value(self, name, values):
+        control = self.parameters[name]
+        value = values.get(control)
+        if value is None:
+            raise ValueError(f'no value selected for template parameter "{name}" ({control})')
+        convert = CONTROL_CONVERTERS.get(control)
+        return convert(value) if convert is not None else value
+
+    def _slot_variable(self, name, kind, arg, token):
+        variable = SLOT_PREFIX + re.sub(r'\W', '_', token if kind == 'iri' else name)
+        self.slots[Variable(variable)] = (name, kind, arg)
+        return '?' + variable
+
+    def _rewrite(self, substitute):
+        """
+        Replace every parameter occurrence outside comment lines.
+        :param substitute: callable(name, kind, arg, token) returning the replacement text
+        :return: rewritten query text
+        """
+        lines = []
+        for line in self.text.splitlines():
+            if not line.lstrip().startswith('#'):
+                for name in self.parameters:
+                    line = self._rewrite_line(line, name, substitute)
+            lines.append(line)
+        return '\n'.join(lines)
+
+    def _rewrite_line(self, line, name, substitute):
+        def typed(m):
+            datatype = m.group(1)
+            if datatype.startswith('<'):
+                datatype = datatype[1:-1]
+            else:
+                prefix, local = datatype.split(':', 1)
+                datatype = self.namespaces.get(prefix, '') + local
+            return substitute(name, 'typed', datatype, m.group(0))
+
+        def iri(m):
+            prefix, local = m.group(1), m.group(2)
+            if prefix not in self.namespaces:
+                return m.group(0)
+            return substitute(name, 'iri', (self.namespaces[prefix], local), m.group(0))
+
+        n = re.escape(name)
+        line = re.sub(rf'"{n}"\^\^(<[^>]*>|[\w-]*:[\w-]+)', typed, line)
+        line = re.sub(rf'(?<![\w?$:<])([A-Za-z][\w-]*|):([\w-]*{n}[\w-]*)', iri, line)
+        line = re.sub(rf'(?<![\w?$:"#]){n}(?![\w:"])', lambda m: substitute(name, 'value', None, m.group(0)), line)
+        return line
+
+
+def _precision(value):
+    # precision is the number of decimal points, used in the query as a scale factor
+    return Literal(str(math.pow(10, value)), datatype=XSD.decimal)
+
+
+# conversion of a control value before it is bound, by control name
+CONTROL_CONVERTERS = {
+    'precision': _precision,
+}
+
+
+@functools.lru_cache(maxsize=128)
+def get_query_template(text):
+    """
+    Return the compiled template of a query text, compiling it on first use.
+    :param text: query template text
+    :return: QueryTemplate
+    """
+    return QueryTemplate(text)
@@ -0,0 +1,226 @@
+import copy
+import itertools
+import math
+import re
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_DOWN, ROUND_HALF_UP
+
+import numpy as np
+import pandas as pd
+from rdflib import Literal
+
+from utilities.view import local_name
+
+# predicates of an observation, e.g. ns1:BTC_date and ns1:BTC_price
+OBSERVATION_PATTERN = re.compile(r'^(?P<series>\w+?)_(?P<field>date|price)$')
+
+# a template declares the parameters naming its series with a comment, e.g. # series: ticker1 ticker2
+SERIES_PATTERN = re.compile(r'^\s*#\s*series\s*:\s*(?P<parameters>[\w\s-]+?)\s*$', re.MULTILINE)
+
+
+class TimeSeries:
+    """
+    The observations of one series as NumPy arrays sorted by date, the prices holding the
+    exact Decimal or float values of their literals.
+    """
+
+    def __init__(self, dates, prices):
+        order = np.argsort(dates, kind='stable')
+        self.dates = dates[order]
+        self.prices = prices[order]
+        # a join on a repeated date multiplies rows, which only the sparql path reproduces
+        self.unique = bool(len(self.dates) < 2 or np.all(self.dates[1:] != self.dates[:-1]))
+
+    def __len__(self):
+        return len(self.dates)
+
+    def between(self, start=None, end=None):
+        """
+        Return the observations in a date range, found by binary search.
+        :param start: first date, included, None for unbounded
+        :param end: last date, included, None for unbounded
+        :return: (dates, prices) array views
+        """
+        lo = 0 if start is None else np.searchsorted(self.dates, np.datetime64(start, 'D'), side='left')
+        hi = len(self.dates) if end is None else np.searchsorted(self.dates, np.datetime64(end, 'D'), side='right')
+        return self.dates[lo:hi], self.prices[lo:hi]
+
+
+class TimeSeriesIndex:
+    """
+    Columnar index of the dated price observations of an rdf graph.
+
+    An observation is a resource with a <SERIES>_date and a <SERIES>_price literal.
+    Each series is kept as sorted date and price arrays, so a date range is a slice
+    and several series are aligned on date with a merge join.
+    """
+
+    def __init__(self, graph):
+        self.series = {}
+        self.incomplete = set()
+        # observation predicates of each series, e.g. {'BTC': {ns1:BTC_date, ns1:BTC_price}}
+        self.predicates = defaultdict(set)
+        self._index(graph)
+
+    def _index(self, triples):
+        """
+        Add the series observed in a set of triples.
+        :param triples: iterable of triples holding every observation of those series
+        :return: None
+        """
+        observations = defaultdict(dict)
+        for s, p, o in triples:
+            if not isinstance(o, Literal):
+                continue
+            m = OBSERVATION_PATTERN.match(local_name(p))
+            if m is not None:
+                observations[m['series'], s][m['field']] = o
+                self.predicates[m['series']].add(p)
+
+        dates, prices = defaultdict(list), defaultdict(list)
+        for (series, _), fields in observations.items():
+            if len(fields) != 2:
+                self.incomplete.add(series)
+                continue
+            dates[series].append(str(fields['date']))
+            prices[series].append(fields['price'])
+
+        for name in dates:
+            if name in self.incomplete:
+                continue
+            try:
+                self.series[name] = TimeSeries(np.array(dates[name], dtype='datetime64[D]'),
+                                               np.array([_price(p) for p in prices[name]], dtype=object))
+            except ValueError:
+                # dates that are not ISO dates, e.g. 01/02/2023, or prices that are not numbers
+                # are left to sparql
+                self.incomplete.add(name)
+
+    def updated(self, graph, added, removed):
+        """
+        Return the index of a graph after a triple delta, rebuilding only the series the
+        delta touches and sharing the others with this index.
+        :param graph: updated rdf graph
+        :param added: triples added by the delta
+        :param removed: triples removed by the delta
+        :return: TimeSeriesIndex, this one when no series changed
+        """
+        touched = defaultdict(set)
+        for _, p, _ in itertools.chain(added, removed):
+            m = OBSERVATION_PATTERN.match(local_name(p))
+            if m is not None:
+                touched[m['series']].add(p)
+        if not touched:
+            return self
+
+        index = copy.copy(self)
+        index.series = {name: series for name, series in self.series.items() if name not in touched}
+        index.incomplete = self.incomplete - touched.keys()
+        index.predicates = defaultdict(set, {name: set(p) for name, p in self.predicates.items()})
+        for name, predicates in touched.items():
+            index.predicates[name] |= predicates
+        index._index(t for name in touched for p in index.predicates[name] for t in graph.triples((None, p, None)))
+        return index
+
+    def __contains__(self, name):
+        return name in self.series
+
+    def supports(self, names):
+        """
+        Return whether a join of series is answered exactly by the index.
+        :param names: series names
+        :return: bool
+        """
+        return all(n in self.series and self.series[n].unique and n not in self.incomplete for n in names)
+
+    def aligned(self, names, start=None, end=None):
+        """
+        Return the dates observed in every series of a date range, and the prices of each series on those dates.
+        :param names: series names
+        :param start: first date, included
+        :param end: last date, included
+        :return: (dates, list of price arrays)
+        """
+        slices = [self.series[n].between(start, end) for n in names]
+        if not slices:
+            return np.array([], dtype='datetime64[D]'), []
+        dates = slices[0][0]
+        for other, _ in slices[1:]:
+            dates = np.intersect1d(dates, other, assume_unique=True)
+        prices = [p[np.searchsorted(d, dates)] for d, p in slices]
+        return dates, prices
+
+
+def _price(literal):
+    """
+    Return the value of a price literal as sparql computes with it: Decimal for xsd:decimal
+    and integers, float for xsd:double and untyped literals.
+    """
+    value = literal.toPython()
+    if isinstance(value, int) and not isinstance(value, bool):
+        return Decimal(value)
+    return value if isinstance(value, (Decimal, float)) else float(literal)
+
+
+def round_half_up(values, precision):
+    """
+    Round like the sparql ROUND(?x * scale) / scale of the templates: in decimal arithmetic
+    for Decimal values, halves towards positive infinity, converted to float once rounded.
+    :param values: array of Decimal or float values
+    :param precision: number of decimal points
+    :return: float64 array of rounded numbers
+    """
+    # the scale bound to the template, see utilities.templates
+    scale = Decimal(str(math.pow(10, precision)))
+    rounded = np.empty(len(values), dtype=np.float64)
+    for i, value in enumerate(values):
+        factor = scale if isinstance(value, Decimal) else float(scale)
+        scaled = value * factor
+        whole = int(Decimal(scaled).quantize(1, ROUND_HALF_UP if scaled > 0 else ROUND_HALF_DOWN))
+        rounded[i] = whole / factor
+    return rounded
+
+
+def series_parameters(template):
+    """
+    Return the template parameters naming the series of a time-series query, declared
+    with a '# series: ticker1 ticker2' comment; empty when the query has none.
+    :param template: QueryTemplate
+    :return: list of parameter names
+    """
+    m = SERIES_PATTERN.search(template.text)
+    return m['parameters'].split() if m else []
+
+
+def series_dataframe(index, template, values):
+    """
+    Answer a time-series template from the index instead of running its sparql query.
+    The columns match the sparql result: one rounded price column per series parameter
+    and the date column.
+    :param index: TimeSeriesIndex
+    :param template: QueryTemplate declaring its series parameters
+    :param values: dictionary of control name to value
+    :return: dataframe, or None when the query needs the sparql path
+    """
+    parameters = series_parameters(template)
+    names = [values.get(template.parameters.get(p)) for p in parameters]
+    start, end, precision = values.get('start_date'), values.get('end_date'), values.get('precision')
+    if not parameters or None in names or None in (start, end, precision) or not index.supports(names):
+        return None
+
+    dates, prices = index.aligned(names, start, end)
+    series_prices = dict(zip(parameters, prices))
+    column_names = template.column_names(values)
+    arrays = {}
+    for variable in template.query.algebra.get('PV', []):
+        variable = str(variable)
+        parameter = next((p for p in parameters if p in variable), None)
+        if parameter is not None:
+            arrays[column_names[variable]] = round_half_up(series_prices[parameter], precision)
+        elif variable == 'date':
+            arrays[column_names[variable]] = dates
+        else:
+            return None
+    dataframe = pd.DataFrame(arrays, columns=list(arrays), copy=False)
+    dataframe.attrs['date_columns'] = [column_names['date']] if 'date' in column_names else []
+    return dataframe
@@ -0,0 +1,223 @@
+from collections import Counter, defaultdict
+
+from rdflib import BNode, Literal, OWL, RDF, RDFS
+
+# maximum number of nodes in the summarized view
+DEFAULT_MAX_NODES = 150
+
+# maximum number of neighbors added when a node is expanded
+DEFAULT_EXPAND_LIMIT = 60
+
+CLASS_TYPES = {OWL.Class, RDFS.Class}
+
+
+def local_name(term):
+    """
+    Return the local part of an IRI, or the string form of any other term.
+    :param term: rdflib term
+    :return: string
+    """
+    text = str(term)
+    if isinstance(term, Literal):
+        return text
+    for sep in ('#', '/'):
+        head, _, tail = text.rpartition(sep)
+        if head and tail:
+            return tail
+    return text
+
+
+def _node(node_id, label, kind, **data):
+    return {'data': dict(id=node_id, label=label, kind=kind, **data), 'classes': kind}
+
+
+def _edge(source, target, label, **data):
+    return {'data': dict(id=f'{source}|{label}|{target}', source=source, target=target, label=label, **data)}
+
+
+class GraphView:
+    """
+    Level-of-detail Cytoscape elements of an rdf graph.
+
+    The summary shows classes (with instance counts) and groups of untyped resources
+    sharing the same predicates, with literals collapsed into counts and the number
+    of nodes capped. Nodes are expanded on demand into their neighborhood, and only
+    the elements not already shown are returned.
+    """
+
+    def __init__(self, graph, max_nodes=DEFAULT_MAX_NODES, expand_limit=DEFAULT_EXPAND_LIMIT):
+        self.graph = graph
+        self.max_nodes = max_nodes
+        self.expand_limit = expand_limit
+        self._elements = None
+        self._summary = None
+        self._index()
+
+    def _index(self):
+        """
+        Collect classes, instances, untyped resource groups and literal counts in one pass.
+        """
+        self.terms = {}
+        self.instances = defaultdict(list)
+        self.literal_counts = Counter()
+        self.classes = set()
+        subclass_edges = set()
+        predicates = defaultdict(set)
+        typed = set()
+
+        for s, p, o in self.graph:
+            self.terms.setdefault(str(s), s)
+            predicates[s].add(p)
+            if isinstance(o, Literal):
+                self.literal_counts[s] += 1
+                continue
+            self.terms.setdefault(str(o), o)
+            if p == RDF.type:
+                typed.add(s)
+                if o in CLASS_TYPES:
+                    self.classes.add(s)
+                else:
+                    self.instances[o].append(s)
+                    self.classes.add(o)
+            elif p == RDFS.subClassOf:
+                self.classes.update((s, o))
+                subclass_edges.add((s, o))
+
+        # blank nodes (restrictions, lists) are only shown when expanded
+        self.classes = {c for c in self.classes if not isinstance(c, BNode)}
+        self.subclass_edges = [(s, o) for s, o in subclass_edges if s in self.classes and o in self.classes]
+
+        groups = defaultdict(list)
+        for s, preds in predicates.items():
+            if s not in typed and s not in self.classes:
+                groups[frozenset(preds)].append(s)
+        self.groups = {}
+        self.group_of = {}
+        for n, (preds, members) in enumerate(sorted(groups.items(), key=lambda g: -len(g[1]))):
+            group_id = f'group:{n}'
+            self.groups[group_id] = (sorted(local_name(p) for p in preds), members)
+            for m in members:
+                self.group_of[m] = group_id
+
+    def elements(self):
+        """
+        Return every node and edge of the graph, computed once.
+        :return: list of cytoscape elements
+        """
+        if self._elements is None:
+            nodes, edges = {}, {}
+            for s, p, o in self.graph:
+                for term in (s, o):
+                    nodes.setdefault(str(term), {'data': {'id': str(term), 'label': str(term)}})
+                edge = _edge(str(s), str(o), local_name(p))
+                edges.setdefault(edge['data']['id'], edge)
+            self._elements = list(nodes.values()) + list(edges.values())
+        return self._elements
+
+    def summary(self):
+        """
+        Return the summarized elements: class and resource-group nodes, capped at max_nodes.
+        :return: list of cytoscape elements
+        """
+        if self._summary is not None:
+            return self._summary
+
+        degree = Counter()
+        for s, o in self.subclass_edges:
+            degree[s] += 1
+            degree[o] += 1
+        candidates = [
+            (len(self.instances[c]) + degree[c],
+             _node(str(c), local_name(c), 'class', count=len(self.instances[c]),
+                   literals=self.literal_counts[c]))
+            for c in self.classes
+        ]
+        for group_id, (preds, members) in self.groups.items():
+            label = f"{', '.join(preds[:3])}{', ...' if len(preds) > 3 else ''} ({len(members)})"
+            literals = sum(self.literal_counts[m] for m in members)
+            candidates.append((len(members), _node(group_id, label, 'group', count=len(members), literals=literals)))
+
+        candidates.sort(key=lambda c: -c[0])
+        nodes = [node for _, node in candidates[:self.max_nodes]]
+        shown = {n['data']['id'] for n in nodes}
+        edges = [_edge(str(s), str(o), 'subClassOf') for s, o in self.subclass_edges
+                 if str(s) in shown and str(o) in shown]
+        self._summary = nodes + edges
+        return self._summary
+
+    def neighborhood(self, node_id):
+        """
+        Return the elements around a node: the instances of a class, the members of a
+        group, or the triples of a resource.
+        :param node_id: node id
+        :return: list of cytoscape elements
+        """
+        limit = self.expand_limit
+        if node_id in self.groups:
+            _, members = self.groups[node_id]
+            return [e for m in members[:limit]
+                    for e in (self._resource_node(m), _edge(str(m), node_id, 'member'))]
+
+        term = self.terms.get(node_id)
+        if term is None:
+            return []
+        elements = []
+        if term in self.classes:
+            for i in self.instances[term][:limit]:
+                elements += [self._resource_node(i), _edge(str(i), node_id, 'type')]
+        for s, p, o in self.graph.triples((term, None, None)):
+            if len(elements) >= 2 * limit:
+                break
+            if isinstance(o, Literal):
+                literal_id = f'{node_id}|{p}|{o}'
+                elements += [_node(literal_id, str(o), 'literal'), _edge(node_id, literal_id, local_name(p))]
+            elif p != RDF.type or o not in CLASS_TYPES:
+                elements += [self._resource_node(o), _edge(node_id, str(o), local_name(p))]
+        for s, p, o in self.graph.triples((None, None, term)):
+            if len(elements) >= 4 * limit:
+                break
+            if p != RDF.type:
+                elements += [self._resource_node(s), _edge(str(s), node_id, local_name(p))]
+        return elements
+
+    def expand(self, node_id, expanded=()):
+        """
+        Return the elements a node expansion adds to the summary and earlier expansions.
+        :param node_id: node id to expand
+        :param expanded: ids of nodes expanded earlier
+        :return: list of new cytoscape elements
+        """
+        shown = {e['data']['id'] for e in self.summary()}
+        for n in expanded:
+            if n != node_id:
+                shown.add(n)
+                shown.update(e['data']['id'] for e in self.neighborhood(n))
+        delta = []
+        # a node found by search may not be shown yet
+        term = self.terms.get(node_id)
+        if node_id not in shown and term is not None:
+            shown.add(node_id)
+            delta.append(self._resource_node(term))
+        for element in self.neighborhood(node_id):
+            element_id = element['data']['id']
+            if element_id not in shown:
+                shown.add(element_id)
+                delta.append(element)
+        return delta
+
+    def visible(self, expanded=()):
+        """
+        Return the summary plus the neighborhoods of the expanded nodes.
+        :param expanded: ids of expanded nodes, in expansion order
+        :return: list of cytoscape elements
+        """
+        elements = list(self.summary())
+        for i, node_id in enumerate(expanded):
+            elements += self.expand(node_id, expanded[:i])
+        return elements
+
+    def _resource_node(self, term):
+        if term in self.classes:
+            return _node(str(term), local_name(term), 'class', count=len(self.instances[term]),
+                         literals=self.literal_counts[term])
+        return _node(str(term), local_name(term), 'resource', literals=self.literal_counts[term])
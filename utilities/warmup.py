@@ -0,0 +1,97 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+
+
+class WarmUp:
+    """
+    Runs named warm-up tasks in a background thread pool and records startup timings:
+    the import time of the app, the time until every task finished and the time until
+    the first query was answered.
+    """
+
+    def __init__(self, started=None, max_workers=4):
+        """
+        :param started: time.perf_counter() when the app started importing, now when None
+        :param max_workers: number of warm-up threads
+        """
+        self.started = time.perf_counter() if started is None else started
+        self.max_workers = max_workers
+        self.imported = None
+        self.first_query = None
+        self.finished = None
+        self.tasks = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def mark_imported(self):
+        self.imported = time.perf_counter()
+        logger.info('app imported in %.2f s', self.imported - self.started)
+
+    def mark_query(self):
+        """
+        Record the time of the first answered query; later calls are ignored.
+        :return: None
+        """
+        if self.first_query is None:
+            with self._lock:
+                if self.first_query is None:
+                    self.first_query = time.perf_counter()
+                    logger.info('first query answered %.2f s after start', self.first_query - self.started)
+
+    def start(self, tasks):
+        """
+        Start running tasks in the background and return at once.
+        :param tasks: dictionary of task name to callable
+        :return: None
+        """
+        with self._lock:
+            for name in tasks:
+                self.tasks[name] = {'state': PENDING, 'seconds': None, 'error': None}
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='warm-up')
+        for name, task in tasks.items():
+            self._executor.submit(self._run, name, task)
+
+    @property
+    def ready(self):
+        with self._lock:
+            return all(t['state'] in (DONE, FAILED) for t in self.tasks.values())
+
+    def status(self):
+        """
+        Return the state of every task and the startup timings, in seconds since the start.
+        :return: dictionary
+        """
+        def since_start(t):
+            return None if t is None else round(t - self.started, 3)
+
+        with self._lock:
+            return {
+                'ready': all(t['state'] in (DONE, FAILED) for t in self.tasks.values()),
+                'import_seconds': since_start(self.imported),
+                'warm_up_seconds': since_start(self.finished),
+                'first_query_seconds': since_start(self.first_query),
+                'tasks': {name: dict(task) for name, task in self.tasks.items()},
+            }
+
+    def _run(self, name, task):
+        with self._lock:
+            self.tasks[name]['state'] = RUNNING
+        started = time.perf_counter()
+        try:
+            task()
+            state, error = DONE, None
+        except Exception as e:
+            logger.exception('warm-up task %s failed', name)
+            state, error = FAILED, f'{type(e).__name__}: {e}'
+        with self._lock:
+            self.tasks[name].update(state=state, seconds=round(time.perf_counter() - started, 3), error=error)
+            if all(t['state'] in (DONE, FAILED) for t in self.tasks.values()):
+                self.finished = time.perf_counter()
+                logger.info('warm-up finished %.2f s after start', self.finished - self.started)
@@ -0,0 +1,72 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# seconds between checks of the watched sources
+DEFAULT_INTERVAL = 2.0
+
+
+class OntologyWatcher:
+    """
+    Polls the sources of loaded ontologies in a background thread and applies their
+    changes to the registry, so requests never wait for a changed file to be reloaded.
+    Changes are detected by the registry's fingerprint: mtime and size, or a content hash.
+    """
+
+    def __init__(self, registry, endpoints, interval=DEFAULT_INTERVAL):
+        """
+        :param registry: GraphRegistry
+        :param endpoints: ontology endpoints to watch
+        :param interval: seconds between checks
+        """
+        self.registry = registry
+        self.endpoints = list(endpoints)
+        self.interval = interval
+        self.checks = 0
+        self.refreshes = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Start watching in a daemon thread; does nothing when already running.
+        :return: None
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name='ontology-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def check(self):
+        """
+        Refresh every watched ontology whose source changed.
+        :return: list of (endpoint, version, seconds) of the refreshed ontologies
+        """
+        refreshed = []
+        for endpoint in self.endpoints:
+            started = time.perf_counter()
+            try:
+                entries = self.registry.refresh(endpoint)
+            except Exception:
+                logger.exception('refreshing %s failed', endpoint)
+                continue
+            for entry in entries:
+                seconds = time.perf_counter() - started
+                logger.info('refreshed %s to version %s in %.3f s', endpoint, entry.version, seconds)
+                refreshed.append((endpoint, entry.version, seconds))
+        self.checks += 1
+        self.refreshes.extend(refreshed)
+        del self.refreshes[:-100]
+        return refreshed
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            self.check()
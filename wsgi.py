@@ -0,0 +1,15 @@
+import os
+
+# workers query one read-only, memory-mapped copy of each ontology instead of parsing their own
+os.environ.setdefault('SEMANTIC_WEB_STORE', 'Snapshot')
+
+from app import app, ontologies_df  # noqa: E402
+from utilities.ont import get_ontology_entry, prepare_shared_snapshots  # noqa: E402
+
+# load every ontology before gunicorn forks the workers (preload_app), so the snapshots
+# are written once, the files parsed in parallel, and the workers inherit them already mapped
+prepare_shared_snapshots(list(ontologies_df['Endpoint']))
+for endpoint in ontologies_df['Endpoint']:
+    get_ontology_entry(endpoint)
+
+server = app.server